@@ -136,6 +136,8 @@ class DoajTestCase(TestCase):
             'ENABLE_EMAIL': False,
             "FAKER_SEED": 1,
             "EVENT_SEND_FUNCTION": "portality.events.shortcircuit.send_event",
+            "SITE_STATISTICS_LOCAL_TIMEOUT": 0,
+            "ACCOUNT_CACHE_TIMEOUT": 0,
             'CMS_BUILD_ASSETS_ON_STARTUP': False
         })
 
@@ -157,6 +159,8 @@ class DoajTestCase(TestCase):
         dao.DomainObject.pull = dao_proxy(dao.DomainObject.pull)
         dao.DomainObject.pull_by_key = dao_proxy(dao.DomainObject.pull_by_key)
         dao.DomainObject.send_query = dao_proxy(dao.DomainObject.send_query)
+        dao.DomainObject.msearch = dao_proxy(dao.DomainObject.msearch)
+        dao.DomainObject.update_by_query = dao_proxy(dao.DomainObject.update_by_query)
         dao.DomainObject.remove_by_id = dao_proxy(dao.DomainObject.remove_by_id)
         dao.DomainObject.delete_by_query = dao_proxy(dao.DomainObject.delete_by_query)
         dao.DomainObject.iterate = dao_proxy(dao.DomainObject.iterate)
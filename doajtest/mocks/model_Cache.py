@@ -19,24 +19,33 @@ class InMemoryCache(object):
         pass
 
     @classmethod
-    def cache_sitemap(cls, filename):
+    def cache_sitemap(cls, filename, parts=None, generated=None, last_full=None):
         pass
 
     @classmethod
     def get_latest_sitemap(cls):
         pass
 
+    @classmethod
+    def get_sitemap_record(cls):
+        pass
+
     @classmethod
     def cache_public_data_dump(cls, article_container, article_filename, article_url, article_size,
-                                    journal_container, journal_filename, journal_url, journal_size):
+                                    journal_container, journal_filename, journal_url, journal_size,
+                                    article_incremental=None, journal_incremental=None):
         cls.__memory__["public_data_dump"] = {
             "article": {"container": article_container, "filename": article_filename, "url" : article_url, "size" : article_size},
             "journal": {"container": journal_container, "filename": journal_filename, "url" : journal_url, "size" : journal_size}
         }
+        if article_incremental is not None:
+            cls.__memory__["public_data_dump"]["article"].update(article_incremental)
+        if journal_incremental is not None:
+            cls.__memory__["public_data_dump"]["journal"].update(journal_incremental)
 
     @classmethod
     def get_public_data_dump(cls):
-        return cls.__memory__["public_data_dump"]
+        return cls.__memory__.get("public_data_dump")
 
     def is_stale(self):
         pass
@@ -21,15 +21,21 @@ class InMemoryCache(object):
         return cls.__memory__["csv"]
 
     @classmethod
-    def cache_sitemap(cls, filename):
+    def cache_sitemap(cls, filename, parts=None, generated=None, last_full=None):
         cls.__memory__["sitemap"] = {
             "filename" : filename
         }
+        if parts is not None:
+            cls.__memory__["sitemap"].update({"parts": parts, "generated": generated, "last_full": last_full})
 
     @classmethod
     def get_latest_sitemap(cls):
         return cls.__memory__["sitemap"]
 
+    @classmethod
+    def get_sitemap_record(cls):
+        return cls.__memory__.get("sitemap")
+
     @classmethod
     def cache_public_data_dump(cls, article_url, article_size, journal_url, journal_size):
         cls.__memory__["public_data_dump"] = {
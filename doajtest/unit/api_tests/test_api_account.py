@@ -1,6 +1,7 @@
 from flask import Response
 
-from doajtest.helpers import DoajTestCase, with_es
+from doajtest.helpers import DoajTestCase, with_es, patch_config
+from portality import dao
 from portality import models
 from portality.core import load_account_for_login_manager
 from portality.decorators import api_key_required, api_key_optional
@@ -109,3 +110,49 @@ class TestAPIClient(DoajTestCase):
             # but if you do specify a key it needs to exist
             response_denied2 = t_client.get('/helloopt?api_key=nonexistent_key')
             assert response_denied2.status_code == 401
+
+    def test_04_account_cache(self):
+        """test that accounts used for authentication are cached, and dropped from the cache when they change"""
+        original = patch_config(self.app_test, {"ACCOUNT_CACHE_TIMEOUT": 30})
+        models.Account.uncache()
+        try:
+            a1 = models.Account.make_account(email="a1@example.com", username="a1_user", name="a1_name",
+                                             roles=["user", "api"], associated_journal_ids=[])
+            a1_key = a1.api_key
+            a1.save(blocking=True)
+
+            assert models.Account.pull_by_api_key(a1_key).name == "a1_name"
+            assert load_account_for_login_manager("a1_user").name == "a1_name"
+
+            # a change made without going through the account is not seen while the account is cached
+            changed = models.Account.pull("a1_user")
+            changed.set_name("changed_name")
+            dao.DomainObject.save(changed, blocking=True)
+            assert models.Account.pull_by_api_key(a1_key).name == "a1_name"
+            assert load_account_for_login_manager("a1_user").name == "a1_name"
+
+            # the cached account is a copy, so changing it doesn't change the cache
+            load_account_for_login_manager("a1_user").set_name("other_name")
+            assert load_account_for_login_manager("a1_user").name == "a1_name"
+
+            # but saving the account drops it from the cache
+            changed.save(blocking=True)
+            assert models.Account.pull_by_api_key(a1_key).name == "changed_name"
+            assert load_account_for_login_manager("a1_user").name == "changed_name"
+
+            # a new key replaces the old one straight away
+            new_key = changed.generate_api_key()
+            changed.save(blocking=True)
+            assert models.Account.pull_by_api_key(a1_key) is None
+            assert models.Account.pull_by_api_key(new_key).id == "a1_user"
+
+            # and so does removing the api role
+            changed.remove_role("api")
+            changed.save(blocking=True)
+            assert models.Account.pull_by_api_key(new_key) is None
+            with self.app_test.test_client() as t_client:
+                response_denied = t_client.get('/hello?api_key=' + new_key)
+                assert response_denied.status_code == 401
+        finally:
+            models.Account.uncache()
+            patch_config(self.app_test, original)
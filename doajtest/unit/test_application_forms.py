@@ -62,3 +62,24 @@ class TestEditableNote(DoajTestCase):
 
             ele = soup.select_one('textarea#notes-1-note')
             assert ele.has_attr('disabled')
+
+
+def test_compiled_contexts_are_shared():
+    fc1 = JournalFormFactory.context("admin")
+    fc2 = JournalFormFactory.context("admin")
+
+    # the expanded definition, form class and ui settings are built once per context name
+    assert fc1._definition is fc2._definition
+    assert fc1.wtform_class() is fc2.wtform_class()
+    assert fc1.ui_settings is fc2.ui_settings
+
+    # but each context has its own form
+    assert fc1.wtform_inst is not fc2.wtform_inst
+    fc1.processor(source=models.Journal(**JOURNAL_SOURCE))
+    assert fc1.wtform_inst.title.data == JOURNAL_SOURCE["bibjson"]["title"]
+    assert not fc2.wtform_inst.title.data
+
+    # and other contexts are compiled separately
+    fc3 = JournalFormFactory.context("editor")
+    assert fc3.wtform_class() is not fc1.wtform_class()
+    assert JournalFormFactory.context("no_such_context") is None
@@ -1,7 +1,8 @@
+import pickle
 import time
 
 
-from doajtest.helpers import DoajTestCase
+from doajtest.helpers import DoajTestCase, patch_config
 from doajtest import fixtures
 from doajtest.unit_tester import bgtask_tester
 
@@ -278,5 +279,61 @@ class TestArticleCleanupSync(DoajTestCase):
         best = task._get_best_journal([j3, j4])
         assert best.id == j3.id
 
+    def test_06_journal_register(self):
+        [j_s, k_s] = fixtures.JournalFixtureFactory.make_many_journal_sources(2, in_doaj=False)
+        j_s["admin"]["in_doaj"] = True
+        j = models.Journal(**j_s)
+        j.save()
+        k = models.Journal(**k_s)
+        k.save(blocking=True)
+
+        register = models.JournalRegister.build()
+        assert len(register) == 2
+
+        jbj = j.bibjson()
+        found = register.best_by_issn(jbj.issns())
+        assert found.id == j.id
+        assert found.bibjson().title == jbj.title
+        assert found.is_in_doaj() is True
+
+        # one ISSN from each journal gives the one in DOAJ
+        assert register.best_by_issn([jbj.eissn, k.bibjson().pissn]).id == j.id
+        assert register.best_by_issn(["xxxx-xxxx"]) is None
+
+        # the register can be sent to a worker process
+        copied = pickle.loads(pickle.dumps(register))
+        assert copied.best_by_issn(k.bibjson().issns()).id == k.id
+
+    def test_07_small_bulk_batches(self):
+        source = fixtures.JournalFixtureFactory.make_journal_source(in_doaj=True)
+        j = models.Journal(**source)
+        j.save(blocking=True)
+        eissn = j.bibjson().eissn
+        pissn = j.bibjson().pissn
+
+        articles = []
+        for issns in [(eissn, pissn), (eissn, pissn), ("xxxx-xxxx", "yyyy-yyyy"), ("xxxx-xxxx", "yyyy-yyyy")]:
+            source = fixtures.ArticleFixtureFactory.make_article_source(eissn=issns[0], pissn=issns[1],
+                                                                        with_journal_info=False, with_id=False)
+            a = models.Article(**source)
+            a.save()
+            articles.append(a)
+        models.Article.blockall([(a.id, a.last_updated) for a in articles])
+
+        # every write and delete goes in a request of its own
+        originals = patch_config(self.app_test, {"TASKS_ARTICLE_CLEANUP_SYNC_BULK_BYTES": 1})
+        try:
+            job = article_cleanup_sync.ArticleCleanupSyncBackgroundTask.prepare("testuser", write=True)
+            task = article_cleanup_sync.ArticleCleanupSyncBackgroundTask(job)
+            background.BackgroundApi.execute(task)
+        finally:
+            patch_config(self.app_test, originals)
+
+        models.Article.blockalldeleted([a.id for a in articles[2:]])
+        assert models.Article.count() == 2
+        for a in articles[:2]:
+            assert models.Article.pull(a.id).bibjson().journal_title == j.bibjson().title
+        assert any(["2 articles updated, 0 remain unchanged, and 2 deleted" in m["message"] for m in job.audit])
+
     def test_prepare__queue_id(self):
         bgtask_tester.test_queue_id_assigned(article_cleanup_sync.ArticleCleanupSyncBackgroundTask)
@@ -37,12 +37,14 @@ class TestBLLArticleBatchCreateArticle(DoajTestCase):
         self._get_duplicate = self.svc.get_duplicate
         self._issn_ownership_status = self.svc.issn_ownership_status
         self._get_journal = Article.get_journal
+        self._bulk = Article.bulk
 
     def tearDown(self):
         self.svc.is_legitimate_owner = self._is_legitimate_owner
         self.svc.get_duplicate = self._get_duplicate
         self.svc.issn_ownership_status = self._issn_ownership_status
         Article.get_journal = self._get_journal
+        Article.bulk = self._bulk
         super(TestBLLArticleBatchCreateArticle, self).tearDown()
 
     @parameterized.expand(load_cases)
@@ -269,3 +271,60 @@ class TestBLLArticleBatchCreateArticle(DoajTestCase):
             else:
                 # there's nothing in the article index
                 assert len(Article.all()) == 0, len(Article.all())
+
+    def _make_batch(self, n):
+        articles = []
+        journal_specs = []
+        for i in range(n):
+            pissn = "{x}{x}{x}{x}-{x}{x}{x}{x}".format(x=i)
+            eissn = "{x}{x}{x}{x}-{x}{x}{x}X".format(x=i)
+            source = ArticleFixtureFactory.make_article_source(eissn=eissn, pissn=pissn,
+                                                               doi="10.123/abc/" + str(i), fulltext=False)
+            del source["bibjson"]["journal"]
+            article = Article(**source)
+            article.set_id()
+            articles.append(article)
+            journal_specs.append({"title": str(i), "pissn": pissn, "eissn": eissn})
+
+        self.svc.is_legitimate_owner = BLLArticleMockFactory.is_legitimate_owner(legit=True)
+        self.svc.get_duplicate = BLLArticleMockFactory.get_duplicate(return_none=True)
+        self.svc.issn_ownership_status = BLLArticleMockFactory.issn_ownership_status([], [], [], [])
+        Article.get_journal = ModelArticleMockFactory.get_journal(journal_specs, in_doaj=True)
+        return articles
+
+    def test_02_batch_create_article_bulk(self):
+        account = Account(**AccountFixtureFactory.make_publisher_source())
+        articles = self._make_batch(3)
+
+        report = self.svc.batch_create_articles(articles, account, add_journal_info=True, bulk=True)
+        assert report["success"] == 3
+        assert report["fail"] == 0
+        assert report["new"] == 3
+
+        # the final bulk request waits for a refresh, so everything is already searchable
+        all_articles = Article.all()
+        assert len(all_articles) == 3
+        for article in all_articles:
+            assert article.created_date is not None
+            assert article.data.get("index", {}).get("doi") is not None
+
+    def test_03_batch_create_article_bulk_item_failure(self):
+        account = Account(**AccountFixtureFactory.make_publisher_source())
+        articles = self._make_batch(3)
+        failed_id = articles[1].id
+
+        def bulk_mock(documents, **kwargs):
+            return {"errors": True, "items": [
+                {"index": {"_id": d["id"], "status": 400, "error": {"type": "mapper_parsing_exception"}}}
+                if d["id"] == failed_id else {"index": {"_id": d["id"], "status": 201}}
+                for d in documents
+            ]}
+        Article.bulk = bulk_mock
+
+        with self.assertRaises(exceptions.IngestException) as cm:
+            self.svc.batch_create_articles(articles, account, add_journal_info=True, bulk=True)
+
+        report = cm.exception.result
+        assert report["success"] == 2
+        assert report["fail"] == 1
+        assert report["new"] == 2
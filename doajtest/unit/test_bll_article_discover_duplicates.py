@@ -192,3 +192,56 @@ class TestBLLArticleDiscoverDuplicates(DoajTestCase):
             else:
                 if possible_articles is not None:
                     assert "fulltext" not in possible_articles
+
+    def test_02_discover_duplicates_batch(self):
+        aids_block = []
+        article_ids = []
+        for ident in IDENTS[:3]:
+            source = ArticleFixtureFactory.make_article_source(eissn="1234-5678", pissn="9876-5432", doi=ident["doi"], fulltext="http:" + ident["fulltext"])
+            article = Article(**source)
+            article.set_id()
+            article.save()
+            article_ids.append(article.id)
+            aids_block.append((article.id, article.last_updated))
+        Article.blockall(aids_block)
+
+        # one matching on doi, one matching on fulltext, one with no matches and one with no identifiers at all
+        by_doi = Article(**ArticleFixtureFactory.make_article_source(doi=IDENTS[0]["doi"], fulltext="http://example.com/new/1"))
+        by_fulltext = Article(**ArticleFixtureFactory.make_article_source(doi="10.1234/new/2", fulltext="https:" + IDENTS[1]["fulltext"]))
+        no_match = Article(**ArticleFixtureFactory.make_article_source(doi="10.1234/new/3", fulltext="http://example.com/new/3"))
+        no_ids = Article(**ArticleFixtureFactory.make_article_source())
+        no_ids.bibjson().remove_identifiers("doi")
+        no_ids.bibjson().remove_urls("fulltext")
+
+        svc = DOAJ.articleService()
+        possible = svc.discover_duplicates_batch([by_doi, by_fulltext, no_match, no_ids])
+
+        assert len(possible) == 4
+        assert [a.id for a in possible[0]["doi"]] == [article_ids[0]]
+        assert "fulltext" not in possible[0]
+        assert [a.id for a in possible[1]["fulltext"]] == [article_ids[1]]
+        assert "doi" not in possible[1]
+        assert possible[2] == {}
+        assert possible[3] is None
+
+        # the batch result gives the same answer as the single article duplicate lookup
+        assert svc.get_duplicate(by_doi, possible_duplicates=possible[0]).id == svc.get_duplicate(by_doi).id
+
+    def test_03_duplicates_batch_per_identifier(self):
+        # many articles share the first doi, and only one has the second
+        blocks = []
+        for i in range(5):
+            a = Article(**ArticleFixtureFactory.make_article_source(doi=IDENTS[0]["doi"], fulltext="http://example.com/many/" + str(i)))
+            a.set_id()
+            a.save()
+            blocks.append((a.id, a.last_updated))
+        single = Article(**ArticleFixtureFactory.make_article_source(doi=IDENTS[1]["doi"], fulltext="http://example.com/single"))
+        single.set_id()
+        single.save()
+        blocks.append((single.id, single.last_updated))
+        Article.blockall(blocks)
+
+        # each identifier gets its own quota of matches
+        doi_matches, _ = Article.duplicates_batch(dois=[IDENTS[0]["doi"], IDENTS[1]["doi"]], size=2)
+        assert len(doi_matches[IDENTS[0]["doi"]]) == 2
+        assert [a.id for a in doi_matches[IDENTS[1]["doi"]]] == [single.id]
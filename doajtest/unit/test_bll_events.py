@@ -67,4 +67,55 @@ class TestBLLEvents(DoajTestCase):
 
         # Use the captured info stream to get email send logs
         info_stream_contents = self.info_stream.getvalue()
-        assert "CONSUME ERROR" in info_stream_contents
\ No newline at end of file
+        assert "CONSUME ERROR" in info_stream_contents
+
+    def test_04_routing(self):
+        class RoutedConsumer(MockConsumer):
+            ID = "mock:routed"
+            EVENTS = ["test:other"]
+            CONSUMES = []
+
+            @classmethod
+            def consumes(cls, event):
+                cls.CONSUMES.append(event)
+                return True
+
+        EventsService.EVENT_CONSUMERS = [MockConsumer, RoutedConsumer]
+
+        # the routed consumer is only offered the events it declares, the other is offered everything
+        self.svc.trigger(models.Event("test:event", "testuser"))
+        assert len(RoutedConsumer.CONSUMES) == 0
+        assert len(MockConsumer.CONSUMES) == 1
+
+        self.svc.trigger(models.Event("test:other", "testuser"))
+        assert [e.id for e in RoutedConsumer.CONSUMES] == ["test:other"]
+        assert len(MockConsumer.CONSUMES) == 2
+
+        routes = EventsService.routes()
+        assert routes["test:other"] == [MockConsumer, RoutedConsumer]
+        assert routes[None] == [MockConsumer]
+
+        timings = EventsService.consumer_timings()
+        assert timings[RoutedConsumer.ID]["count"] >= 1
+        assert timings[MockConsumer.ID]["count"] >= 2
+
+    def test_05_parallel(self):
+        class SecondConsumer(MockConsumer):
+            ID = "mock:second"
+            CONSUMES = []
+            CONSUMED = []
+
+        EventsService.EVENT_CONSUMERS = [MockConsumer, SecondConsumer]
+        self.app_test.config["EVENT_CONSUMER_THREADS"] = 2
+        try:
+            self.svc.trigger(models.Event("test:event", "testuser"))
+        finally:
+            self.app_test.config["EVENT_CONSUMER_THREADS"] = 1
+
+        assert len(MockConsumer.CONSUMED) == 1
+        assert len(SecondConsumer.CONSUMED) == 1
+
+    def test_06_declared_events(self):
+        # all the real consumers declare the events they handle
+        for consumer in self.event_consumers:
+            assert consumer.EVENTS is not None and len(consumer.EVENTS) > 0, consumer.ID
@@ -0,0 +1,61 @@
+from doajtest.helpers import DoajTestCase
+from portality import models
+from portality.bll import DOAJ
+from portality.lib import dates
+
+
+class TestBLLMarkAllAsSeen(DoajTestCase):
+
+    def setUp(self):
+        super(TestBLLMarkAllAsSeen, self).setUp()
+
+    def tearDown(self):
+        super(TestBLLMarkAllAsSeen, self).tearDown()
+
+    def make_notification(self, who, seen=False, created=None):
+        n = models.Notification()
+        n.who = who
+        n.long = "my message"
+        n.short = "short note"
+        n.action = "/test"
+        n.classification = "test_class"
+        n.created_by = "test:notify"
+        if created is not None:
+            n.set_created(created)
+        if seen:
+            n.set_seen()
+        n.save()
+        return n
+
+    def test_01_account(self):
+        acc = models.Account()
+        acc.set_id("testuser")
+
+        seen = self.make_notification("testuser", seen=True)
+        unseen = [self.make_notification("testuser") for i in range(5)]
+        other = self.make_notification("testuser2")
+        models.Notification.blockall([(n.id, n.last_updated) for n in unseen + [seen, other]])
+
+        svc = DOAJ.notificationsService()
+        assert svc.mark_all_as_seen(acc, background=False) == 5
+
+        for n in unseen:
+            assert models.Notification.pull(n.id).is_seen()
+        assert models.Notification.pull(seen.id).seen_date == seen.seen_date
+        assert not models.Notification.pull(other.id).is_seen()
+
+        # there is nothing left to do a second time
+        assert svc.mark_all_as_seen(acc, background=False) == 0
+
+    def test_02_everyone_until(self):
+        old = [self.make_notification(who, created=dates.format(dates.before_now(86400 * 10)))
+               for who in ["testuser", "testuser2"]]
+        new = self.make_notification("testuser")
+        models.Notification.blockall([(n.id, n.last_updated) for n in old + [new]])
+
+        svc = DOAJ.notificationsService()
+        assert svc.mark_all_as_seen(until=dates.before_now(86400 * 5)) == 2
+
+        for n in old:
+            assert models.Notification.pull(n.id).is_seen()
+        assert not models.Notification.pull(new.id).is_seen()
@@ -1,3 +1,4 @@
+import time
 from io import StringIO
 
 from combinatrix.testintegration import load_parameter_sets
@@ -5,7 +6,7 @@ from lxml import etree
 from parameterized import parameterized
 
 from doajtest import helpers
-from doajtest.fixtures import JournalFixtureFactory
+from doajtest.fixtures import JournalFixtureFactory, ArticleFixtureFactory
 from doajtest.helpers import DoajTestCase, patch_config
 from doajtest.mocks.models_Cache import ModelCacheMockFactory
 from doajtest.mocks.store import StoreMockFactory
@@ -191,3 +192,79 @@ class TestBLLSitemap(DoajTestCase):
 
         # Tear down
         patch_config(app, original_configs)
+
+    def test_sitemap_index(self):
+        original_configs = patch_config(app, {"SITEMAP_MAX_URLS": 4})
+
+        journals = []
+        for s in JournalFixtureFactory.make_many_journal_sources(count=10, in_doaj=True):
+            j = models.Journal(**s)
+            j.save()
+            journals.append(j)
+        models.Journal.blockall([(j.id, j.last_updated) for j in journals])
+
+        url, action_register = self.svc.sitemap(False)
+
+        NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+        filenames = self.localStore.list(self.container_id)
+        index_file = [fn for fn in filenames if fn.startswith("sitemap__")]
+        assert len(index_file) == 1
+
+        # 10 ToCs plus the 4 working static routes, in files of at most 4 urls
+        parts = models.cache.Cache.get_latest_sitemap().get("parts")
+        assert len(parts) == 4
+        assert sum([p["count"] for p in parts]) == 14
+
+        tree = etree.parse(self.localStore.get(self.container_id, index_file[0], encoding="utf-8"))
+        assert tree.getroot().tag == NS + "sitemapindex"
+        locs = [e.find(NS + "loc").text for e in tree.getroot().getchildren()]
+        # the parts are served from the site root, so that they may list urls anywhere on the site
+        assert locs == [app.config.get("BASE_URL").rstrip("/") + "/" + p["filename"] for p in parts]
+
+        tocs = 0
+        for p in parts:
+            assert p["filename"] in filenames
+            part = etree.parse(self.localStore.get(self.container_id, p["filename"], encoding="utf-8"))
+            urls = part.getroot().getchildren()
+            assert 0 < len(urls) <= 4
+            tocs += len([u for u in urls if "/toc/" in u.find(NS + "loc").text])
+        assert tocs == 10
+
+        patch_config(app, original_configs)
+
+    def test_sitemap_incremental_articles(self):
+        original_configs = patch_config(app, {"SITEMAP_MAX_URLS": 2})
+        models.cache.Cache.__memory__.pop("sitemap", None)
+
+        articles = []
+        for i, created in enumerate(["2020-01-05T00:00:00Z", "2020-01-06T00:00:00Z", "2020-02-01T00:00:00Z"]):
+            source = ArticleFixtureFactory.make_article_source(eissn="{x}000-0000".format(x=i), pissn="0000-{x}000".format(x=i),
+                                                               with_id=False, in_doaj=True)
+            a = models.Article(**source)
+            a.set_created(created)
+            a.save()
+            articles.append(a)
+        models.Article.blockall([(a.id, a.last_updated) for a in articles])
+
+        self.svc.sitemap(True, include_articles=True, incremental=True)
+        first = models.cache.Cache.get_latest_sitemap()
+        months = sorted([p["month"] for p in first["parts"] if p["section"] == "article"])
+        assert months == ["2020-01", "2020-02"]
+
+        # withdraw the February article, so only that month should be regenerated
+        time.sleep(1)
+        articles[2].set_in_doaj(False)
+        articles[2].save(blocking=True)
+
+        self.svc.sitemap(True, include_articles=True, incremental=True)
+        second = models.cache.Cache.get_latest_sitemap()
+        article_parts = [p for p in second["parts"] if p["section"] == "article"]
+        assert [p["month"] for p in article_parts] == ["2020-01"]
+        assert article_parts[0]["filename"] in [p["filename"] for p in first["parts"]]
+        assert second["last_full"] == first["last_full"]
+
+        filenames = self.localStore.list(self.container_id)
+        for p in second["parts"]:
+            assert p["filename"] in filenames
+
+        patch_config(app, original_configs)
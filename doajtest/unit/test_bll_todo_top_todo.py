@@ -191,4 +191,25 @@ class TestBLLTopTodo(DoajTestCase):
         if additional_fn is not None:
             additional_fn(ap)
         ap.save()
-        app_registry.append(ap)
\ No newline at end of file
+        app_registry.append(ap)
+
+class TestBLLGroupStats(DoajTestCase):
+
+    def test_group_stats(self):
+        eg = EditorGroupFixtureFactory.setup_editor_group_with_editors()
+        eg.add_associate("no_such_account")
+        eg.save(blocking=True)
+
+        ap = models.Application(**ApplicationFixtureFactory.make_application_source())
+        ap.set_editor_group(eg.name)
+        ap.set_editor("associate")
+        ap.set_application_status(constants.APPLICATION_STATUS_IN_PROGRESS)
+        ap.save(blocking=True)
+
+        stats = DOAJ.todoService().group_stats(eg.id)
+
+        assert stats["editors"]["eddie"]["email"] == "eddie@example.com"
+        assert stats["editors"]["associate_2"]["email"] == "associate_2@example.com"
+        assert stats["editors"]["no_such_account"]["email"] is None
+        assert stats["by_editor"]["associate"]["applications"] + stats["by_editor"]["associate"]["update_requests"] == 1
+        assert stats["total"]["applications"] + stats["total"]["update_requests"] == 1
@@ -182,3 +182,22 @@ class TestArticleMatch(DoajTestCase):
         assert a_match_types.count('fulltext') == 2, "received: {}, expected 2".format(a_match_types.count('fulltext'))
 
         shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def test_03_duplicated_identifiers(self):
+        """ Check the duplicated DOIs are all found, however small the aggregation partitions """
+        for doi in ['10.1234/one', '10.1234/one', '10.1234/two', '10.1234/two', '10.1234/two', '10.1234/three']:
+            src = ArticleFixtureFactory.make_article_source(with_id=False, in_doaj=True, with_journal_info=True)
+            del src['bibjson']['identifier']
+            del src['bibjson']['link']
+            article = models.Article(**src)
+            article.bibjson().add_identifier('doi', doi)
+            article.save(blocking=True)
+
+        expected = ['10.1234/one', '10.1234/two']
+        assert sorted(models.Article.duplicated_identifiers('doi')) == expected
+        assert sorted(models.Article.duplicated_identifiers('doi', partition_size=1)) == expected
+        assert list(models.Article.duplicated_identifiers('fulltext')) == []
+
+        members = list(models.Article.iterate_by_identifiers('doi', ['10.1234/two'], fields=['id', 'index.doi']))
+        assert len(members) == 3
+        assert set([m.data['index']['doi'] for m in members]) == {'10.1234/two'}
@@ -0,0 +1,118 @@
+import shutil
+import time
+
+from doajtest.helpers import DoajTestCase, patch_config
+from doajtest.mocks.events_Consumer import MockConsumer
+from portality import models
+from portality.bll.services.events import EventsService
+from portality.events import outbox
+from portality.lib import paths
+
+RECEIVED = {"reliable": [], "flaky": []}
+FLAKY_FAILURES = [0]
+
+
+def reliable_target(events):
+    RECEIVED["reliable"] += events
+
+
+def flaky_target(events):
+    if FLAKY_FAILURES[0] > 0:
+        FLAKY_FAILURES[0] -= 1
+        raise Exception("Target unavailable")
+    RECEIVED["flaky"] += events
+
+
+class TestEventOutbox(DoajTestCase):
+
+    def setUp(self):
+        super(TestEventOutbox, self).setUp()
+        self.tmp_dir = paths.create_tmp_dir(is_auto_mkdir=True)
+        self.org_config = patch_config(self.app_test, {
+            "EVENT_OUTBOX_PATH": str(self.tmp_dir / "outbox.sqlite3"),
+            "EVENT_OUTBOX_TARGETS": [
+                "doajtest.unit.test_event_outbox.reliable_target",
+                "doajtest.unit.test_event_outbox.flaky_target"
+            ],
+            "EVENT_OUTBOX_BACK_OFF": 0,
+            "EVENT_OUTBOX_MAX_ATTEMPTS": 3
+        })
+        RECEIVED["reliable"] = []
+        RECEIVED["flaky"] = []
+        FLAKY_FAILURES[0] = 0
+
+    def tearDown(self):
+        outbox.OutboxWorker.stop()
+        patch_config(self.app_test, self.org_config)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        super(TestEventOutbox, self).tearDown()
+
+    def test_01_drain_with_retries(self):
+        box = outbox.Outbox()
+        for i in range(3):
+            box.append(models.Event("test:event", "testuser", context={"n": i}))
+        assert box.counts() == (3, 0)
+
+        # the flaky target fails, so the events stay in the outbox
+        FLAKY_FAILURES[0] = 1
+        assert outbox.drain(box) == 0
+        assert len(RECEIVED["reliable"]) == 3
+        assert len(RECEIVED["flaky"]) == 0
+        assert box.counts() == (3, 0)
+
+        # on the retry only the target which failed gets them
+        assert outbox.drain(box) == 3
+        assert len(RECEIVED["reliable"]) == 3
+        assert [e.context.get("n") for e in RECEIVED["flaky"]] == [0, 1, 2]
+        assert box.counts() == (0, 0)
+
+    def test_02_dead_events(self):
+        box = outbox.Outbox()
+        box.append(models.Event("test:event", "testuser"))
+
+        FLAKY_FAILURES[0] = 10
+        outbox.drain(box)
+        outbox.drain(box)
+        outbox.drain(box)
+        assert box.counts() == (0, 1)
+
+        # dead events are not tried again
+        assert outbox.drain(box) == 0
+        assert len(RECEIVED["reliable"]) == 1
+
+    def test_03_send_event(self):
+        event_consumers = EventsService.EVENT_CONSUMERS
+        EventsService.EVENT_CONSUMERS = [MockConsumer]
+        MockConsumer.reset()
+        org = patch_config(self.app_test, {
+            "EVENT_OUTBOX_TARGETS": ["portality.events.shortcircuit.send_events"]
+        })
+        try:
+            outbox.send_event(models.Event("test:event", "testuser"))
+
+            # the worker delivers the event in the background
+            for _ in range(50):
+                if len(MockConsumer.CONSUMED) > 0:
+                    break
+                time.sleep(0.1)
+            assert len(MockConsumer.CONSUMED) == 1
+            assert MockConsumer.CONSUMED[0].id == "test:event"
+        finally:
+            # stop the worker while it is still pointed at this test's outbox
+            outbox.OutboxWorker.stop()
+            patch_config(self.app_test, org)
+            EventsService.EVENT_CONSUMERS = event_consumers
+            MockConsumer.reset()
+
+    def test_04_shared_outbox(self):
+        assert outbox.get_outbox() is outbox.get_outbox()
+
+        # a new outbox path gets a new outbox, and its directory is created on first use
+        org = patch_config(self.app_test, {"EVENT_OUTBOX_PATH": str(self.tmp_dir / "nested" / "outbox.sqlite3")})
+        try:
+            box = outbox.get_outbox()
+            assert box.path == str(self.tmp_dir / "nested" / "outbox.sqlite3")
+            box.append(models.Event("test:event", "testuser"))
+            assert box.counts() == (1, 0)
+        finally:
+            patch_config(self.app_test, org)
@@ -116,3 +116,48 @@ class TestLock(DoajTestCase):
 
         assert dates.parse(l.expires) > after
 
+
+    def test_05_batch_lock_takeover_and_rollback(self):
+        ids = []
+        for i in range(3):
+            j = models.Journal(**JournalFixtureFactory.make_journal_source())
+            j.save()
+            ids.append(j.id)
+
+        # an expired lock held by someone else, and an out of date duplicate of it
+        old = lock.lock("journal", ids[0], "otheruser", timeout=-10)
+        dup = models.Lock(**deepcopy(old.data))
+        dup.set_id(dup.makeid())
+        dup.save(blocking=True)
+        time.sleep(1)
+
+        ls = lock.batch_lock("journal", ids, "testuser")
+        assert [l.about for l in ls] == ids
+        assert ls[0].id in [old.id, dup.id]
+        assert ls[0].username == "testuser"
+
+        time.sleep(2)
+        for id in ids:
+            assert lock.has_lock("journal", id, "testuser") is True
+        assert models.Lock.count() == 3
+
+        report = lock.batch_unlock("journal", ids, "testuser")
+        assert report["success"] == ids
+        time.sleep(2)
+
+        # a record already holding the id of one of the new locks makes the batch fail, and the other locks are
+        # removed again
+        blocker = models.Lock()
+        blocker.set_id(lock._batch_lock_id("journal", ids[1]))
+        blocker.set_about("something else")
+        blocker.set_type("suggestion")
+        blocker.set_username("otheruser")
+        blocker.expires_in(1200)
+        blocker.save(blocking=True)
+
+        with self.assertRaises(lock.Locked):
+            lock.batch_lock("journal", ids, "testuser")
+
+        time.sleep(2)
+        for id in ids:
+            assert lock.has_lock("journal", id, "testuser") is False
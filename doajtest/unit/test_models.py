@@ -3,12 +3,15 @@ import time
 
 from doajtest.fixtures import ApplicationFixtureFactory, JournalFixtureFactory, ArticleFixtureFactory, \
     BibJSONFixtureFactory, ProvenanceFixtureFactory, BackgroundFixtureFactory, AccountFixtureFactory
-from doajtest.helpers import DoajTestCase, patch_history_dir
+from doajtest.helpers import DoajTestCase, patch_history_dir, patch_config
 from portality import constants
+from portality import dao
 from portality import models
 from portality.constants import BgjobOutcomeStatus
+from portality.core import app
 from portality.lib import dataobj
 from portality.lib import seamless
+from portality.lib.coerce import COERCE_MAP
 from portality.lib.dates import FMT_DATETIME_STD, DEFAULT_TIMESTAMP_VAL, FMT_DATE_STD
 from portality.models import shared_structs
 from portality.models.v1.bibjson import GenericBibJSON
@@ -1642,6 +1645,248 @@ class TestModels(DoajTestCase):
         a2 = models.Application(**asource)
         assert a2.bibjson().language.pop() == 'interpretive dance'
 
+    def test_39_lcc_index(self):
+        tree = {"name": "LCC", "children": [
+            {"name": "Science", "code": "Q", "children": [
+                {"name": "Mathematics", "code": "QA1-939", "children": [
+                    {"name": "Algebra", "code": "QA150-272.5"}
+                ]},
+                {"name": "Chemistry", "code": "QD1-999"}
+            ]},
+            {"name": "Medicine", "code": "R", "children": [
+                {"name": "Chemistry", "code": "RS1-441"}
+            ]}
+        ]}
+        lcc = models.LCC(**tree)
+
+        assert lcc.term_path("Algebra") == ["Science", "Mathematics", "Algebra"]
+        assert lcc.pathify("Algebra") == "Science: Mathematics: Algebra"
+        # where a term appears twice, the first one in the tree is used
+        assert lcc.pathify("Chemistry") == "Science: Chemistry"
+        assert lcc.term_path("Astronomy") is None
+        assert lcc.pathify("Astronomy") is None
+
+        assert lcc.expand_codes("QA150-272.5") == ["Q", "QA1-939", "QA150-272.5"]
+        assert lcc.expand_codes("RS1-441") == ["R", "RS1-441"]
+        assert lcc.expand_codes("QB1-991") == []
+        assert lcc.name_for_code("RS1-441") == "Chemistry"
+
+        # results are copies, so callers can't damage the index
+        lcc.term_path("Algebra").append("Linear")
+        assert lcc.term_path("Algebra") == ["Science", "Mathematics", "Algebra"]
+
+        # the index is rebuilt after the tree changes and is saved
+        lcc.data["children"].append({"name": "Astronomy", "code": "QB1-991"})
+        lcc.save(blocking=True)
+        assert lcc.pathify("Astronomy") == "Astronomy"
+        assert lcc.expand_codes("QB1-991") == ["QB1-991"]
+
+    def test_40_article_stats_for_journals(self):
+        articles = []
+        for i, issn in enumerate(["1111-1111", "1111-1111", "2222-2222"]):
+            article = models.Article(
+                **ArticleFixtureFactory.make_article_source(eissn=issn, pissn=issn, with_id=False, in_doaj=True)
+            )
+            article.set_created("2019-01-0" + str(i + 1) + "T00:00:00Z")
+            articles.append(article)
+        article = models.Article(
+            **ArticleFixtureFactory.make_article_source(eissn="1111-1111", pissn="1111-1111", with_id=False, in_doaj=False)
+        )
+        article.set_created("2019-01-09T00:00:00Z")
+        articles.append(article)
+
+        [a.save() for a in articles]
+        models.Article.blockall([(a.id, a.last_updated) for a in articles])
+
+        journals = []
+        for issn in ["1111-1111", "2222-2222", "3333-3333"]:
+            journal = models.Journal()
+            journal.set_id()
+            bj = journal.bibjson()
+            bj.add_identifier(bj.P_ISSN, issn)
+            journals.append(journal)
+
+        stats = models.Journal.article_stats_for_journals(journals)
+        assert stats[journals[0].id] == {"total": 2, "latest": "2019-01-02T00:00:00Z"}
+        assert stats[journals[1].id] == {"total": 1, "latest": "2019-01-03T00:00:00Z"}
+        assert stats[journals[2].id] == {"total": 0, "latest": None}
+
+        # and they agree with the single journal stats
+        for j in journals:
+            assert stats[j.id] == j.article_stats()
+
+    def test_41_bulk_writer(self):
+        articles = [models.Article(**ArticleFixtureFactory.make_article_source(with_id=False)) for _ in range(5)]
+        journal = models.Journal(**JournalFixtureFactory.make_journal_source(in_doaj=True))
+
+        with models.Article.bulk_writer(max_docs=3) as writer:
+            for a in articles:
+                a.save()
+            journal.save(snapshot=False, sync_owner=False)
+
+            # the first 3 saves were sent when the buffer filled, the rest are still waiting
+            assert writer.saved == 3
+            assert articles[0].id is not None and articles[0].last_updated is not None
+
+        assert writer.saved == 6
+        assert writer.failures == {}
+        assert dao.BulkWriter.active() is None
+
+        models.Article.blockall([(a.id, a.last_updated) for a in articles])
+        models.Journal.block(journal.id, journal.last_updated)
+        assert models.Article.pull(articles[4].id) is not None
+
+        # blocking saves skip the buffer, after sending what is already in it
+        with models.Article.bulk_writer() as writer:
+            articles[0].save()
+            articles[1].save(blocking=True)
+            assert writer.saved == 1
+            assert models.Article.pull(articles[1].id).last_updated == articles[1].last_updated
+
+    def test_42_blocking_visibility_policies(self):
+        for policy in ["wait_for", "refresh", "poll"]:
+            original = patch_config(app, {"ES_VISIBILITY_POLICY": policy})
+
+            article = models.Article(**ArticleFixtureFactory.make_article_source(with_id=False))
+            article.save(blocking=True)
+            q = {"query": {"term": {"id.exact": article.id}}}
+            assert models.Article.hit_count(q) == 1, policy
+
+            # a second blocking save only needs a later timestamp when polling
+            article.save(blocking=True)
+            assert models.Article.hit_count(q) == 1, policy
+
+            # and a batch of non-blocking saves can be waited for together
+            batch = [models.Article(**ArticleFixtureFactory.make_article_source(with_id=False)) for _ in range(3)]
+            for a in batch:
+                a.save()
+            models.Article.blockall([(a.id, a.last_updated) for a in batch])
+            for a in batch:
+                assert models.Article.hit_count({"query": {"term": {"id.exact": a.id}}}) == 1, policy
+
+            batch[0].delete()
+            models.Article.blockdeleted(batch[0].id)
+            assert models.Article.hit_count({"query": {"term": {"id.exact": batch[0].id}}}) == 0, policy
+
+            patch_config(app, original)
+
+    def test_43_set_in_doaj_by_issns(self):
+        articles = []
+        for issn in ["1111-1111", "1111-1111", "2222-2222"]:
+            a = models.Article(**ArticleFixtureFactory.make_article_source(eissn=issn, pissn=issn, with_id=False, in_doaj=True))
+            a.save()
+            articles.append(a)
+        models.Article.blockall([(a.id, a.last_updated) for a in articles])
+
+        progress = []
+        updated = models.Article.set_in_doaj_by_issns(["1111-1111"], False, progress_callback=progress.append)
+        assert updated == 2
+        assert progress[-1].get("updated") == 2
+
+        # the index is refreshed by the update, and last_updated moves on so that changes are picked up
+        for a in articles[:2]:
+            latest = models.Article.pull(a.id)
+            assert latest.is_in_doaj() is False
+            assert latest.last_updated >= a.last_updated
+        assert models.Article.pull(articles[2].id).is_in_doaj() is True
+
+        # articles which already have the right status are left alone
+        assert models.Article.set_in_doaj_by_issns(["1111-1111"], False) == 0
+
+    def test_44_struct_cache_and_lazy_construct(self):
+        source = JournalFixtureFactory.make_journal_source(in_doaj=True)
+
+        # instances of a class share the one prepared struct
+        j1 = models.Journal(**source)
+        j2 = models.Journal(**source)
+        assert j1.__seamless_struct__ is j2.__seamless_struct__
+        assert j1.__seamless_struct__.compiled is j2.__seamless_struct__.compiled
+
+        # but extending the struct of one instance does not affect the others
+        j1.extend_struct({"fields": {"extra": {"coerce": "unicode"}}})
+        assert "extra" in j1.__seamless_struct__.allowed
+        assert "extra" not in j2.__seamless_struct__.allowed
+        assert "extra" not in models.Journal().__seamless_struct__.allowed
+
+        # the compiled struct still rejects bad data
+        bad = JournalFixtureFactory.make_journal_source()
+        bad["bibjson"]["not_a_field"] = "value"
+        with self.assertRaises(seamless.SeamlessException):
+            models.Journal(**bad)
+
+        # lazily, the data is taken as it is
+        with seamless.lazy_construct():
+            lazy = models.Journal(**bad)
+        assert lazy.bibjson().title == bad["bibjson"]["title"]
+
+        j = models.Journal(**source)
+        j.set_in_doaj(True)
+        j.save(blocking=True)
+        lazies = list(models.Journal.all_in_doaj(lazy=True))
+        assert len(lazies) == 1
+        assert lazies[0].id == j.id
+        assert lazies[0].toc_id == j.toc_id
+
+    def test_45_compiled_struct_list_without_instructions(self):
+        # a list with no instructions still compiles, and only fails when there is data for it
+        struct = seamless.Construct({"lists": {"things": None}}, COERCE_MAP, "unicode")
+        assert struct.compiled is not None
+        assert struct.construct({}) is not None
+        with self.assertRaises(seamless.SeamlessException):
+            struct.construct({"things": ["a"]})
+
+    def test_45_local_site_statistics(self):
+        models.Cache.cache_site_statistics({
+            "journals": "10",
+            "new_journals": "20",
+            "countries": "30",
+            "abstracts": "40",
+            "no_apc": "50"
+        })
+        time.sleep(1)
+
+        loads = []
+        original_load = models.JournalArticle.__dict__["_load_site_statistics"]
+
+        def counting_load():
+            loads.append(1)
+            return original_load.__func__(models.JournalArticle)
+
+        original = patch_config(app, {"SITE_STATISTICS_LOCAL_TIMEOUT": 60})
+        models.JournalArticle._load_site_statistics = counting_load
+        models.JournalArticle.clear_site_statistics()
+        try:
+            # the first request loads the stats, and the rest are served from the local copy
+            for i in range(5):
+                assert models.JournalArticle.site_statistics()["journals"] == "10"
+            assert len(loads) == 1
+
+            # a changed cache is not seen until the local copy expires
+            models.Cache.cache_site_statistics({
+                "journals": "11",
+                "new_journals": "20",
+                "countries": "30",
+                "abstracts": "40",
+                "no_apc": "50"
+            })
+            time.sleep(1)
+            assert models.JournalArticle.site_statistics()["journals"] == "10"
+
+            # once expired, the old stats are still served while a single refresh happens in the background
+            fetched = models.JournalArticle._local_statistics[1]
+            models.JournalArticle._local_statistics = (models.JournalArticle._local_statistics[0], fetched - 61)
+            for i in range(5):
+                assert models.JournalArticle.site_statistics()["journals"] in ["10", "11"]
+
+            with models.JournalArticle._statistics_lock:
+                pass
+            assert len(loads) == 2
+            assert models.JournalArticle.site_statistics()["journals"] == "11"
+        finally:
+            models.JournalArticle._load_site_statistics = original_load
+            models.JournalArticle.clear_site_statistics()
+            patch_config(app, original)
+
 
 class TestAccount(DoajTestCase):
     def test_get_name_safe(self):
@@ -11,6 +11,7 @@ import time
 
 from portality.lib import dates
 from portality.lib.dates import FMT_DATE_STD
+from portality.view import oaipmh
 
 
 class TestClient(DoajTestCase):
@@ -446,3 +447,80 @@ class TestClient(DoajTestCase):
                 assert len(oai_dc) == 1
                 assert oai_dc[0].tag == "{%s}" % self.oai_ns["oai_dc"] + "dc"
                 assert oai_dc[0].nsmap["xsi"] == self.oai_ns["xsi"]
+
+    def test_12_search_after_resumption(self):
+        """ Check that resumption tokens page with search_after, and that pages neither repeat nor skip records """
+        app.config['OAIPMH_LIST_IDENTIFIERS_PAGE_SIZE'] = 2
+
+        # all of the journals share a last_updated date, so only the id separates them
+        with freeze_time(dates.now() - timedelta(days=1)):
+            for j in JournalFixtureFactory.make_many_journal_sources(5, in_doaj=True):
+                jm = models.Journal(**j)
+                jm.save(blocking=True)
+
+        seen = []
+        with self.app_test.test_request_context():
+            with self.app_test.test_client() as t_client:
+                resp = t_client.get(url_for('oaipmh.oaipmh', verb='ListIdentifiers', metadataPrefix='oai_dc'))
+                while True:
+                    t = etree.fromstring(resp.data)
+                    seen += [i.text for i in t.xpath('//oai:identifier', namespaces=self.oai_ns)]
+                    rt = t.xpath('//oai:resumptionToken', namespaces=self.oai_ns)[0]
+                    assert rt.get('completeListSize') == '5'
+                    if rt.text is None:
+                        break
+
+                    params = oaipmh.decode_resumption_token(rt.text)
+                    assert "search_after" in params
+                    assert "start_after" not in params
+                    assert params["complete_list_size"] == 5
+                    resp = t_client.get(url_for('oaipmh.oaipmh', verb='ListIdentifiers', resumptionToken=rt.text))
+
+        assert len(seen) == 5
+        assert len(set(seen)) == 5
+
+    def test_13_record_cache(self):
+        """ Check that ListRecords serves the cached rendering of a record until the record changes """
+        app.config['OAIPMH_RECORD_CACHE'] = True
+
+        [j] = JournalFixtureFactory.make_many_journal_sources(1, in_doaj=True)
+        journal = models.Journal(**j)
+        journal.save(blocking=True)
+
+        def list_titles():
+            with self.app_test.test_request_context():
+                with self.app_test.test_client() as t_client:
+                    resp = t_client.get(url_for('oaipmh.oaipmh', verb='ListRecords', metadataPrefix='oai_dc'))
+                    assert resp.status_code == 200
+                    t = etree.fromstring(resp.data)
+                    return [e.text for e in t.xpath('//oai:record/oai:metadata//dc:title', namespaces=self.oai_ns)]
+
+        titles = list_titles()
+        assert titles == [journal.bibjson().title]
+
+        cache_id = models.OAIPMHRenderedRecord.cache_id("journal", "oai_dc", journal.id)
+        cached = models.OAIPMHRenderedRecord.pull(cache_id)
+        assert cached is not None
+        assert cached.data["record_hash"] == models.OAIPMHRenderedRecord.record_hash(journal)
+
+        # while the journal is unchanged, the cached record is served as it is
+        cached.data["record"] = cached.data["record"].replace(journal.bibjson().title, "Cached Title")
+        cached.save(blocking=True)
+        assert list_titles() == ["Cached Title"]
+
+        # once the journal changes, the record is rendered again
+        journal.save(blocking=True, differentiate=True)
+        assert list_titles() == [journal.bibjson().title]
+
+        # even if it changed within the same second, so has the same last_updated
+        xwalk = oaipmh.CROSSWALKS["oai_dc"]["journal"]()
+        journal.bibjson().title = "New Title"
+        [xml] = models.OAIPMHRenderedRecord.render(xwalk, "journal", "oai_dc", [journal])
+        assert b"New Title" in xml
+
+        # once the journal is withdrawn its rendering is pruned
+        journal.set_in_doaj(False)
+        journal.save(blocking=True)
+        assert models.OAIPMHRenderedRecord.prune() == 1
+        models.OAIPMHRenderedRecord.refresh()
+        assert models.OAIPMHRenderedRecord.pull(cache_id) is None
@@ -1,9 +1,9 @@
 from portality import models
 
 from doajtest.fixtures import AccountFixtureFactory, ArticleFixtureFactory
-from doajtest.helpers import DoajTestCase, deep_sort
+from doajtest.helpers import DoajTestCase, deep_sort, patch_config
 
-from portality.bll.services.query import QueryService, Query
+from portality.bll.services.query import QueryService, Query, get_pipeline
 from portality.bll import exceptions
 
 QUERY_ROUTE = {
@@ -16,6 +16,19 @@ QUERY_ROUTE = {
             "dao" : "portality.models.Article"
         }
     },
+    "source_query" : {
+        "article" : {
+            "auth" : False,
+            "role" : None,
+            "query_filters" : ["only_in_doaj"],
+            "result_filters" : ["public_result_filter"],
+            "source_filter" : {
+                "includes" : ["id", "bibjson", "admin.seal"],
+                "replaces" : ["public_result_filter"]
+            },
+            "dao" : "portality.models.Article"
+        }
+    },
     "publisher_query" : {
         "journal" : {
             "auth" : True,
@@ -339,3 +352,91 @@ class TestQuery(DoajTestCase):
             am = models.Article(**res)
             assert am.publisher_record_id() is None, am.publisher_record_id()
 
+
+    def test_11_scroll_sliced(self):
+        # Splitting the scroll into slices gives the same records as a single scroll, with no overlap
+        qsvc = QueryService()
+
+        articles = []
+        for i in range(0, 6):
+            articles.append(models.Article(**ArticleFixtureFactory.make_article_source(with_id=False)))
+            articles[-1].save()
+        models.Article.blockall([(a.id, a.last_updated) for a in articles])
+
+        q = {"query": {"match_all": {}}}
+        all_ids = sorted([r["id"] for r in qsvc.scroll('api_query', 'article', q, None, None)])
+
+        sliced_ids = []
+        for i in range(0, 2):
+            sliced_ids += [r["id"] for r in qsvc.scroll('api_query', 'article', q, None, None, slice_id=i, slice_max=2)]
+
+        assert len(all_ids) == 6
+        assert sorted(sliced_ids) == all_ids
+
+    def test_12_source_filter(self):
+        # The source filter is pushed into the query, and the result filter it replaces no longer runs
+        qsvc = QueryService()
+        cfg = qsvc._get_config_for_search('source_query', 'article', account=None)
+
+        query = qsvc._get_query(cfg, {"query": {"match_all": {}}})
+        skip = qsvc._apply_source_filter(cfg, query)
+        assert query.as_dict()["_source"] == {"includes": ["admin.seal", "bibjson", "id"]}
+        assert skip == frozenset(["public_result_filter"])
+
+        # the compiled source filter is reused for the same route config
+        assert qsvc._get_source_filter(cfg) is qsvc._get_source_filter(cfg)
+
+        # a query which brings its own _source is left alone, and the result filters run as usual
+        query = qsvc._get_query(cfg, {"query": {"match_all": {}}, "_source": ["admin.*"]})
+        skip = qsvc._apply_source_filter(cfg, query)
+        assert query.as_dict()["_source"] == ["admin.*"]
+        assert skip == frozenset()
+
+        res = {"admin": {"seal": False, "publisher_record_id": "some_identifier"}}
+        res = qsvc._post_filter_search_results(cfg, res, unpacked=True, skip=skip)
+        assert res == {"admin": {"seal": False}}
+
+    def test_13_search_source_filter(self):
+        # Bringing it together, ES only returns the fields allowed by the source filter
+        qsvc = QueryService()
+
+        article = models.Article(**ArticleFixtureFactory.make_article_source(with_id=False))
+        article.save(blocking=True)
+
+        res = qsvc.search('source_query', 'article', {"query": {"match_all": {}}}, None, {})
+        assert len(res["hits"]["hits"]) == 1
+        source = res["hits"]["hits"][0]["_source"]
+        assert sorted(source.keys()) == ["admin", "bibjson", "id"]
+        assert list(source["admin"].keys()) == ["seal"]
+
+    def test_14_compiled_pipeline(self):
+        # Route configs are compiled once into read-only pipelines, which are recompiled if the config is replaced
+        qsvc = QueryService()
+        cfg = qsvc._get_config_for_search('query', 'article', account=None)
+
+        pipeline = get_pipeline(cfg)
+        assert get_pipeline(cfg) is pipeline
+        assert [name for name, fn in pipeline.query_filters] == ["only_in_doaj"]
+        assert [name for name, fn in pipeline.result_filters] == ["public_result_filter"]
+        assert pipeline.dao_klass is models.Article
+        assert pipeline.validator is None
+
+        with self.assertRaises(AttributeError):
+            pipeline.dao_klass = models.Journal
+
+        org = patch_config(self.app_test, {"QUERY_FILTERS": dict(QUERY_FILTERS)})
+        try:
+            assert get_pipeline(cfg) is not pipeline
+
+            # a route which refers to a filter that doesn't exist can't be compiled
+            with self.assertRaises(exceptions.ConfigurationException):
+                get_pipeline({"auth": False, "query_filters": ["no_such_filter"], "dao": "portality.models.Article"})
+        finally:
+            patch_config(self.app_test, org)
+
+    def test_15_search_timings(self):
+        # The time spent in each stage of the search is recorded on the service
+        qsvc = QueryService()
+        qsvc.search('query', 'article', {"query": {"match_all": {}}}, None, {})
+        assert sorted(qsvc.timings.keys()) == ["query", "query_filters", "result_filters", "validate"]
+        assert all([t >= 0 for t in qsvc.timings.values()])
@@ -1,3 +1,4 @@
+import gzip
 import json
 import tarfile
 from io import StringIO
@@ -15,7 +16,7 @@ from portality.background import BackgroundApi
 from portality.core import app
 from portality.lib import dates
 from portality.lib.paths import rel2abs
-from portality.tasks.public_data_dump import PublicDataDumpBackgroundTask
+from portality.tasks.public_data_dump import PublicDataDumpBackgroundTask, deleted_ids
 
 
 
@@ -224,3 +225,121 @@ class TestPublicDataDumpTask(DoajTestCase):
             else:
                 # otherwise, we expect the main store to have survived
                 assert not localStore.exists(container_id)
+
+    def test_incremental_public_data_dump(self):
+        container_id = app.config["STORE_PUBLIC_DATA_DUMP_CONTAINER"]
+        localStore = store.StoreLocal(None)
+
+        journals = []
+        for source in JournalFixtureFactory.make_many_journal_sources(3, in_doaj=True):
+            journal = models.Journal(**source)
+            journal.save()
+            journals.append(journal)
+        for journal in journals:
+            models.Journal.block(journal.id, journal.last_updated, sleep=0.05)
+
+        # the first incremental run has nothing to work from, so takes a full snapshot
+        job = PublicDataDumpBackgroundTask.prepare("testuser", prune=True, types="journal", incremental=True)
+        task = PublicDataDumpBackgroundTask(job)
+        BackgroundApi.execute(task)
+        assert task.background_job.status == "complete"
+
+        day_at_start = dates.today()
+        journal_dump = models.cache.Cache.get_public_data_dump().get("journal")
+        assert journal_dump["filename"] == "doaj_journal_data_" + day_at_start + ".tar.gz"
+        assert journal_dump["manifest"] == "doaj_journal_ids_" + day_at_start + ".txt.gz"
+        assert journal_dump["high_water_mark"] is not None
+        assert journal_dump["delta"] is None
+        assert sorted(localStore.list(container_id)) == sorted([journal_dump["filename"], journal_dump["manifest"]])
+
+        # change one journal, and withdraw another
+        journals[0].bibjson().title = "Updated Title"
+        journals[0].save(blocking=True)
+        journals[1].set_in_doaj(False)
+        journals[1].save(blocking=True)
+
+        job = PublicDataDumpBackgroundTask.prepare("testuser", prune=True, types="journal", incremental=True)
+        task = PublicDataDumpBackgroundTask(job)
+        BackgroundApi.execute(task)
+        assert task.background_job.status == "complete"
+
+        delta_dump = models.cache.Cache.get_public_data_dump().get("journal")
+        assert delta_dump["filename"] == journal_dump["filename"]
+        assert delta_dump["high_water_mark"] == journal_dump["high_water_mark"]
+        assert delta_dump["delta"]["filename"] == "doaj_journal_delta_" + day_at_start + ".tar.gz"
+        assert delta_dump["delta"]["since"] == journal_dump["high_water_mark"]
+        assert len(localStore.list(container_id)) == 3
+
+        stream = localStore.get(container_id, delta_dump["delta"]["filename"])
+        tarball = tarfile.open(fileobj=stream, mode="r:gz")
+        members = {m.name.split("/")[-1]: m for m in tarball.getmembers()}
+        assert sorted(members.keys()) == ["deleted.json", "journal_batch_1.json"]
+
+        changed = json.loads(tarball.extractfile(members["journal_batch_1.json"]).read().decode("utf-8"))
+        assert [r["id"] for r in changed] == [journals[0].id]
+        assert changed[0]["bibjson"]["title"] == "Updated Title"
+
+        deleted = json.loads(tarball.extractfile(members["deleted.json"]).read().decode("utf-8"))
+        assert deleted == [journals[1].id]
+
+    def test_incremental_manifest_matches_snapshot(self):
+        container_id = app.config["STORE_PUBLIC_DATA_DUMP_CONTAINER"]
+        localStore = store.StoreLocal(None)
+
+        journals = []
+        for source in JournalFixtureFactory.make_many_journal_sources(3, in_doaj=True):
+            journal = models.Journal(**source)
+            journal.save()
+            journals.append(journal)
+        for journal in journals:
+            models.Journal.block(journal.id, journal.last_updated, sleep=0.05)
+
+        job = PublicDataDumpBackgroundTask.prepare("testuser", prune=True, types="journal", incremental=True)
+        task = PublicDataDumpBackgroundTask(job)
+
+        # once the snapshot has been exported, but before its manifest is written, withdraw one journal and
+        # add another
+        added = models.Journal(**JournalFixtureFactory.make_journal_source(in_doaj=True))
+        store_file = task._store_file
+        changed_at_store = []
+
+        def change_and_store(mainStore, tmpStore, container, path, typ):
+            if path.endswith(".tar.gz") and len(changed_at_store) == 0:
+                changed_at_store.append(path)
+                journals[1].set_in_doaj(False)
+                journals[1].save(blocking=True)
+                added.save(blocking=True)
+            return store_file(mainStore, tmpStore, container, path, typ)
+
+        task._store_file = change_and_store
+        BackgroundApi.execute(task)
+        assert task.background_job.status == "complete"
+
+        # the manifest lists the journals which are in the snapshot
+        journal_dump = models.cache.Cache.get_public_data_dump().get("journal")
+        stream = localStore.get(container_id, journal_dump["manifest"])
+        manifest = gzip.GzipFile(fileobj=stream).read().decode("utf-8").split("\n")
+        assert manifest == sorted([j.id for j in journals]) + [""]
+
+        # so the delta reports the withdrawn journal as deleted, and the new one as changed
+        job = PublicDataDumpBackgroundTask.prepare("testuser", prune=True, types="journal", incremental=True)
+        task = PublicDataDumpBackgroundTask(job)
+        BackgroundApi.execute(task)
+        assert task.background_job.status == "complete"
+
+        delta_dump = models.cache.Cache.get_public_data_dump().get("journal")
+        stream = localStore.get(container_id, delta_dump["delta"]["filename"])
+        tarball = tarfile.open(fileobj=stream, mode="r:gz")
+        members = {m.name.split("/")[-1]: m for m in tarball.getmembers()}
+
+        changed = json.loads(tarball.extractfile(members["journal_batch_1.json"]).read().decode("utf-8"))
+        assert [r["id"] for r in changed] == [added.id]
+
+        deleted = json.loads(tarball.extractfile(members["deleted.json"]).read().decode("utf-8"))
+        assert deleted == [journals[1].id]
+
+    def test_deleted_ids(self):
+        assert list(deleted_ids([], ["a", "b"])) == []
+        assert list(deleted_ids(["a", "b"], [])) == ["a", "b"]
+        assert list(deleted_ids(["a", "c", "d", "f"], ["a", "b", "d", "e", "g"])) == ["c", "f"]
+        assert list(deleted_ids(["a", "b", "c"], ["a", "b", "c"])) == []
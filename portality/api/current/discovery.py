@@ -316,7 +316,7 @@ class DiscoveryApi(Api):
         return cls._make_response(endpoint, res, q, page, page_size, sort, obs)
 
     @classmethod
-    def scroll(cls, index_type, account, q, page_size, sort=None, scan=False):
+    def scroll(cls, index_type, account, q, page_size, sort=None, scan=False, slice_id=None, slice_max=None):
         if index_type not in ['article', 'journal', 'application']:
             raise DiscoveryException("There was an error executing your query for {0}. Unknown type.)".format(index_type))
 
@@ -325,7 +325,8 @@ class DiscoveryApi(Api):
 
         # execute the query against the articles
         query_service = DOAJ.queryService()
-        for result in query_service.scroll('api_query', index_type, raw_query, account, page_size, scan=scan):
+        for result in query_service.scroll('api_query', index_type, raw_query, account, page_size, scan=scan,
+                                           slice_id=slice_id, slice_max=slice_max):
             yield result
 
 
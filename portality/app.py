@@ -89,6 +89,11 @@ if app.config.get("DEBUG", False) and app.config.get("TESTDRIVE_ENABLED", False)
 # putting it here ensures it will run under any web server
 initialise_index(app, es_connection)
 
+# compile the query routes up front, so that searches don't have to
+# ~~-> Query:Service~~
+from portality.bll.services.query import compile_query_routes
+compile_query_routes()
+
 # serve static files from multiple potential locations
 # this allows us to override the standard static file handling with our own dynamic version
 # ~~-> Assets:WebRoute~~
@@ -320,17 +325,13 @@ def standard_authentication():
     """Check remote_user on a per-request basis."""
     remote_user = request.headers.get('REMOTE_USER', '')
     if remote_user:
-        user = models.Account.pull(remote_user)
+        user = models.Account.pull_cached(remote_user)
         if user:
             login_user(user, remember=False)
     elif 'api_key' in request.values:
-        q = models.Account.query(q='api_key:"' + request.values['api_key'] + '"')
-        if 'hits' in q:
-            res = q['hits']['hits']
-            if len(res) == 1:
-                user = models.Account.pull(res[0]['_source']['id'])
-                if user:
-                    login_user(user, remember=False)
+        user = models.Account.pull_by_api_key(request.values['api_key'], api_role=False)
+        if user:
+            login_user(user, remember=False)
 
 
 # Register configured API versions
@@ -1,6 +1,7 @@
 from portality.lib import dates
 from portality.lib.argvalidate import argvalidate
 from portality import models
+from portality.core import app
 from portality.bll import exceptions
 from portality.ui.messages import Messages
 from portality.lib.dataobj import DataStructureException
@@ -13,7 +14,7 @@ class ArticleService(object):
     """
 
     def batch_create_articles(self, articles, account, duplicate_check=True, merge_duplicate=True,
-                              limit_to_account=True, add_journal_info=False):
+                              limit_to_account=True, add_journal_info=False, bulk=None):
         """
         Create a batch of articles in a single operation.  Articles are either all created/updated or none of them are
 
@@ -27,6 +28,7 @@ class ArticleService(object):
         :param merge_duplicate:     Should duplicates be merged.  If set to False, this may raise a DuplicateArticleException
         :param limit_to_account:    Should the ingest be limited only to articles for journals owned by the account.  If set to True, may result in an IngestException
         :param add_journal_info:    Should we fetch the journal info and attach it to the article before save?
+        :param bulk:    Should the validated batch be written with bulk requests rather than one save per article?  Defaults to the ARTICLE_BATCH_CREATE_BULK config
         :return: a report on the state of the import: {success: x, fail: x, update: x, new: x, shared: [], unowned: [], unmatched: []}
         """
         # first validate the incoming arguments to ensure that we've got the right thing
@@ -36,9 +38,13 @@ class ArticleService(object):
             {"arg": duplicate_check, "instance": bool, "allow_none": False, "arg_name": "duplicate_check"},
             {"arg": merge_duplicate, "instance": bool, "allow_none": False, "arg_name": "merge_duplicate"},
             {"arg": limit_to_account, "instance": bool, "allow_none": False, "arg_name": "limit_to_account"},
-            {"arg": add_journal_info, "instance": bool, "allow_none": False, "arg_name": "add_journal_info"}
+            {"arg": add_journal_info, "instance": bool, "allow_none": False, "arg_name": "add_journal_info"},
+            {"arg": bulk, "instance": bool, "allow_none": True, "arg_name": "bulk"}
         ], exceptions.ArgumentException)
 
+        if bulk is None:
+            bulk = app.config.get("ARTICLE_BATCH_CREATE_BULK", True)
+
         # 1. dedupe the batch
         if duplicate_check:
             batch_duplicates = self._batch_contains_duplicates(articles)
@@ -47,6 +53,12 @@ class ArticleService(object):
                           "unmatched": []}
                 raise exceptions.IngestException(message=Messages.EXCEPTION_ARTICLE_BATCH_DUPLICATE, result=report)
 
+        # resolve the index duplicates for the whole batch up front, rather than one query per article
+        possible_duplicates = [None] * len(articles)
+        if duplicate_check:
+            # ~~!ArticleBatchCreate:Feature->ArticleDeduplication:Feature~~
+            possible_duplicates = self.discover_duplicates_batch(articles, results_per_match_type=2)
+
         # 2. check legitimate ownership
         success = 0
         fail = 0
@@ -55,8 +67,9 @@ class ArticleService(object):
         all_shared = set()
         all_unowned = set()
         all_unmatched = set()
+        results = []
 
-        for article in articles:
+        for article, possible in zip(articles, possible_duplicates):
             try:
                 # ~~!ArticleBatchCreate:Feature->ArticleCreate:Feature~~
                 result = self.create_article(article, account,
@@ -64,10 +77,12 @@ class ArticleService(object):
                                              merge_duplicate=merge_duplicate,
                                              limit_to_account=limit_to_account,
                                              add_journal_info=add_journal_info,
-                                             dry_run=True)
+                                             dry_run=True,
+                                             possible_duplicates=possible)
             except (exceptions.ArticleMergeConflict, exceptions.ConfigurationException):
                 raise exceptions.IngestException(message=Messages.EXCEPTION_ARTICLE_BATCH_CONFLICT)
 
+            results.append(result)
             success += result.get("success", 0)
             fail += result.get("fail", 0)
             update += result.get("update", 0)
@@ -81,17 +96,66 @@ class ArticleService(object):
 
         # if there were no failures in the batch, then we can do the save
         if fail == 0:
-            for i in range(len(articles)):
-                block = i == len(articles) - 1
-                # block on the final save, so that when this method returns, all articles are
-                # available in the index
-                articles[i].save(blocking=block)
+            if bulk:
+                self._bulk_save_articles(articles, results, report)
+            else:
+                for i in range(len(articles)):
+                    block = i == len(articles) - 1
+                    # block on the final save, so that when this method returns, all articles are
+                    # available in the index
+                    articles[i].save(blocking=block)
 
             # return some stats on the import
             return report
         else:
             raise exceptions.IngestException(message=Messages.EXCEPTION_ARTICLE_BATCH_FAIL, result=report)
 
+    @staticmethod
+    def _bulk_save_articles(articles, results, report):
+        """
+        Write an already validated batch of articles to the index with bulk requests.
+
+        The index fields are generated for every article up front, and only the final request waits for a refresh,
+        so that when this method returns all the articles are available in the index.  Any articles rejected
+        by the index are moved from the success to the fail counts in the report, and an IngestException is raised.
+
+        ~~->ArticleBatchCreate:Feature~~
+
+        :param articles: the validated articles, as passed to batch_create_articles
+        :param results: the create_article dry run result for each article, in the same order as the articles
+        :param report: the batch report, which will be updated with any per-article failures
+        """
+        now = dates.now_str()
+        for article in articles:
+            article.prep()
+            article.prep_for_save(now)
+
+        batch_size = app.config.get("ARTICLE_BATCH_CREATE_BULK_SIZE", 500)
+        failures = {}
+        for start in range(0, len(articles), batch_size):
+            batch = articles[start:start + batch_size]
+            last = start + batch_size >= len(articles)
+            try:
+                resp = models.Article.bulk([a.data for a in batch], refresh="wait_for" if last else False,
+                                           req_timeout=app.config.get("ARTICLE_BATCH_CREATE_BULK_TIMEOUT", 60))
+            except Exception as e:
+                failures.update({a.id: str(e) for a in batch})
+                continue
+            failures.update(models.Article.bulk_failures(resp))
+
+        if len(failures) == 0:
+            return
+
+        for article, result in zip(articles, results):
+            if article.id in failures:
+                app.logger.error("Bulk write of article {x} failed: {y}".format(x=article.id, y=failures[article.id]))
+                report["success"] -= 1
+                report["fail"] += 1
+                report["update"] -= result.get("update", 0)
+                report["new"] -= result.get("new", 0)
+
+        raise exceptions.IngestException(message=Messages.EXCEPTION_ARTICLE_BATCH_FAIL, result=report)
+
     @staticmethod
     def _batch_contains_duplicates(articles):
         dois = []
@@ -171,7 +235,8 @@ class ArticleService(object):
             raise exceptions.ArticleNotAcceptable(message=Messages.EXCEPTION_IDENTICAL_PISSN_AND_EISSN)
 
     def create_article(self, article, account, duplicate_check=True, merge_duplicate=True,
-                       limit_to_account=True, add_journal_info=False, dry_run=False, update_article_id=None):
+                       limit_to_account=True, add_journal_info=False, dry_run=False, update_article_id=None,
+                       possible_duplicates=None):
 
         """
         Create an individual article in the database
@@ -190,6 +255,8 @@ class ArticleService(object):
         :param dry_run:     Whether to actuall save, or if this is just to either see if it would work, or to prep for a batch ingest
         :param update_article_id: The article id that it is supposed to be an update to; taken into consideration ONLY
             if duplicate_check == True and merge_duplicate == True
+        :param possible_duplicates: duplicates already discovered for this article (e.g. by discover_duplicates_batch),
+            to save looking them up again
         :return:
         """
         # first validate the incoming arguments to ensure that we've got the right thing
@@ -201,7 +268,8 @@ class ArticleService(object):
             {"arg": limit_to_account, "instance": bool, "allow_none": False, "arg_name": "limit_to_account"},
             {"arg": add_journal_info, "instance": bool, "allow_none": False, "arg_name": "add_journal_info"},
             {"arg": dry_run, "instance": bool, "allow_none": False, "arg_name": "dry_run"},
-            {"arg": update_article_id, "instance": str, "allow_none": True, "arg_name": "update_article_id"}
+            {"arg": update_article_id, "instance": str, "allow_none": True, "arg_name": "update_article_id"},
+            {"arg": possible_duplicates, "instance": dict, "allow_none": True, "arg_name": "possible_duplicates"}
         ], exceptions.ArgumentException)
 
         # quickly validate that the article is acceptable - it must have a DOI and/or a fulltext
@@ -219,7 +287,10 @@ class ArticleService(object):
         is_update = 0
         if duplicate_check:
             # ~~!ArticleCreate:Feature->ArticleDeduplication:Feature~~
-            duplicate = self.get_duplicate(article)
+            if possible_duplicates is not None:
+                duplicate = self.get_duplicate(article, possible_duplicates=possible_duplicates)
+            else:
+                duplicate = self.get_duplicate(article)
             try:
                 if account.has_role("admin") and update_article_id is not None:     # is update_article_id is None then treat as normal publisher upload
                                                                                     # for testing by admin
@@ -406,13 +477,14 @@ class ArticleService(object):
 
         return owned, shared, unowned, unmatched
 
-    def get_duplicate(self, article):
+    def get_duplicate(self, article, possible_duplicates=None):
         """
         Get at most one, most recent, duplicate article for the supplied article.
 
         ~~->ArticleDeduplication:Feature~~
 
         :param article:
+        :param possible_duplicates: the output of discover_duplicates(_batch) for this article, if already known
         :return:
         """
         # first validate the incoming arguments to ensure that we've got the right thing
@@ -421,7 +493,7 @@ class ArticleService(object):
         ], exceptions.ArgumentException)
 
         article.prep()
-        dup = self.get_duplicates(article, max_results=2)
+        dup = self.get_duplicates(article, max_results=2, possible_duplicates=possible_duplicates)
         if len(dup) > 1:
             raise exceptions.ArticleMergeConflict(Messages.EXCEPTION_ARTICLE_MERGE_CONFLICT)
         elif dup:
@@ -429,7 +501,7 @@ class ArticleService(object):
         else:
             return None
 
-    def get_duplicates(self, article, max_results=10):
+    def get_duplicates(self, article, max_results=10, possible_duplicates=None):
         """
         Get all known duplicates of an article
 
@@ -437,14 +509,19 @@ class ArticleService(object):
 
         :param article: Article of interest
         :param max_results: Maximum number of duplicate candidates to return
+        :param possible_duplicates: the output of discover_duplicates(_batch) for this article, if already known
         :return: A list of possible duplicates
         """
         # first validate the incoming arguments to ensure that we've got the right thing
         argvalidate("get_duplicates", [
             {"arg": article, "instance": models.Article, "allow_none": False, "arg_name": "article"},
+            {"arg": possible_duplicates, "instance": dict, "allow_none": True, "arg_name": "possible_duplicates"}
         ], exceptions.ArgumentException)
 
-        possible_articles_dict = self.discover_duplicates(article, max_results)
+        if possible_duplicates is not None:
+            possible_articles_dict = possible_duplicates
+        else:
+            possible_articles_dict = self.discover_duplicates(article, max_results)
         if not possible_articles_dict:
             return []
 
@@ -521,3 +598,48 @@ class ArticleService(object):
             raise exceptions.DuplicateArticleException(Messages.EXCEPTION_DETECT_DUPLICATE_NO_ID)
 
         return possible_articles if found else None
+
+    @staticmethod
+    def discover_duplicates_batch(articles, results_per_match_type=10, include_article=True):
+        """
+        Identify duplicates for a list of articles at once, separated by duplication criteria.
+
+        The normalised DOIs and fulltext urls of all the articles are resolved together with a small number of
+        terms queries, so the cost is a constant number of index requests rather than one or two per article.
+
+        ~~->ArticleDeduplication:Feature~~
+
+        :param articles: list of articles
+        :param results_per_match_type: maximum number of duplicates to return for each identifier
+        :param include_article: whether an article may be reported as a duplicate of itself
+        :return: a list, in the same order as the articles, of dicts in the same form as discover_duplicates, i.e.
+            {"doi": [...], "fulltext": [...]}.  The dict is empty if no duplicates were found, and the entry is None
+            if the article has no identifiers which can be used for deduplication.
+        """
+        # first validate the incoming arguments to ensure that we've got the right thing
+        argvalidate("discover_duplicates_batch", [
+            {"arg": articles, "instance": list, "allow_none": False, "arg_name": "articles"},
+        ], exceptions.ArgumentException)
+
+        identifiers = [(a.get_normalised_doi(), a.get_normalised_fulltext()) for a in articles]
+        doi_matches, fulltext_matches = models.Article.duplicates_batch(
+            dois=[doi for doi, ft in identifiers if isinstance(doi, str) and doi != ''],
+            fulltexts=[ft for doi, ft in identifiers if ft is not None],
+            size=results_per_match_type)
+
+        possible = []
+        for article, (doi, fulltext) in zip(articles, identifiers):
+            if doi is None and fulltext is None:
+                possible.append(None)
+                continue
+
+            possible_articles = {}
+            for match_type, key, matches in [("doi", doi, doi_matches), ("fulltext", fulltext, fulltext_matches)]:
+                found = matches.get(key, []) if key is not None else []
+                if not include_article:
+                    found = [a for a in found if a.id != article.id]
+                if len(found) > 0:
+                    possible_articles[match_type] = found
+            possible.append(possible_articles)
+
+        return possible
@@ -1,3 +1,9 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import has_request_context, copy_current_request_context
+
 from portality.core import app
 from portality.lib import plugin
 
@@ -49,16 +55,97 @@ class EventsService(object):
         JournalDiscontinuingSoonNotify
     ]
 
+    # the dispatch table for the EVENT_CONSUMERS, as (consumers, {event id: consumers}), see routes()
+    _routes = None
+
+    # timings for each consumer id: {"count": ..., "total": seconds, "max": seconds}
+    _timings = {}
+    _timings_lock = threading.Lock()
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
     def __init__(self):
         self.trigger_function = plugin.load_function(app.config.get("EVENT_SEND_FUNCTION"))
 
     def trigger(self, event):
         self.trigger_function(event)
 
+    @classmethod
+    def routes(cls):
+        """
+        The dispatch table from event id to the consumers which declare that they handle it, in the order of
+        EVENT_CONSUMERS.  Consumers which don't declare their EVENTS are offered every event.
+        """
+        consumers = cls.EVENT_CONSUMERS
+        if cls._routes is not None and cls._routes[0] is consumers:
+            return cls._routes[1]
+
+        table = {}
+        catch_all = [c for c in consumers if c.EVENTS is None]
+        for consumer in consumers:
+            for event_id in consumer.EVENTS or []:
+                table.setdefault(event_id, [])
+        for event_id, routed in table.items():
+            routed += [c for c in consumers if c.EVENTS is None or event_id in c.EVENTS]
+        table[None] = catch_all
+
+        cls._routes = (consumers, table)
+        return table
+
+    def consumers_for(self, event):
+        routes = self.routes()
+        return routes.get(event.id, routes[None])
+
     def consume(self, event):
-        for consumer in self.EVENT_CONSUMERS:
-            try:
-                if consumer.consumes(event):
-                    consumer.consume(event)
-            except Exception as e:
-                app.logger.error("Error in consumer {x}: {e}".format(e=str(e), x=consumer.ID))
+        consumers = self.consumers_for(event)
+        workers = app.config.get("EVENT_CONSUMER_THREADS", 1)
+        if workers <= 1 or len(consumers) <= 1:
+            for consumer in consumers:
+                self._consume_with(consumer, event)
+            return
+
+        # run the consumers in parallel, but wait for them all to finish
+        run = self._consume_with
+        if has_request_context():
+            run = copy_current_request_context(run)
+        executor = self._get_executor(workers)
+        futures = [executor.submit(run, consumer, event) for consumer in consumers]
+        for f in futures:
+            f.result()
+
+    def _consume_with(self, consumer, event):
+        start = time.perf_counter()
+        try:
+            if consumer.consumes(event):
+                consumer.consume(event)
+        except Exception as e:
+            app.logger.error("Error in consumer {x}: {e}".format(e=str(e), x=consumer.ID))
+        finally:
+            self._record_timing(consumer.ID, time.perf_counter() - start)
+
+    @classmethod
+    def _get_executor(cls, workers):
+        with cls._executor_lock:
+            if cls._executor is None or cls._executor._max_workers != workers:
+                if cls._executor is not None:
+                    cls._executor.shutdown(wait=False)
+                cls._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="event-consumer")
+            return cls._executor
+
+    @classmethod
+    def _record_timing(cls, consumer_id, seconds):
+        with cls._timings_lock:
+            t = cls._timings.setdefault(consumer_id, {"count": 0, "total": 0.0, "max": 0.0})
+            t["count"] += 1
+            t["total"] += seconds
+            t["max"] = max(t["max"], seconds)
+        app.logger.debug("Event consumer {x} took {t:.3f}s".format(x=consumer_id, t=seconds))
+
+    @classmethod
+    def consumer_timings(cls):
+        """
+        :return: dict of consumer id -> {"count": events offered, "total": seconds, "max": seconds, "mean": seconds}
+        """
+        with cls._timings_lock:
+            return {k: dict(v, mean=v["total"] / v["count"]) for k, v in cls._timings.items()}
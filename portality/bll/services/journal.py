@@ -1,7 +1,7 @@
 import logging
 
 from portality.lib.argvalidate import argvalidate
-from portality.lib import dates
+from portality.lib import dates, seamless
 from portality import models, constants
 from portality.bll import exceptions
 from portality.core import app
@@ -207,10 +207,12 @@ class JournalService(object):
             self._make_journals_csv(f, extra_cols)
 
     @staticmethod
-    def _make_journals_csv(file_object, additional_columns=None):
+    def _make_journals_csv(file_object, additional_columns=None, batch_size=500):
         """
         Make a CSV file of information for all journals.
         :param file_object: a utf8 encoded file object.
+        :param additional_columns: functions which take a journal and return extra (key, value) pairs for its row
+        :param batch_size: the number of journals to retrieve, and get the article stats for, in each request
         """
         YES_NO = {True: 'Yes', False: 'No', None: '', '': ''}
 
@@ -232,8 +234,7 @@ class JournalService(object):
         def _get_doaj_toc_kv(journal):
             return "URL in DOAJ", app.config.get('JOURNAL_TOC_URL_FRAG', 'https://doaj.org/toc/') + journal.id
 
-        def _get_article_kvs(journal):
-            stats = journal.article_stats()
+        def _get_article_kvs(stats):
             kvs = [
                 ("Number of Article Records", str(stats.get("total"))),
                 ("Most Recent Article Added", stats.get("latest"))
@@ -241,38 +242,45 @@ class JournalService(object):
             return kvs
 
         # ~~!JournalCSV:Feature->Journal:Model~~
-        cols = {}
-        for j in models.Journal.all_in_doaj(page_size=1000):     #Fixme: limited by ES, this may not be sufficient
-            bj = j.bibjson()
-            issn = bj.get_one_identifier(idtype=bj.P_ISSN)
-            if issn is None:
-                issn = bj.get_one_identifier(idtype=bj.E_ISSN)
-            if issn is None:
+        # First find the ISSN that each journal is listed under, so that we can write the rows in order as we
+        # go, rather than holding every row in memory until the end
+        ids_by_issn = {}
+        for jid, pissn, eissn in models.Journal.issns_in_doaj():
+            issn = pissn if pissn else eissn
+            if not issn:
                 continue
-
-            # ~~!JournalCSV:Feature->JournalQuestions:Crosswalk~~
-            kvs = Journal2QuestionXwalk.journal2question(j)
-            meta_kvs = _get_doaj_meta_kvs(j)
-            article_kvs = _get_article_kvs(j)
-            additionals = []
-            if additional_columns is not None:
-                for col in additional_columns:
-                    additionals += col(j)
-            cols[issn] = kvs + meta_kvs + article_kvs + additionals
-
-            # Get the toc URL separately from the meta kvs because it needs to be inserted earlier in the CSV
-            # ~~-> ToC:WebRoute~~
-            toc_kv = _get_doaj_toc_kv(j)
-            cols[issn].insert(2, toc_kv)
-
-        issns = cols.keys()
+            ids_by_issn[issn] = jid
+        ordered_ids = [ids_by_issn[issn] for issn in sorted(ids_by_issn.keys())]
 
         csvwriter = csv.writer(file_object)
         qs = None
-        for i in sorted(issns):
-            if qs is None:
-                qs = [q for q, _ in cols[i]]
-                csvwriter.writerow(qs)
-            vs = [v for _, v in cols[i]]
-            csvwriter.writerow(vs)
+        for i in range(0, len(ordered_ids), batch_size):
+            # the journals are only read here, so there is no need to pass each of them through the struct
+            with seamless.lazy_construct():
+                journals = models.Journal.pull_many(ordered_ids[i:i + batch_size])
+
+            # get the article stats for the whole batch of journals in one request
+            stats = models.Journal.article_stats_for_journals(journals)
+
+            for j in journals:
+                # ~~!JournalCSV:Feature->JournalQuestions:Crosswalk~~
+                kvs = Journal2QuestionXwalk.journal2question(j)
+                meta_kvs = _get_doaj_meta_kvs(j)
+                article_kvs = _get_article_kvs(stats.get(j.id, {}))
+                additionals = []
+                if additional_columns is not None:
+                    for col in additional_columns:
+                        additionals += col(j)
+                row = kvs + meta_kvs + article_kvs + additionals
+
+                # Get the toc URL separately from the meta kvs because it needs to be inserted earlier in the CSV
+                # ~~-> ToC:WebRoute~~
+                toc_kv = _get_doaj_toc_kv(j)
+                row.insert(2, toc_kv)
+
+                if qs is None:
+                    qs = [q for q, _ in row]
+                    csvwriter.writerow(qs)
+                vs = [v for _, v in row]
+                csvwriter.writerow(vs)
 
@@ -64,12 +64,24 @@ class NotificationsService(object):
             return True
         return False
 
-    def mark_all_as_seen(self, account: models.Account=None, until: datetime=None):
+    def mark_all_as_seen(self, account: models.Account=None, until: datetime=None, background: bool=True):
+        """
+        Mark all the unseen notifications for the account (or for everyone), created up to until, as seen, in a
+        single update in the index.
+
+        :param background: run the update as an index task, rather than waiting on the request.  Use False for
+            updates to a single account made during a web request.
+        :return: the number of notifications marked as seen
+        """
         account_id = None if account is None else account.id
         q = NotificationsQuery(account_id, until, False)
-        for notification in models.Notification.scroll(q.query()):
-            notification.set_seen()
-            notification.save()
+        now = dates.now_str()
+        status = models.Notification.update_by_query(q.query(), NotificationsQuery.seen_script,
+                                                     params={"seen_date": now, "last_updated": now},
+                                                     background=background)
+        if status is None:
+            return 0
+        return status.get("updated", 0)
 
 
 class TopNotificationsQuery(object):
@@ -96,6 +108,8 @@ class TopNotificationsQuery(object):
 class NotificationsQuery(object):
     # ~~->$ Notifications:Query ~~
     # ~~^-> Elasticsearch:Technology ~~
+    seen_script = "ctx._source.seen_date = params.seen_date; ctx._source.last_updated = params.last_updated;"
+
     def __init__(self, account_id=None, until=None, seen=None):
         self._account_id = account_id
         self._until = until
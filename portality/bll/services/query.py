@@ -2,27 +2,57 @@ from portality.core import app, es_connection
 from portality.util import ipt_prefix
 from portality.bll import exceptions
 from portality.lib import plugin
-from copy import deepcopy
+import time
 
 import esprit
 
+# compiled query route pipelines, by the identity of the route config they were compiled from
+_pipelines = {}
+
+
+def compile_query_routes():
+    """
+    Compile every route in QUERY_ROUTE into its pipeline, so that requests don't have to.  Routes which can't be
+    compiled are logged, and raise their error when they are used.
+
+    ~~->Query:Config~~
+    """
+    for domain, routes in app.config.get("QUERY_ROUTE", {}).items():
+        for index_type, cfg in routes.items():
+            try:
+                get_pipeline(cfg)
+            except (exceptions.ConfigurationException, exceptions.NoSuchObjectException) as e:
+                app.logger.error("Unable to compile query route {d}/{t}: {x}".format(d=domain, t=index_type, x=e))
+
+
+def get_pipeline(cfg):
+    """
+    Get the compiled pipeline for a query route config, compiling it on first use, or if the config or the
+    QUERY_FILTERS it refers to have been replaced since it was compiled.
+    """
+    filters = app.config.get("QUERY_FILTERS", {})
+    pipeline = _pipelines.get(id(cfg))
+    if pipeline is None or pipeline.cfg is not cfg or pipeline.filters is not filters:
+        pipeline = QueryRoutePipeline(cfg, filters)
+        _pipelines[id(cfg)] = pipeline
+    return pipeline
+
 
 class QueryService(object):
     """
     ~~Query:Service~~
     """
+    def __init__(self):
+        # the time in seconds spent in each stage of the last search or scroll, for instrumentation
+        self.timings = {}
+
     def _get_config_for_search(self, domain, index_type, account):
         # load the query route config and the path we are being requested for
         # ~~-> Query:Config~~
         qrs = app.config.get("QUERY_ROUTE", {})
 
         # get the configuration for this url route
-        route_cfg = None
-        for key in qrs:
-            if domain == key:
-                route_cfg = qrs.get(key)
-                break
-
+        route_cfg = qrs.get(domain)
         if route_cfg is None:
             raise exceptions.AuthoriseException(exceptions.AuthoriseException.NOT_AUTHORISED)
 
@@ -43,116 +73,201 @@ class QueryService(object):
         return cfg
 
     def _validate_query(self, cfg, query):
-        validator = cfg.get("query_validator")
+        validator = get_pipeline(cfg).validator
         if validator is None:
             return True
-
-        filters = app.config.get("QUERY_FILTERS", {})
-        validator_path = filters.get(validator)
-        fn = plugin.load_function(validator_path)
-        if fn is None:
-            msg = "Unable to load query validator for {x}".format(x=validator)
-            raise exceptions.ConfigurationException(msg)
-
-        return fn(query)
+        return validator(query)
 
     def _pre_filter_search_query(self, cfg, query):
         # now run the query through the filters
-        filters = app.config.get("QUERY_FILTERS", {})
-        filter_names = cfg.get("query_filters", [])
-        for filter_name in filter_names:
-            # because of back-compat, we have to do a few tricky things here...
-            # filter may be the name of a filter in the list of query filters
-            fn = plugin.load_function(filters.get(filter_name))
-            if fn is None:
-                msg = "Unable to load query filter for {x}".format(x=filter_name)
-                raise exceptions.ConfigurationException(msg)
-
-            # run the filter
+        for filter_name, fn in get_pipeline(cfg).query_filters:
             fn(query)
-
         return query
 
-    def _post_filter_search_results(self, cfg, res, unpacked=False):
-        filters = app.config.get("QUERY_FILTERS", {})
-        result_filter_names = cfg.get("result_filters", [])
-        for result_filter_name in result_filter_names:
-            fn = plugin.load_function(filters.get(result_filter_name))
-            if fn is None:
-                msg = "Unable to load result filter for {x}".format(x=result_filter_name)
-                raise exceptions.ConfigurationException(msg)
+    def _post_filter_search_results(self, cfg, res, unpacked=False, skip=None):
+        for result_filter_name, fn in get_pipeline(cfg).result_filters:
+            # skip any filters which ES has already applied through source filtering
+            if skip is not None and result_filter_name in skip:
+                continue
 
             # apply the result filter
             res = fn(res, unpacked=unpacked)
 
         return res
 
+    def _get_source_filter(self, cfg):
+        return get_pipeline(cfg).source_filter
+
+    def _apply_source_filter(self, cfg, query):
+        """
+        Push the route's source filter into the query, so that ES only returns the fields it allows.
+
+        :return: the names of the result filters which no longer need to run on the results
+        """
+        source_filter = self._get_source_filter(cfg)
+        if source_filter is None or not source_filter.apply(query):
+            return frozenset()
+        return source_filter.replaces
+
     def _get_query(self, cfg, raw_query):
         query = Query()
         if raw_query is not None:
             query = Query(raw_query)
 
         # validate the query, to make sure it is of a permitted form
-        if not self._validate_query(cfg, query):
-            raise exceptions.AuthoriseException()
+        with self._timed("validate"):
+            if not self._validate_query(cfg, query):
+                raise exceptions.AuthoriseException()
 
         # add any required filters to the query
-        query = self._pre_filter_search_query(cfg, query)
+        with self._timed("query_filters"):
+            query = self._pre_filter_search_query(cfg, query)
         return query
 
     def _get_dao_klass(self, cfg):
-        # get the name of the model that will handle this query, and then look up
-        # the class that will handle it
-        dao_name = cfg.get("dao")
-        dao_klass = plugin.load_class(dao_name)
-        if dao_klass is None:
-            raise exceptions.NoSuchObjectException(dao_name)
-        return dao_klass
+        return get_pipeline(cfg).dao_klass
+
+    def _timed(self, stage):
+        return StageTimer(self.timings, stage)
 
     def search(self, domain, index_type, raw_query, account, additional_parameters):
+        self.timings = {}
         cfg = self._get_config_for_search(domain, index_type, account)
+        pipeline = get_pipeline(cfg)
 
         # check that the request values permit a query to this endpoint
-        required_parameters = cfg.get("required_parameters")
-        if required_parameters is not None:
-            for k, vs in required_parameters.items():
-                val = additional_parameters.get(k)
-                if val is None or val not in vs:
-                    raise exceptions.AuthoriseException()
-
-        dao_klass = self._get_dao_klass(cfg)
+        if not pipeline.permits(additional_parameters):
+            raise exceptions.AuthoriseException()
 
         # get the query
         query = self._get_query(cfg, raw_query)
+        skip = self._apply_source_filter(cfg, query)
 
         # send the query
-        res = dao_klass.query(q=query.as_dict())
+        with self._timed("query"):
+            res = pipeline.dao_klass.query(q=query.as_dict())
 
         # filter the results as needed
-        res = self._post_filter_search_results(cfg, res)
+        with self._timed("result_filters"):
+            res = self._post_filter_search_results(cfg, res, skip=skip)
 
         return res
 
-    def scroll(self, domain, index_type, raw_query, account, page_size, scan=False):
+    def scroll(self, domain, index_type, raw_query, account, page_size, scan=False, slice_id=None, slice_max=None):
+        self.timings = {}
         cfg = self._get_config_for_search(domain, index_type, account)
-
-        dao_klass = self._get_dao_klass(cfg)
+        pipeline = get_pipeline(cfg)
 
         # get the query
         query = self._get_query(cfg, raw_query)
+        skip = self._apply_source_filter(cfg, query)
+
+        # if requested, only scroll over one slice of the results, so that several scrolls can run in parallel
+        if slice_id is not None and slice_max is not None and slice_max > 1:
+            query.set_slice(slice_id, slice_max)
 
         # get the scroll parameters
         if page_size is None:
-            page_size = cfg.get("page_size", 1000)
-        limit = cfg.get("limit", None)
-        keepalive = cfg.get("keepalive", "1m")
+            page_size = pipeline.page_size
 
         # ~~->Elasticsearch:Technology~~
-        for result in dao_klass.iterate(q=query.as_dict(), page_size=page_size, limit=limit, wrap=False, keepalive=keepalive):
-            res = self._post_filter_search_results(cfg, result, unpacked=True)
+        for result in pipeline.dao_klass.iterate(q=query.as_dict(), page_size=page_size, limit=pipeline.limit,
+                                                 wrap=False, keepalive=pipeline.keepalive):
+            with self._timed("result_filters"):
+                res = self._post_filter_search_results(cfg, result, unpacked=True, skip=skip)
             yield res
 
 
+class QueryRoutePipeline(object):
+    """
+    ~~QueryRoutePipeline:Query~~
+
+    A query route's config compiled into the stages a query goes through: the validator, the ordered query filters,
+    the source filter, the DAO which runs the query and the ordered result filters.  Pipelines are shared between
+    requests, so they can't be changed once compiled.
+    """
+    def __init__(self, cfg, filters):
+        def _set(name, value):
+            object.__setattr__(self, name, value)
+
+        _set("cfg", cfg)
+        _set("filters", filters)
+
+        validator = cfg.get("query_validator")
+        validator_fn = None
+        if validator is not None:
+            validator_fn = plugin.load_function(filters.get(validator))
+            if validator_fn is None:
+                msg = "Unable to load query validator for {x}".format(x=validator)
+                raise exceptions.ConfigurationException(msg)
+        _set("validator", validator_fn)
+
+        _set("query_filters", self._load_filters(cfg.get("query_filters", []), filters, "query filter"))
+        _set("result_filters", self._load_filters(cfg.get("result_filters", []), filters, "result filter"))
+
+        source_filter = cfg.get("source_filter")
+        _set("source_filter", SourceFilter(source_filter) if source_filter is not None else None)
+
+        # get the name of the model that will handle this query, and then look up
+        # the class that will handle it
+        dao_name = cfg.get("dao")
+        dao_klass = plugin.load_class(dao_name)
+        if dao_klass is None:
+            raise exceptions.NoSuchObjectException(dao_name)
+        _set("dao_klass", dao_klass)
+
+        required_parameters = cfg.get("required_parameters")
+        if required_parameters is not None:
+            required_parameters = tuple((k, frozenset(vs)) for k, vs in required_parameters.items())
+        _set("required_parameters", required_parameters)
+
+        _set("page_size", cfg.get("page_size", 1000))
+        _set("limit", cfg.get("limit", None))
+        _set("keepalive", cfg.get("keepalive", "1m"))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Query route pipelines can't be changed once compiled")
+
+    @staticmethod
+    def _load_filters(names, filters, kind):
+        loaded = []
+        for name in names:
+            # because of back-compat, we have to do a few tricky things here...
+            # filter may be the name of a filter in the list of query filters
+            fn = plugin.load_function(filters.get(name))
+            if fn is None:
+                msg = "Unable to load {k} for {x}".format(k=kind, x=name)
+                raise exceptions.ConfigurationException(msg)
+            loaded.append((name, fn))
+        return tuple(loaded)
+
+    def permits(self, additional_parameters):
+        """ check that the request values permit a query to this endpoint """
+        if self.required_parameters is None:
+            return True
+        for k, vs in self.required_parameters:
+            val = additional_parameters.get(k)
+            if val is None or val not in vs:
+                return False
+        return True
+
+
+class StageTimer(object):
+    """ Context manager which adds the time spent in a stage to a dict of timings """
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.timings[self.stage] = self.timings.get(self.stage, 0) + time.perf_counter() - self.start
+        return False
+
+
 class Query(object):
     """
     ~~Query:Query -> Elasticsearch:Technology~~
@@ -173,8 +288,8 @@ class Query(object):
         if "query" in self.q:
             if "bool" in self.q["query"]:
                 return
-            current_query = deepcopy(self.q["query"])
-            del self.q["query"]
+            # the query is moved rather than copied, as nothing else refers to it
+            current_query = self.q.pop("query")
             if len(list(current_query.keys())) == 0:
                 current_query = None
 
@@ -259,6 +374,43 @@ class Query(object):
     def set_sort(self, s):
         self.q["sort"] = s
 
+    def set_slice(self, slice_id, slice_max):
+        self.q["slice"] = {"id": slice_id, "max": slice_max}
+
+
+class SourceFilter(object):
+    """
+    ~~SourceFilter:Query->Elasticsearch:Technology~~
+
+    The field-level includes and excludes for a query route, compiled from the route's "source_filter" config
+    into the _source filtering of the ES request.  The config may also list the result filters which the source
+    filter "replaces", which only need to run on the results if the source filter could not be applied.
+    """
+    def __init__(self, rules):
+        self.rules = rules
+        self.includes = sorted(set(rules.get("includes", [])))
+        self.excludes = sorted(set(rules.get("excludes", [])))
+        self.replaces = frozenset(rules.get("replaces", []))
+
+    def apply(self, query):
+        """
+        Set the query's _source filtering, unless the query already has some of its own which we can't combine
+        with ours, in which case the result filters must run instead.
+
+        :return: whether the source filter was applied
+        """
+        q = query.as_dict()
+        if "_source" in q or (len(self.includes) == 0 and len(self.excludes) == 0):
+            return False
+
+        source = {}
+        if len(self.includes) > 0:
+            source["includes"] = list(self.includes)
+        if len(self.excludes) > 0:
+            source["excludes"] = list(self.excludes)
+        q["_source"] = source
+        return True
+
 
 class QueryFilterException(Exception):
     pass
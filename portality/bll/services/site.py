@@ -1,3 +1,4 @@
+import itertools
 import re
 from datetime import datetime
 
@@ -13,6 +14,7 @@ from portality.store import StoreFactory, prune_container
 from portality.util import get_full_url_safe
 
 NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+NSMAP = {None: "http://www.sitemaps.org/schemas/sitemap/0.9"}
 
 
 def create_simple_sub_element(parent, element_name, text=None):
@@ -37,10 +39,61 @@ def create_url_element(parent, loc, change_freq, lastmod=None):
     return url_ele
 
 
+def write_simple_element(xf, element_name, text):
+    """ write simple text element to the incremental xml writer *xf*
+    """
+    with xf.element(NS + element_name):
+        xf.write(text)
+
+
+def write_urlset(path, entries):
+    """ stream (loc, change_freq, lastmod) *entries* into a sitemap file at *path*, without holding the
+    tree in memory. Returns the number of urls written
+    """
+    count = 0
+    with etree.xmlfile(path, encoding="UTF-8") as xf:
+        xf.write_declaration()
+        with xf.element(NS + "urlset", nsmap=NSMAP):
+            xf.write("\n")
+            for loc, change_freq, lastmod in entries:
+                with xf.element(NS + "url"):
+                    write_simple_element(xf, "loc", loc)
+                    if lastmod is not None:
+                        write_simple_element(xf, "lastmod", lastmod)
+                    write_simple_element(xf, "changefreq", change_freq)
+                xf.write("\n")
+                count += 1
+    return count
+
+
+def write_sitemap_index(path, sitemaps):
+    """ write a sitemap index at *path* listing the (loc, lastmod) *sitemaps*
+    """
+    with etree.xmlfile(path, encoding="UTF-8") as xf:
+        xf.write_declaration()
+        with xf.element(NS + "sitemapindex", nsmap=NSMAP):
+            xf.write("\n")
+            for loc, lastmod in sitemaps:
+                with xf.element(NS + "sitemap"):
+                    write_simple_element(xf, "loc", loc)
+                    if lastmod is not None:
+                        write_simple_element(xf, "lastmod", lastmod)
+                xf.write("\n")
+
+
 class SiteService(object):
-    def sitemap(self, prune: bool = True):
+    def sitemap(self, prune: bool = True, include_articles: bool = None, incremental: bool = False):
         """
-        Generate the sitemap
+        Generate the sitemap.
+
+        Urls are streamed into sitemap files of at most SITEMAP_MAX_URLS entries each.  If they all fit into
+        one file, that is the sitemap, otherwise the sitemap is an index of the individual files.
+
+        Article pages are grouped into files by the month the article was created.  If incremental, only the
+        months containing articles changed since the last run are regenerated, and the files for the other
+        months are reused, unless the last full regeneration was more than SITEMAP_FULL_REBUILD_DAYS ago.
+        Static pages and ToCs are always regenerated.
+
         ~~Sitemap:Feature~~
         :return:
         """
@@ -49,6 +102,9 @@ class SiteService(object):
             {"arg": prune, "allow_none": False, "arg_name": "prune"}
         ], exceptions.ArgumentException)
 
+        if include_articles is None:
+            include_articles = app.config.get("SITEMAP_INCLUDE_ARTICLES", False)
+
         action_register = []
 
         base_url = app.config.get("BASE_URL")
@@ -56,56 +112,79 @@ class SiteService(object):
             base_url += "/"
 
         # ~~-> FileStoreTemp:Feature~~
-        filename = 'sitemap__doaj_' + dates.now_str(FMT_DATETIME_SHORT) + '_utf8.xml'
+        generated = dates.now_str()
+        stamp = dates.now_str(FMT_DATETIME_SHORT)
+        filename = 'sitemap__doaj_' + stamp + '_utf8.xml'
         container_id = app.config.get("STORE_CACHE_CONTAINER")
         tmpStore = StoreFactory.tmp()
         out = tmpStore.path(container_id, filename, create_container=True, must_exist=False)
 
+        # ~~->FileStore:Feature~~
+        mainStore = StoreFactory.get("cache")
+
         toc_changefreq = app.config.get("TOC_CHANGEFREQ", "monthly")
+        max_urls = app.config.get("SITEMAP_MAX_URLS", 50000)
 
-        NSMAP = {None: "http://www.sitemaps.org/schemas/sitemap/0.9"}
-        urlset = etree.Element(NS + "urlset", nsmap=NSMAP)
+        # ~~->Cache:Feature~~
+        previous = models.Cache.get_sitemap_record() if incremental else None
+        if previous is not None and not self._reusable(previous, include_articles):
+            previous = None
+        last_full = previous.get("last_full") if previous is not None else generated
 
-        counter = 0
+        # do the static pages and all the journal ToCs
+        parts = self._write_parts(tmpStore, container_id, stamp, "toc", self._toc_entries(base_url, toc_changefreq),
+                                  max_urls, generated)
 
-        # do the static pages
-        _entries = nav.get_nav_entries()
-        _routes = nav.yield_all_route(_entries)
-        _urls = (get_full_url_safe(r) for r in _routes)
-        _urls = filter(None, _urls)
-        _urls = set(_urls)
-        _urls = sorted(_urls)
-        for u in _urls:
-            create_url_element(urlset, u, toc_changefreq)
-            counter += 1
+        # do the articles, reusing the files for any months which have not changed
+        if include_articles:
+            article_changefreq = app.config.get("ARTICLE_CHANGEFREQ", "yearly")
+            if previous is None:
+                months = itertools.groupby(models.Article.sitemap_entries(), key=lambda a: a.get("created_date", "")[:7])
+            else:
+                changed = models.Article.created_months_changed_since(previous.get("generated"))
+                months = [(m, models.Article.sitemap_entries(month=m)) for m in changed]
+                for part in previous.get("parts", []):
+                    if part.get("section") == "article" and part.get("month") not in changed:
+                        parts.append(part)
+                action_register.append("Regenerating article sitemaps for {x} changed months".format(x=len(changed)))
 
-        # do all the journal ToCs
-        for j in models.Journal.all_in_doaj():
-            # first create an entry purely for the journal
-            toc_loc = base_url + "toc/" + j.toc_id
-            create_url_element(urlset, toc_loc, toc_changefreq, lastmod=j.last_updated)
-            counter += 1
+            for month, articles in months:
+                entries = ((base_url + "article/" + a["id"], article_changefreq, a.get("last_updated")) for a in articles)
+                parts += self._write_parts(tmpStore, container_id, stamp, "article", entries, max_urls, generated,
+                                           month=month)
 
         # log to the screen
+        counter = sum([p.get("count", 0) for p in parts])
         action_register.append("{x} urls written to sitemap".format(x=counter))
 
-        # save it into the temp store
-        tree = etree.ElementTree(urlset)
-        with open(out, "wb") as f:
-            tree.write(f, encoding="UTF-8", xml_declaration=True, pretty_print=True)
-
-        # ~~->FileStore:Feature~~
-        mainStore = StoreFactory.get("cache")
+        new_parts = [p for p in parts if "path" in p]
         try:
+            if len(parts) <= 1 and len(new_parts) == len(parts):
+                # everything fits into a single file, which is the sitemap itself
+                if len(parts) == 0:
+                    write_urlset(out, [])
+                else:
+                    out = new_parts[0]["path"]
+                parts = []
+            else:
+                for part in new_parts:
+                    mainStore.store(container_id, part["filename"], source_path=part["path"])
+                parts = [{k: v for k, v in p.items() if k != "path"} for p in parts]
+                parts.sort(key=lambda p: (p.get("section") != "toc", p.get("month") or ""))
+                write_sitemap_index(out, [(base_url + p["filename"], p.get("lastmod")) for p in parts])
+                action_register.append("Sitemap index written for {x} sitemap files".format(x=len(parts)))
+
             mainStore.store(container_id, filename, source_path=out)
             url = mainStore.url(container_id, filename)
         finally:
-            tmpStore.delete_file(container_id,
-                                 filename)  # don't delete the container, just in case someone else is writing to it
+            # don't delete the container, just in case someone else is writing to it
+            tmpStore.delete_file(container_id, filename)
+            for part in new_parts:
+                tmpStore.delete_file(container_id, part["filename"])
 
         action_register.append("Sitemap written to store with url {x}".format(x=url))
 
-        # remove all but the two latest sitemaps
+        # remove all but the two latest sitemaps, and any files which neither of them refer to
         if prune:
             def sort(filelist):
                 rx = "sitemap__doaj_(.+?)_utf8.xml"
@@ -118,7 +197,65 @@ class SiteService(object):
 
             action_register += prune_container(mainStore, container_id, sort, filter=_filter, keep=2)
 
+            # the cache still refers to the previous sitemap at this point
+            keep_parts = set([p["filename"] for p in parts])
+            last_sitemap = models.Cache.get_sitemap_record()
+            if last_sitemap is not None:
+                keep_parts.update([p.get("filename") for p in last_sitemap.get("parts") or []])
+            unused = [fn for fn in mainStore.list(container_id) if fn.startswith("sitemap_part__") and fn not in keep_parts]
+            for fn in unused:
+                mainStore.delete_file(container_id, fn)
+            if len(unused) > 0:
+                action_register.append("Removed unused sitemap files: " + ", ".join(unused))
+
         # update the ES record to point to the new file
         # ~~->Cache:Feature~~
-        models.Cache.cache_sitemap(url)
+        if len(parts) > 0:
+            models.Cache.cache_sitemap(url, parts=parts, generated=generated, last_full=last_full)
+        else:
+            models.Cache.cache_sitemap(url)
         return url, action_register
+
+    def _reusable(self, previous, include_articles):
+        if not include_articles or previous.get("generated") is None or previous.get("last_full") is None:
+            return False
+        max_age = app.config.get("SITEMAP_FULL_REBUILD_DAYS", 7)
+        return dates.now() < dates.days_after(dates.parse(previous.get("last_full")), max_age)
+
+    def _toc_entries(self, base_url, toc_changefreq):
+        # do the static pages
+        _entries = nav.get_nav_entries()
+        _routes = nav.yield_all_route(_entries)
+        _urls = (get_full_url_safe(r) for r in _routes)
+        _urls = filter(None, _urls)
+        _urls = set(_urls)
+        _urls = sorted(_urls)
+        for u in _urls:
+            yield u, toc_changefreq, None
+
+        # do all the journal ToCs
+        for j in models.Journal.all_in_doaj(lazy=True):
+            # first create an entry purely for the journal
+            toc_loc = base_url + "toc/" + j.toc_id
+            yield toc_loc, toc_changefreq, j.last_updated
+
+    def _write_parts(self, tmpStore, container_id, stamp, section, entries, max_urls, generated, month=None):
+        """ stream the *entries* into as many sitemap files of at most *max_urls* as are needed
+        """
+        label = section if month is None else section + "_" + month
+        parts = []
+        entries = iter(entries)
+        while True:
+            first = next(entries, None)
+            if first is None:
+                break
+
+            filename = "sitemap_part__doaj_{s}_{l}_{n}_utf8.xml".format(s=stamp, l=label, n=len(parts) + 1)
+            path = tmpStore.path(container_id, filename, create_container=True, must_exist=False)
+            count = write_urlset(path, itertools.chain([first], itertools.islice(entries, max_urls - 1)))
+
+            part = {"filename": filename, "path": path, "section": section, "count": count, "lastmod": generated}
+            if month is not None:
+                part["month"] = month
+            parts.append(part)
+        return parts
@@ -1,4 +1,5 @@
 from portality.lib.argvalidate import argvalidate
+from portality.lib import seamless
 from portality import models
 from portality.bll import exceptions
 from portality import constants
@@ -16,10 +17,11 @@ class TodoService(object):
         #~~-> Account:Model ~~
         stats["editors"] = {}
         editors = [eg.editor] + eg.associates
+        emails = {acc.get("id"): acc.get("email") for acc in
+                  models.Account.pull_many(editors, wrap=False, fields=["id", "email"])}
         for editor in editors:
-            acc = models.Account.pull(editor)
             stats["editors"][editor] = {
-                    "email" : None if acc is None else acc.email
+                    "email" : emails.get(editor)
                 }
 
         q = GroupStatsQuery(eg.name)
@@ -83,9 +85,12 @@ class TodoService(object):
             queries.append(TodoRules.maned_completed(size, maned_of))
             queries.append(TodoRules.maned_assign_pending(size, maned_of))
 
+        # run all the rules in one request, retrieving only the fields needed for the todo list
         todos = []
-        for aid, q, sort, boost in queries:
-            applications = models.Application.object_query(q=q.query())
+        responses = models.Application.msearch([q.query() for aid, q, sort, boost in queries])
+        for (aid, q, sort, boost), resp in zip(queries, responses):
+            hits = resp.get("hits", {}).get("hits", [])
+            applications = [seamless.construct_lazily(models.Application, **h.get("_source")) for h in hits]
             for ap in applications:
                 todos.append({
                     "date": ap.last_manual_update_timestamp if sort == "last_manual_update" else ap.created_timestamp,
@@ -207,6 +212,19 @@ class TodoQuery(object):
     lmu_sort = {"last_manual_update" : {"order" : "asc"}}
     cd_sort = {"created_date" : {"order" : "asc"}}
 
+    # the fields of the application which the todo list shows
+    fields = [
+        "id",
+        "created_date",
+        "last_manual_update",
+        "bibjson.title",
+        "admin.application_status",
+        "admin.application_type",
+        "admin.current_journal",
+        "admin.editor_group",
+        "admin.editor"
+    ]
+
     def __init__(self, musts=None, must_nots=None, sort="last_manual_update", size=10):
         self._musts = [] if musts is None else musts
         self._must_nots = [] if must_nots is None else must_nots
@@ -225,7 +243,8 @@ class TodoQuery(object):
             "sort" : [
                 sort
             ],
-            "size" : self._size
+            "size" : self._size,
+            "_source" : {"includes" : self.fields}
         }
         return q
 
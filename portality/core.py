@@ -28,7 +28,7 @@ def load_account_for_login_manager(userid):
     :return:
     """
     from portality import models
-    out = models.Account.pull(userid)
+    out = models.Account.pull_cached(userid)
     return out
 
 
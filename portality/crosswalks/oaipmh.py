@@ -30,6 +30,14 @@ class OAI_Crosswalk(object):
     def header(self, record):
         raise NotImplementedError()
 
+    def serialise_record(self, record):
+        """ the complete <record> for *record*, with its header and metadata, serialised as a standalone fragment
+        """
+        r = etree.Element(self.PMH + "record", nsmap={None: self.PMH_NAMESPACE, "xsi": self.XSI_NAMESPACE})
+        r.append(self.header(record))
+        r.append(self.crosswalk(record))
+        return etree.tostring(r, xml_declaration=False, encoding="UTF-8")
+
     def _generate_header_subjects(self, parent_element, subjects):
         if subjects is None:
             subjects = []
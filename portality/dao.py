@@ -1,6 +1,7 @@
 import time
 import re
 import sys
+import threading
 import uuid
 import json
 import elasticsearch
@@ -22,6 +23,9 @@ from portality.lib.dates import FMT_DATETIME_STD
 ES_MAPPING_MISSING_REGEX = re.compile(r'.*No mapping found for \[[a-zA-Z0-9-_\.]+?\] in order to sort on.*', re.DOTALL)
 CONTENT_TYPE_JSON = {'Content-Type': 'application/json'}
 
+# the bulk writers which are currently intercepting saves, per thread
+_bulk_writers = threading.local()
+
 
 class ElasticSearchWriteException(Exception):
     pass
@@ -132,7 +136,7 @@ class DomainObject(UserDict, object):
         :param retries:
         :param back_off_factor:
         :param differentiate:
-        :param blocking:
+        :param blocking: do not return until the record is visible to searches, according to ES_VISIBILITY_POLICY
         :return:
         """
         if app.config.get("READ_ONLY_MODE", False) and app.config.get("SCRIPTS_READ_ONLY_MODE", False):
@@ -145,13 +149,12 @@ class DomainObject(UserDict, object):
         if app.config.get("ES_BLOCK_WAIT_OVERRIDE") is not None:
             block_wait = app.config["ES_BLOCK_WAIT_OVERRIDE"]
 
-        if 'id' not in self.data:
-            self.data['id'] = self.makeid()
-
-        self.data['es_type'] = self.__type__
+        # only polling needs the new last_updated to differ from the old one to tell when the save is visible
+        policy = self.visibility_policy()
+        poll = blocking and policy == "poll"
 
         now = dates.now_str()
-        if (blocking or differentiate) and "last_updated" in self.data:
+        if (poll or differentiate) and "last_updated" in self.data:
             diff = dates.now() - dates.parse(self.data["last_updated"])
 
             # we need the new last_updated time to be later than the new one
@@ -159,17 +162,25 @@ class DomainObject(UserDict, object):
                 soon = dates.now() + timedelta(seconds=1)
                 now = soon.strftime(FMT_DATETIME_STD)
 
-        self.data['last_updated'] = now
+        self.prep_for_save(now)
 
-        if 'created_date' not in self.data:
-            self.data['created_date'] = now
+        # if a bulk writer is active, leave the write to it.  Blocking saves must be visible on return, so go
+        # directly to the index, after anything already buffered to preserve the order of writes
+        writer = BulkWriter.active()
+        if writer is not None:
+            if not blocking:
+                writer.add(self)
+                return
+            writer.flush()
 
         attempt = 0
         d = json.dumps(self.data)
         r = None
+        refresh = "wait_for" if blocking and policy == "wait_for" else None
         while attempt <= retries:
             try:
-                r = ES.index(self.index_name(), d, doc_type=self.doc_type(), id=self.data.get("id"), headers=CONTENT_TYPE_JSON)
+                r = ES.index(self.index_name(), d, doc_type=self.doc_type(), id=self.data.get("id"), headers=CONTENT_TYPE_JSON,
+                             refresh=refresh)
                 break
 
             except (elasticsearch.ConnectionError, elasticsearch.ConnectionTimeout):
@@ -200,7 +211,10 @@ class DomainObject(UserDict, object):
                 "id {id} failed to save.".format(
                     attempts=attempt, id=self.data['id']))
 
-        if blocking:
+        if blocking and policy == "refresh":
+            self.refresh()
+
+        if poll:
             bq = BlockQuery(self.id)
             while True:
                 res = self.query(q=bq.query())
@@ -218,6 +232,28 @@ class DomainObject(UserDict, object):
 
         return r
 
+    def prep_for_save(self, now=None):
+        """
+        Set the id, type and timestamps on the record exactly as save() would, without writing it to the index.
+        Use this before sending the record's data to the index by some other route, such as a bulk request.
+
+        :param now: the timestamp to use for last_updated (and created_date, if not already set)
+        :return: the last_updated timestamp which was applied
+        """
+        if 'id' not in self.data:
+            self.data['id'] = self.makeid()
+
+        self.data['es_type'] = self.__type__
+
+        if now is None:
+            now = dates.now_str()
+        self.data['last_updated'] = now
+
+        if 'created_date' not in self.data:
+            self.data['created_date'] = now
+
+        return now
+
     def delete(self):
         if app.config.get("READ_ONLY_MODE", False) and app.config.get("SCRIPTS_READ_ONLY_MODE", False):
             app.logger.warn("System is in READ-ONLY mode, delete command cannot run")
@@ -298,6 +334,22 @@ class DomainObject(UserDict, object):
         return [i.get("_source") if "_source" in i else i.get("fields") for i in
                 res.get('hits', {}).get('hits', [])]
 
+    @classmethod
+    def bulk_writer(cls, max_docs=None, max_bytes=None, retries=0, back_off_factor=1, refresh=False, req_timeout=None):
+        """
+        Buffer the save() calls of every DomainObject made within this context, and send them to the index
+        in bulk requests, e.g.
+
+            with Article.bulk_writer() as writer:
+                for article in articles:
+                    article.save()
+            print(writer.failures)
+
+        See BulkWriter for the arguments.
+        """
+        return BulkWriter(max_docs=max_docs, max_bytes=max_bytes, retries=retries, back_off_factor=back_off_factor,
+                          refresh=refresh, req_timeout=req_timeout)
+
     @classmethod
     def bulk_delete(cls, id_list, idkey='id', refresh=False):
         return cls.bulk(documents=[{'id': i} for i in id_list], idkey=idkey, refresh=refresh, action='delete')
@@ -311,20 +363,49 @@ class DomainObject(UserDict, object):
         :param req_timeout: Request timeout for bulk operation
         :param kwargs: kwargs are passed into the bulk instruction for each record
         """
-        # ~~->ReadOnlyMode:Feature~~
-        if app.config.get("READ_ONLY_MODE", False) and app.config.get("SCRIPTS_READ_ONLY_MODE", False):
-            app.logger.warn("System is in READ-ONLY mode, bulk command cannot run")
-            return
-
         if action not in ['index', 'update', 'delete']:
             raise Exception("Unrecognised bulk action '{0}'".format(action))
 
         data = ''
         for d in documents:
             data += cls.to_bulk_single_rec(d, idkey=idkey, action=action, **kwargs)
-        resp = ES.bulk(body=data, index=cls.index_name(), doc_type=cls.doc_type(), refresh=refresh,
+        return cls.send_bulk(data, refresh=refresh, req_timeout=req_timeout)
+
+    @classmethod
+    def send_bulk(cls, data, refresh=False, req_timeout=10):
+        """
+        Send bulk instructions, as made by to_bulk_single_rec, to the index.  This allows different actions, or
+        different arguments for each record, to be mixed in one request.
+
+        :param data: the bulk request body
+        :param refresh: Refresh the index in each operation (make immediately available for search) - expensive!
+        :param req_timeout: Request timeout for bulk operation
+        """
+        # ~~->ReadOnlyMode:Feature~~
+        if app.config.get("READ_ONLY_MODE", False) and app.config.get("SCRIPTS_READ_ONLY_MODE", False):
+            app.logger.warn("System is in READ-ONLY mode, bulk command cannot run")
+            return
+
+        return ES.bulk(body=data, index=cls.index_name(), doc_type=cls.doc_type(), refresh=refresh,
                        request_timeout=req_timeout)
-        return resp
+
+    @staticmethod
+    def bulk_failures(resp):
+        """
+        Extract the per-document failures from the response to a bulk request
+
+        :param resp: the response from DomainObject.bulk
+        :return: a dict of document id -> error for every document which the index did not accept
+        """
+        failures = {}
+        if resp is None or not resp.get("errors", False):
+            return failures
+
+        for item in resp.get("items", []):
+            for action, result in item.items():
+                if "error" in result:
+                    failures[result.get("_id")] = result.get("error")
+        return failures
 
     @staticmethod
     def to_bulk_single_rec(record, idkey="id", action="index", **kwargs):
@@ -356,6 +437,17 @@ class DomainObject(UserDict, object):
             data += json.dumps(record) + '\n'
         return data
 
+    @classmethod
+    def visibility_policy(cls):
+        """
+        How to make writes visible to searches when blocking, from ES_VISIBILITY_POLICY: one of "wait_for", "refresh"
+        or "poll"
+        """
+        policy = app.config.get("ES_VISIBILITY_POLICY", "wait_for")
+        if policy not in ["wait_for", "refresh", "poll"]:
+            raise ValueError("Unrecognised ES_VISIBILITY_POLICY '{0}'".format(policy))
+        return policy
+
     @classmethod
     def refresh(cls):
         """
@@ -391,6 +483,35 @@ class DomainObject(UserDict, object):
 
         return cls(**out)
 
+    @classmethod
+    def pull_many(cls, ids, wrap=True, fields=None):
+        """
+        Retrieve several objects by id in a single request.
+
+        :param ids: list of ids to retrieve
+        :param wrap: whether to return model objects or the raw source
+        :param fields: if given, the list of source fields to retrieve, rather than the whole record
+        :return: list of the records found, in the same order as the ids.  Ids which don't exist are left out.
+        """
+        ids = [i for i in ids if i is not None and i != '']
+        if len(ids) == 0:
+            return []
+
+        kwargs = {}
+        if fields is not None:
+            kwargs["_source_includes"] = fields
+        try:
+            out = ES.mget(body={"ids": ids}, index=cls.index_name(), doc_type=cls.doc_type(), **kwargs)
+        except elasticsearch.TransportError as e:
+            raise Exception("ES returned an error: {x}".format(x=e.info))
+
+        records = []
+        for doc in out.get("docs", []):
+            if not doc.get("found", False):
+                continue
+            records.append(cls(**doc) if wrap else doc.get("_source"))
+        return records
+
     @classmethod
     def pull_by_key(cls, key, value):
         res = cls.query(q={"query": {"term": {key+app.config['FACET_FIELD']: value}}})
@@ -446,6 +567,29 @@ class DomainObject(UserDict, object):
             raise exception
         raise Exception("Couldn't get the ES query endpoint to respond.  Also, you shouldn't be seeing this.")
 
+    @classmethod
+    def msearch(cls, queries):
+        """
+        Send several queries in a single request.
+
+        :param queries: list of query objects
+        :return: list of the responses, in the same order as the queries
+        """
+        if len(queries) == 0:
+            return []
+
+        body = "".join([json.dumps({}) + "\n" + json.dumps(q) + "\n" for q in queries])
+        try:
+            out = ES.msearch(body=body, index=cls.index_name(), doc_type=cls.doc_type())
+        except elasticsearch.TransportError as e:
+            raise Exception("ES returned an error: {x}".format(x=e.info))
+
+        responses = out.get("responses", [])
+        for r in responses:
+            if "error" in r:
+                raise Exception("ES returned an error: {x}".format(x=json.dumps(r.get("error"))))
+        return responses
+
     @classmethod
     def remove_by_id(cls, id):
         if app.config.get("READ_ONLY_MODE", False) and app.config.get("SCRIPTS_READ_ONLY_MODE", False):
@@ -469,6 +613,64 @@ class DomainObject(UserDict, object):
         return ES.delete_by_query(cls.index_name(), json.dumps(query), doc_type=cls.doc_type())
 
 
+    @classmethod
+    def update_by_query(cls, query, script, params=None, conflicts="proceed", refresh=True, progress_callback=None,
+                        poll_interval=None, background=True):
+        """
+        Run a painless script in the index over every record which matches the query, without loading the records
+        here.  The update runs as an Elasticsearch task which is polled until it completes, unless background is
+        False, in which case the request waits for the update, which is better for small updates made in a request.
+
+        :param query: the query selecting the records to update
+        :param script: painless source, which may refer to the params
+        :param params: parameters for the script
+        :param conflicts: "proceed" to skip records which change during the update, or "abort"
+        :param refresh: refresh the index once the update is complete
+        :param progress_callback: called with the task status (total, updated, version_conflicts, etc) on each poll
+        :param poll_interval: seconds between checks on the task
+        :param background: run the update as a task and poll it, rather than waiting on the request
+        :return: the final status of the task, or None in read-only mode.  Raises ESError if any record failed to update
+        """
+        if app.config.get("READ_ONLY_MODE", False) and app.config.get("SCRIPTS_READ_ONLY_MODE", False):
+            app.logger.warn("System is in READ-ONLY mode, update_by_query command cannot run")
+            return
+
+        if poll_interval is None:
+            poll_interval = app.config.get("ES_UPDATE_BY_QUERY_POLL_INTERVAL", 2)
+
+        body = {
+            "query": query["query"],
+            "script": {"source": script, "lang": "painless", "params": params or {}}
+        }
+        if not background:
+            status = ES.update_by_query(cls.index_name(), json.dumps(body), doc_type=cls.doc_type(),
+                                        conflicts=conflicts, refresh=refresh)
+            if len(status.get("failures", [])) > 0:
+                raise ESError("Update by query failed: {x}".format(x=json.dumps(status.get("failures"))))
+            if progress_callback is not None:
+                progress_callback(status)
+            return status
+
+        resp = ES.update_by_query(cls.index_name(), json.dumps(body), doc_type=cls.doc_type(), conflicts=conflicts,
+                                  refresh=refresh, wait_for_completion=False, slices="auto")
+        task_id = resp.get("task")
+
+        while True:
+            task = ES.tasks.get(task_id=task_id)
+            if task.get("completed", False):
+                if "error" in task:
+                    raise ESError("Update by query task {x} failed: {y}".format(x=task_id, y=json.dumps(task.get("error"))))
+                status = task.get("response", {})
+                if len(status.get("failures", [])) > 0:
+                    raise ESError("Update by query task {x} failed: {y}".format(x=task_id, y=json.dumps(status.get("failures"))))
+                if progress_callback is not None:
+                    progress_callback(status)
+                return status
+
+            if progress_callback is not None:
+                progress_callback(task.get("task", {}).get("status", {}))
+            time.sleep(poll_interval)
+
     @classmethod
     def destroy_index(cls):
         if app.config.get("READ_ONLY_MODE", False) and app.config.get("SCRIPTS_READ_ONLY_MODE", False):
@@ -850,6 +1052,9 @@ class DomainObject(UserDict, object):
         if app.config.get("ES_BLOCK_WAIT_OVERRIDE") is not None:
             sleep = app.config["ES_BLOCK_WAIT_OVERRIDE"]
 
+        # unless we are polling, refresh the index once if the record is not yet visible, rather than waiting for it
+        refreshed = cls.visibility_policy() == "poll"
+
         q = BlockQuery(id)
         start_time = dates.now()
         while True:
@@ -871,18 +1076,51 @@ class DomainObject(UserDict, object):
                 if (dates.now() - start_time).total_seconds() >= max_retry_seconds:
                     raise BlockTimeOutException("Attempting to block until record with id {id} appears in Elasticsearch, but this has not happened after {limit}".format(id=id, limit=max_retry_seconds))
 
+            if not refreshed:
+                cls.refresh()
+                refreshed = True
+                continue
+
             time.sleep(sleep)
 
     @classmethod
     def blockall(cls, ids_and_last_updateds, sleep=0.05, individual_max_retry_seconds=30):
+        ids_and_last_updateds = list(ids_and_last_updateds)
+        if cls.visibility_policy() != "poll" and len(ids_and_last_updateds) > 0:
+            # one refresh and a search for the whole batch, and only wait for any which are still not visible
+            cls.refresh()
+            ids_and_last_updateds = cls._not_yet_visible(ids_and_last_updateds)
+
         for id, lu in ids_and_last_updateds:
             cls.block(id, lu, sleep=sleep, max_retry_seconds=individual_max_retry_seconds)
 
+    @classmethod
+    def _not_yet_visible(cls, ids_and_last_updateds):
+        visible = {}
+        chunk_size = app.config.get("ES_TERMS_LIMIT", 1024)
+        for i in range(0, len(ids_and_last_updateds), chunk_size):
+            chunk = ids_and_last_updateds[i:i + chunk_size]
+            q = BlockQuery([id for id, _ in chunk])
+            res = cls.query(q=q.query())
+            for hit in res.get("hits", {}).get("hits", []):
+                lu = hit.get("fields", {}).get("last_updated", [])
+                visible[hit.get("_id")] = dates.parse(lu[0]) if len(lu) > 0 else None
+
+        remaining = []
+        for id, lu in ids_and_last_updateds:
+            if id not in visible:
+                remaining.append((id, lu))
+            elif lu is not None and (visible[id] is None or visible[id] < dates.parse(lu)):
+                remaining.append((id, lu))
+        return remaining
+
     @classmethod
     def blockdeleted(cls, id, sleep=0.5, max_retry_seconds=30):
         if app.config.get("ES_BLOCK_WAIT_OVERRIDE") is not None:
             sleep = app.config["ES_BLOCK_WAIT_OVERRIDE"]
 
+        refreshed = cls.visibility_policy() == "poll"
+
         q = BlockQuery(id)
         start_time = dates.now()
         while True:
@@ -896,6 +1134,11 @@ class DomainObject(UserDict, object):
                         "Attempting to block until record with id {id} deleted from Elasticsearch, but this has not happened after {limit}".format(
                             id=id, limit=max_retry_seconds))
 
+            if not refreshed:
+                cls.refresh()
+                refreshed = True
+                continue
+
             time.sleep(sleep)
 
     @classmethod
@@ -904,6 +1147,152 @@ class DomainObject(UserDict, object):
             cls.blockdeleted(id, sleep, individual_max_retry_seconds)
 
 
+class BulkWriter(object):
+    """
+    Write buffer for DomainObject.save().  While the writer's context is open, saves made on the same
+    thread are prepared as normal, but instead of being indexed one at a time they are buffered and sent
+    to the index in bulk requests once max_docs documents or max_bytes of data are waiting, and when the
+    context closes.
+
+    Failed requests are retried in the same way as save(), and documents rejected by the index for being
+    overloaded (429) are retried in the next attempt.  Any other per-document failures are logged and
+    collected in the `failures` dict of id -> error, rather than raised.
+
+    Blocking saves are not buffered: the buffer is flushed and the save goes directly to the index.
+
+    Deletes can be sent through the same buffer with delete().
+
+    ~~->ReadOnlyMode:Feature~~
+    """
+    def __init__(self, max_docs=None, max_bytes=None, retries=0, back_off_factor=1, refresh=False, req_timeout=None):
+        self.max_docs = max_docs if max_docs is not None else app.config.get("ES_BULK_WRITER_MAX_DOCS", 500)
+        self.max_bytes = max_bytes if max_bytes is not None else app.config.get("ES_BULK_WRITER_MAX_BYTES", 5 * 1024 * 1024)
+        self.retries = min(retries, app.config.get("ES_RETRY_HARD_LIMIT", 1000))
+        self.back_off_factor = back_off_factor
+        self.refresh = refresh
+        self.req_timeout = req_timeout if req_timeout is not None else app.config.get("ES_BULK_WRITER_TIMEOUT", 60)
+
+        self.saved = 0
+        self.deleted = 0
+        self.failures = {}
+        self._buffer = []
+        self._bytes = 0
+
+    @classmethod
+    def active(cls):
+        stack = getattr(_bulk_writers, "stack", None)
+        return stack[-1] if stack else None
+
+    def __enter__(self):
+        if getattr(_bulk_writers, "stack", None) is None:
+            _bulk_writers.stack = []
+        _bulk_writers.stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _bulk_writers.stack.remove(self)
+        try:
+            self.flush()
+        except Exception:
+            # don't hide the exception which closed the context
+            if exc_type is None:
+                raise
+            app.logger.exception("Unable to flush bulk writer after an error")
+        return False
+
+    def add(self, obj):
+        """
+        Add a DomainObject, already prepared for save, to the buffer
+        """
+        action = {"index": {"_index": obj.index_name(), "_id": obj.id}}
+        if obj.doc_type() is not None:
+            action["index"]["_type"] = obj.doc_type()
+        instruction = json.dumps(action) + "\n" + json.dumps(obj.data) + "\n"
+        self._append(obj.id, instruction)
+
+    def delete(self, klazz, id):
+        """
+        Add the deletion of the record of DomainObject class klazz with the given id to the buffer
+        """
+        action = {"delete": {"_index": klazz.index_name(), "_id": id}}
+        if klazz.doc_type() is not None:
+            action["delete"]["_type"] = klazz.doc_type()
+        self._append(id, json.dumps(action) + "\n")
+
+    def _append(self, id, instruction):
+        self._buffer.append((id, instruction))
+        self._bytes += len(instruction)
+        if len(self._buffer) >= self.max_docs or self._bytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        """
+        Send everything in the buffer to the index
+        """
+        if len(self._buffer) == 0:
+            return
+
+        pending = self._buffer
+        self._buffer = []
+        self._bytes = 0
+
+        if app.config.get("READ_ONLY_MODE", False) and app.config.get("SCRIPTS_READ_ONLY_MODE", False):
+            app.logger.warn("System is in READ-ONLY mode, bulk writer cannot flush")
+            return
+
+        attempt = 0
+        while len(pending) > 0:
+            resp = None
+            try:
+                resp = ES.bulk(body="".join([p[1] for p in pending]), refresh=self.refresh, request_timeout=self.req_timeout)
+            except (elasticsearch.ConnectionError, elasticsearch.ConnectionTimeout):
+                app.logger.exception("Failed to connect to ES")
+            except elasticsearch.TransportError as e:
+                if 400 <= e.status_code < 500:
+                    app.logger.exception("Bad Request to ES, bulk write failed. Details: {0}".format(e.error))
+                    raise ElasticSearchWriteException(e.error)
+                app.logger.exception("Server Error from ES, retrying. Details: {0}".format(e.error))
+            except Exception as e:
+                app.logger.exception("Unhandled exception in bulk writer")
+                raise ElasticSearchWriteException(e)
+
+            if resp is not None:
+                pending = self._process_response(resp, pending)
+                if len(pending) == 0:
+                    break
+
+            attempt += 1
+            if attempt > self.retries:
+                if resp is None:
+                    raise DAOSaveExceptionMaxRetriesReached(
+                        "After {attempts} attempts the bulk write of {n} records failed.".format(attempts=attempt, n=len(pending)))
+                for id, _ in pending:
+                    self.failures[id] = "Index overloaded, no retries remaining"
+                break
+
+            # wait before retrying
+            time.sleep((2 ** attempt) * self.back_off_factor)
+
+    def _process_response(self, resp, sent):
+        """
+        Record the outcome for each document in a bulk response, and return the ones which should be retried
+        """
+        retry = []
+        for (id, instruction), item in zip(sent, resp.get("items", [])):
+            action, result = next(iter(item.items()), ("index", {}))
+            if "error" not in result:
+                if action == "delete":
+                    self.deleted += 1
+                else:
+                    self.saved += 1
+            elif result.get("status") == 429:
+                retry.append((id, instruction))
+            else:
+                app.logger.warn("Bulk write of record {id} failed: {err}".format(id=id, err=result.get("error")))
+                self.failures[id] = result.get("error")
+        return retry
+
+
 class BlockTimeOutException(Exception):
     pass
 
@@ -940,9 +1329,26 @@ class MatchAllQuery(object):
 
 class BlockQuery(object):
     def __init__(self, id):
+        # a single id, or a list of ids
         self._id = id
 
     def query(self):
+        if isinstance(self._id, list):
+            return {
+                "query": {
+                    "bool": {
+                        "must": [
+                            {"terms": {"id.exact": self._id}}
+                        ]
+                    }
+                },
+                "size": len(self._id),
+                "_source": False,
+                "docvalue_fields": [
+                    {"field": "last_updated", "format": "date_time_no_millis"}
+                ]
+            }
+
         return {
             "query": {
                 "bool": {
@@ -2,10 +2,14 @@ class EventConsumer(object):
     # subclass must provide an ID
     ID = None
 
+    # the ids of the events the consumer handles.  EventsService only offers the consumer those events; leave as
+    # None to be offered every event
+    EVENTS = None
+
     @classmethod
     def consumes(cls, event):
         raise NotImplementedError()
 
     @classmethod
     def consume(cls, event):
-        raise NotImplementedError()
\ No newline at end of file
+        raise NotImplementedError()
@@ -10,6 +10,7 @@ from portality.bll.exceptions import NoSuchPropertyException
 
 class AccountCreatedEmail(EventConsumer):
     ID = "account:created:email"
+    EVENTS = [constants.EVENT_ACCOUNT_CREATED]
 
     @classmethod
     def consumes(cls, event):
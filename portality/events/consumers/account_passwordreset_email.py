@@ -10,6 +10,7 @@ from portality.bll.exceptions import NoSuchPropertyException
 
 class AccountPasswordResetEmail(EventConsumer):
     ID = "account:password_reset:email"
+    EVENTS = [constants.EVENT_ACCOUNT_PASSWORD_RESET]
 
     @classmethod
     def consumes(cls, event):
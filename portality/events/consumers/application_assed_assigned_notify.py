@@ -9,6 +9,7 @@ from portality.bll import exceptions
 
 class ApplicationAssedAssignedNotify(EventConsumer):
     ID = "application:assed:assigned:notify"
+    EVENTS = [constants.EVENT_APPLICATION_ASSED_ASSIGNED]
 
     @classmethod
     def consumes(cls, event):
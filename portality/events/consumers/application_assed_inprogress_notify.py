@@ -8,6 +8,7 @@ from portality.bll import DOAJ, exceptions
 
 class ApplicationAssedInprogressNotify(EventConsumer):
     ID = "application:assed:inprogress:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
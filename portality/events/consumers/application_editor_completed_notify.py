@@ -9,6 +9,7 @@ from portality.lib.seamless import SeamlessException
 
 class ApplicationEditorCompletedNotify(EventConsumer):
     ID = "application:editor:completed:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
@@ -9,6 +9,7 @@ from portality.bll import exceptions
 
 class ApplicationEditorGroupAssignedNotify(EventConsumer):
     ID = "application:editor_group:assigned:notify"
+    EVENTS = [constants.EVENT_APPLICATION_EDITOR_GROUP_ASSIGNED]
 
     @classmethod
     def consumes(cls, event):
@@ -10,6 +10,7 @@ from portality.lib.seamless import SeamlessException
 
 class ApplicationEditorInProgressNotify(EventConsumer):
     ID = "application:editor:inprogress:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
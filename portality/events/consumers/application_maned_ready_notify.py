@@ -8,6 +8,7 @@ from portality.bll import DOAJ, exceptions
 
 class ApplicationManedReadyNotify(EventConsumer):
     ID = "application:maned:ready:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
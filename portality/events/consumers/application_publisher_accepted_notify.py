@@ -10,6 +10,7 @@ from portality.core import app
 
 class ApplicationPublisherAcceptedNotify(EventConsumer):
     ID = "application:publisher:accepted:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
@@ -11,6 +11,7 @@ from portality.core import app
 
 class ApplicationPublisherAssignedNotify(EventConsumer):
     ID = "application:publisher:assigned:notify"
+    EVENTS = [constants.EVENT_APPLICATION_ASSED_ASSIGNED]
 
     @classmethod
     def consumes(cls, event):
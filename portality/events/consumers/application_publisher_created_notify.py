@@ -10,6 +10,7 @@ from portality.lib.seamless import SeamlessException
 
 class ApplicationPublisherCreatedNotify(EventConsumer):
     ID = "application:publisher:created:notify"
+    EVENTS = [constants.EVENT_APPLICATION_CREATED]
 
     @classmethod
     def consumes(cls, event):
@@ -10,6 +10,7 @@ from portality.lib.dates import human_date
 
 class ApplicationPublisherInprogressNotify(EventConsumer):
     ID = "application:publisher:inprogress:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
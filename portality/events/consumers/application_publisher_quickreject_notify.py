@@ -12,6 +12,7 @@ from portality.core import app
 
 class ApplicationPublisherQuickRejectNotify(EventConsumer):
     ID = "application:publisher:quickreject:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
@@ -11,6 +11,7 @@ from portality.lib.seamless import SeamlessException
 
 class ApplicationPublisherRevisionNotify(EventConsumer):
     ID = "application:publisher:revision:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
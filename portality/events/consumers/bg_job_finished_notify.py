@@ -11,6 +11,7 @@ from portality.bll import exceptions
 
 class BGJobFinishedNotify(EventConsumer):
     ID = "bg:job_finished:notify"
+    EVENTS = [constants.BACKGROUND_JOB_FINISHED]
 
     @classmethod
     def consumes(cls, event):
@@ -10,6 +10,7 @@ from portality.bll import exceptions
 
 class JournalAssedAssignedNotify(EventConsumer):
     ID = "journal:assed:assigned:notify"
+    EVENTS = [constants.EVENT_JOURNAL_ASSED_ASSIGNED]
 
     @classmethod
     def consumes(cls, event):
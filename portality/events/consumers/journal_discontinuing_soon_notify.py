@@ -13,6 +13,7 @@ from portality import dao
 
 class JournalDiscontinuingSoonNotify(EventConsumer):
     ID = "journal:assed:discontinuing_soon:notify"
+    EVENTS = [constants.EVENT_JOURNAL_DISCONTINUING_SOON]
 
     @classmethod
     def consumes(cls, event):
@@ -10,6 +10,7 @@ from portality.bll import exceptions
 
 class JournalEditorGroupAssignedNotify(EventConsumer):
     ID = "journal:editor_group:assigned:notify"
+    EVENTS = [constants.EVENT_JOURNAL_EDITOR_GROUP_ASSIGNED]
 
     @classmethod
     def consumes(cls, event):
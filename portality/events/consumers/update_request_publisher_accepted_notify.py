@@ -11,6 +11,7 @@ from portality.core import app
 
 class UpdateRequestPublisherAcceptedNotify(EventConsumer):
     ID = "update_request:publisher:accepted:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
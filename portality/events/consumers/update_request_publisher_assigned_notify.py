@@ -10,6 +10,7 @@ from portality.core import app
 
 class UpdateRequestPublisherAssignedNotify(EventConsumer):
     ID = "update_request:publisher:assigned:notify"
+    EVENTS = [constants.EVENT_APPLICATION_ASSED_ASSIGNED]
 
     @classmethod
     def consumes(cls, event):
@@ -11,6 +11,7 @@ from portality.lib.dates import FMT_DATE_HUMAN_A
 
 class UpdateRequestPublisherRejectedNotify(EventConsumer):
     ID = "update_request:publisher:rejected:notify"
+    EVENTS = [constants.EVENT_APPLICATION_STATUS]
 
     @classmethod
     def consumes(cls, event):
@@ -9,4 +9,10 @@ producer = KafkaProducer(bootstrap_servers=bootstrap_server, value_serializer=la
 
 def send_event(event):
     future = producer.send('events', value=event.serialise())
-    future.get(timeout=60)
\ No newline at end of file
+    future.get(timeout=60)
+
+def send_events(events):
+    futures = [producer.send('events', value=event.serialise()) for event in events]
+    producer.flush(timeout=60)
+    for future in futures:
+        future.get(timeout=60)
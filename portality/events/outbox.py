@@ -0,0 +1,252 @@
+"""
+~~EventOutbox:Feature->Events:Feature~~
+
+Non-blocking event dispatch.  Events are appended to a durable outbox on local disk (an SQLite database) and the
+call returns straight away.  A worker thread in the same process then delivers them in batches to each of the
+EVENT_OUTBOX_TARGETS, retrying with a back off when a target fails.
+
+Delivery is at least once: a target which fails part way through a batch receives the whole batch again on the
+next attempt.  Targets which have already taken a batch are not sent it again.
+
+Events left in the outbox when a process stops are delivered by the next process to send an event, or by
+running this module as a script, which drains the outbox and exits.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from portality.core import app
+from portality.lib import plugin
+from portality.models import Event
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    claimed_until REAL NOT NULL DEFAULT 0,
+    delivered TEXT NOT NULL DEFAULT '[]',
+    dead INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT
+)
+"""
+
+
+class Outbox(object):
+    def __init__(self, path=None):
+        self.path = path if path is not None else app.config.get("EVENT_OUTBOX_PATH")
+        self._initialised = False
+
+    def _connect(self):
+        if not self._initialised:
+            d = os.path.dirname(self.path)
+            if d and not os.path.exists(d):
+                os.makedirs(d)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        if not self._initialised:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(SCHEMA)
+            self._initialised = True
+        return conn
+
+    def append(self, event):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT INTO outbox (event, created) VALUES (?, ?)", (event.serialise(), time.time()))
+        finally:
+            conn.close()
+
+    def claim(self, batch_size, lease):
+        """
+        Claim the next batch of events which are due for delivery, so that no other worker delivers them for the
+        next lease seconds
+
+        :return: list of (id, Event, list of targets already delivered to, attempts)
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, event, delivered, attempts FROM outbox "
+                "WHERE dead = 0 AND next_attempt <= ? AND claimed_until <= ? ORDER BY id LIMIT ?",
+                (now, now, batch_size)).fetchall()
+            conn.executemany("UPDATE outbox SET claimed_until = ? WHERE id = ?", [(now + lease, r[0]) for r in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return [(r[0], Event(raw=json.loads(r[1])), json.loads(r[2]), r[3]) for r in rows]
+
+    def complete(self, ids):
+        conn = self._connect()
+        try:
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+        finally:
+            conn.close()
+
+    def retry(self, entries, delivered, error, max_attempts, back_off):
+        """
+        Release the claimed entries for another attempt later, recording the targets which did take them.  Entries
+        which have run out of attempts are kept, but marked as dead, so they can be inspected and replayed by hand.
+        """
+        now = time.time()
+        updates = []
+        for id, _, _, attempts in entries:
+            attempts += 1
+            dead = 1 if attempts >= max_attempts else 0
+            updates.append((attempts, now + back_off * (2 ** attempts), json.dumps(delivered), dead, error, id))
+        conn = self._connect()
+        try:
+            conn.executemany("UPDATE outbox SET attempts = ?, next_attempt = ?, claimed_until = 0, delivered = ?, "
+                             "dead = ?, last_error = ? WHERE id = ?", updates)
+        finally:
+            conn.close()
+
+    def counts(self):
+        """ :return: tuple of the number of events waiting to be delivered, and the number which have failed """
+        conn = self._connect()
+        try:
+            pending = conn.execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+            dead = conn.execute("SELECT COUNT(*) FROM outbox WHERE dead = 1").fetchone()[0]
+        finally:
+            conn.close()
+        return pending, dead
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """
+    The process's shared Outbox, so that the schema is only set up on the first connection rather than for every
+    event.  It is replaced if EVENT_OUTBOX_PATH changes.
+    """
+    global _outbox
+    path = app.config.get("EVENT_OUTBOX_PATH")
+    with _outbox_lock:
+        if _outbox is None or _outbox.path != path:
+            _outbox = Outbox(path)
+        return _outbox
+
+
+def drain(outbox=None, block=False):
+    """
+    Deliver everything which is currently due in the outbox to the EVENT_OUTBOX_TARGETS.
+
+    :param block: if True, wait for events which are waiting to be retried, until the outbox is empty
+    :return: the number of events delivered
+    """
+    outbox = outbox if outbox is not None else get_outbox()
+    targets = app.config.get("EVENT_OUTBOX_TARGETS", [])
+    batch_size = app.config.get("EVENT_OUTBOX_BATCH_SIZE", 100)
+    max_attempts = app.config.get("EVENT_OUTBOX_MAX_ATTEMPTS", 10)
+    back_off = app.config.get("EVENT_OUTBOX_BACK_OFF", 1)
+    lease = app.config.get("EVENT_OUTBOX_LEASE", 300)
+
+    delivered_count = 0
+    while True:
+        entries = outbox.claim(batch_size, lease)
+        if len(entries) == 0:
+            if block and outbox.counts()[0] > 0:
+                time.sleep(max(back_off, 1))
+                continue
+            return delivered_count
+
+        # the entries in a batch are sent to each target together, so group them by the targets they still need
+        by_delivered = {}
+        for entry in entries:
+            by_delivered.setdefault(tuple(entry[2]), []).append(entry)
+
+        failed = False
+        for already, group in by_delivered.items():
+            delivered = list(already)
+            error = None
+            for target in targets:
+                if target in delivered:
+                    continue
+                try:
+                    fn = plugin.load_function(target)
+                    with app.test_request_context("/"):
+                        fn([e[1] for e in group])
+                    delivered.append(target)
+                except Exception as e:
+                    app.logger.exception("Failed to deliver {n} events to {t}".format(n=len(group), t=target))
+                    error = "{t}: {e}".format(t=target, e=str(e))
+
+            if error is None:
+                outbox.complete([e[0] for e in group])
+                delivered_count += len(group)
+            else:
+                outbox.retry(group, delivered, error, max_attempts, back_off)
+                failed = True
+
+        # if a target is failing, leave the rest for later rather than sending it more straight away
+        if failed:
+            if not block:
+                return delivered_count
+            time.sleep(max(back_off, 1))
+
+
+class OutboxWorker(object):
+    """ Background thread which drains the outbox whenever it is woken, and periodically in case it is missed """
+    _lock = threading.Lock()
+    _instance = None
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="event-outbox", daemon=True)
+
+    @classmethod
+    def notify(cls):
+        with cls._lock:
+            if cls._instance is None or not cls._instance._thread.is_alive():
+                cls._instance = OutboxWorker()
+                cls._instance._thread.start()
+            instance = cls._instance
+        instance._wake.set()
+
+    @classmethod
+    def stop(cls, timeout=None):
+        """ Stop the worker, if there is one, waiting for it to finish any drain which it is part way through """
+        with cls._lock:
+            instance = cls._instance
+            cls._instance = None
+        if instance is not None:
+            instance._stopped.set()
+            instance._wake.set()
+            instance._thread.join(timeout)
+
+    def _run(self):
+        interval = app.config.get("EVENT_OUTBOX_POLL_INTERVAL", 10)
+        while not self._stopped.is_set():
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                drain(get_outbox())
+            except Exception:
+                app.logger.exception("Unable to drain the event outbox")
+
+
+def send_event(event):
+    """ EVENT_SEND_FUNCTION which records the event in the outbox, for the worker to deliver """
+    get_outbox().append(event)
+    OutboxWorker.notify()
+
+
+if __name__ == "__main__":
+    # make sure the routes are available to the consumers
+    import portality.app  # noqa
+
+    n = drain(block=True)
+    print("{n} events delivered".format(n=n))
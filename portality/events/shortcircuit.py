@@ -3,4 +3,9 @@ from portality.bll import DOAJ
 
 def send_event(event):
     svc = DOAJ.eventsService()
-    svc.consume(event)
\ No newline at end of file
+    svc.consume(event)
+
+def send_events(events):
+    svc = DOAJ.eventsService()
+    for event in events:
+        svc.consume(event)
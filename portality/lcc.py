@@ -56,8 +56,13 @@ def loadLCC(source=None):
             pn["children"] = []
         pn["children"].append(cn)
 
-    lcc = LCC(**tree)
-    lcc.save()
+    thelcc = LCC(**tree)
+    thelcc.save()
+
+    # if the tree has been reloaded after this module was first imported, replace the in-memory tree and its
+    # derived indexes too
+    if "lcc" in globals():
+        _set_lcc(thelcc)
 
 
 def lcc2choices(thelcc, level=-2):
@@ -134,17 +139,23 @@ def lcc2flat_code_index(thelcc):
         return {thelcc['code']: thelcc['name']}
 
 
-lcc = LCC.pull('lcc')
-if not lcc:
+def _set_lcc(thelcc):
+    global lcc, lcc_choices, lcc_jstree, lcc_index_by_code
+    lcc = thelcc
+    lcc_choices = []
+    lcc_jstree = []
+    lcc_index_by_code = {}
+    if lcc:
+        # build the term and code lookups once, so that indexing records doesn't have to search the tree
+        lcc.build_index()
+        lcc_choices = lcc2choices(lcc)
+        lcc_jstree = lcc2jstree(lcc)
+        lcc_index_by_code = lcc2flat_code_index(lcc)
+
+
+if not LCC.pull('lcc'):
     loadLCC()
-lcc = LCC.pull('lcc')
-lcc_choices = []
-lcc_jstree = []
-lcc_index_by_code = {}
-if lcc:
-    lcc_choices = lcc2choices(lcc)
-    lcc_jstree = lcc2jstree(lcc)
-    lcc_index_by_code = lcc2flat_code_index(lcc)
+_set_lcc(LCC.pull('lcc'))
 
 
 def lookup_code(code):
@@ -143,14 +143,57 @@ class FormulaicException(Exception):
         super(FormulaicException, self).__init__(*args)
 
 
+class CompiledContext(object):
+    """
+    The parts of a context which are the same on every request: its expanded definition, the WTForms class bound
+    from it and its UI settings.  These are built once per context name and shared by every FormulaicContext of that
+    name, so must be treated as read-only.
+    """
+    def __init__(self, definition):
+        self.definition = definition
+        self.wtform_class = None
+        self.ui_settings = None
+
+
 class Formulaic(object):
     def __init__(self, definition, wtforms_builders, function_map=None, javascript_functions=None):
         self._definition = definition
         self._wtforms_builders = wtforms_builders
         self._function_map = function_map
         self._javascript_functions = javascript_functions
+        self._compiled = {}
 
     def context(self, context_name, extra_param: Dict = None) -> Optional['FormulaicContext']:
+        compiled = self.compile(context_name)
+        if compiled is None:
+            return None
+        return FormulaicContext(context_name, compiled.definition, self,
+                                extra_param=extra_param or {})
+
+    def compile(self, context_name) -> Optional[CompiledContext]:
+        """
+        Get the compiled context with the given name, expanding its definition the first time it is asked for
+
+        :param context_name: the name of the context
+        :return: the CompiledContext, or None if there is no such context
+        """
+        compiled = self._compiled.get(context_name)
+        if compiled is None:
+            context_def = self._expand_context(context_name)
+            if context_def is None:
+                return None
+            compiled = CompiledContext(context_def)
+            self._compiled[context_name] = compiled
+        return compiled
+
+    def compiled_for(self, context_name, definition) -> Optional[CompiledContext]:
+        """ Get the compiled context with the given name, but only if it was compiled from the given definition """
+        compiled = self._compiled.get(context_name)
+        if compiled is not None and compiled.definition is definition:
+            return compiled
+        return None
+
+    def _expand_context(self, context_name):
         context_def = deepcopy(self._definition.get("contexts", {}).get(context_name))
         if context_def is None:
             return None
@@ -171,8 +214,7 @@ class Formulaic(object):
             expanded_fieldsets.append(fieldset_def)
 
         context_def["fieldsets"] = expanded_fieldsets
-        return FormulaicContext(context_name, context_def, self,
-                                extra_param=extra_param or {})
+        return context_def
 
     @property
     def wtforms_builders(self):
@@ -242,6 +284,7 @@ class FormulaicContext(object):
         self._name = name
         self._definition = definition
         self._formulaic = parent
+        self._compiled = parent.compiled_for(name, definition) if parent is not None else None
         self._wtform_class = None
         self._wtform_inst = None
 
@@ -272,12 +315,18 @@ class FormulaicContext(object):
 
     @property
     def ui_settings(self):
+        if self._compiled is not None and self._compiled.ui_settings is not None:
+            return self._compiled.ui_settings
+
         ui = deepcopy(self._definition.get("fieldsets", []))
         for fieldset in ui:
             for field in fieldset.get("fields", []):
                 for fn in [k for k in field.keys()]:
                     if fn not in UI_CONFIG_FIELDS:
                         del field[fn]
+
+        if self._compiled is not None:
+            self._compiled.ui_settings = ui
         return ui
 
     @property
@@ -315,6 +364,12 @@ class FormulaicContext(object):
         if self._wtform_class is not None:
             return self._wtform_class
 
+        # the class only depends on the definition, so it is shared by every context compiled from the same one.
+        # Choices which depend on the form data are set on each form instance, in wtform()
+        if self._compiled is not None and self._compiled.wtform_class is not None:
+            self._wtform_class = self._compiled.wtform_class
+            return self._wtform_class
+
         # FIXME: we should just store a list of fields in the context, and reference them
         # from the fieldset, which would get rid of a lot of this double-layered looping
         fields = []
@@ -328,6 +383,8 @@ class FormulaicContext(object):
 
         klazz = self.make_wtform_class(fields)
         self._wtform_class = klazz
+        if self._compiled is not None:
+            self._compiled.wtform_class = klazz
         return self._wtform_class
 
     def wtform(self, formdata=None, data=None):
@@ -769,7 +826,8 @@ class FormulaicField(object):
             wtf = self.wtfield
 
         if add_data_as_choice and hasattr(wtf, "choices") and wtf.data not in [c[0] for c in wtf.choices]:
-            wtf.choices += [(wtf.data, wtf.data)]
+            # don't extend the list in place, as it may be shared with the form class
+            wtf.choices = wtf.choices + [(wtf.data, wtf.data)]
 
         return wtf(**kwargs)
 
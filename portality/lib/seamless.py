@@ -1,4 +1,6 @@
 import locale
+import threading
+from contextlib import contextmanager
 from copy import deepcopy
 from typing import Type
 from urllib.parse import urlparse
@@ -163,6 +165,38 @@ class SeamlessException(Exception):
         super(SeamlessException, self).__init__(message, *args, **kwargs)
 
 
+###############################################
+## Struct caching and lazy construction
+###############################################
+
+# the Construct for each class's default struct, so that it is only merged and compiled once
+_class_constructs = {}
+
+_lazy = threading.local()
+
+
+@contextmanager
+def lazy_construct():
+    """
+    Within this context, seamless objects are created from their raw data as it is, without applying their struct.
+
+    This is only safe for data which has been through the struct already, such as records loaded from the index, and
+    for objects which will only be read.  Saving them still verifies them against the struct.
+    """
+    previous = getattr(_lazy, "active", False)
+    _lazy.active = True
+    try:
+        yield
+    finally:
+        _lazy.active = previous
+
+
+def construct_lazily(klazz, *args, **kwargs):
+    """ create an instance of the seamless class *klazz* without applying its struct, see lazy_construct """
+    with lazy_construct():
+        return klazz(*args, **kwargs)
+
+
 class SeamlessMixin(object):
 
     __SEAMLESS_STRUCT__ = None
@@ -209,18 +243,23 @@ class SeamlessMixin(object):
         self.__seamless_silent_prune__ = silent_prune if silent_prune is not None else self.__SEAMLESS_SILENT_PRUNE__
         self.__seamless_allow_other_fields__ = allow_other_fields if allow_other_fields is not None else self.__SEAMLESS_ALLOW_OTHER_FIELDS__
 
-        struct = struct if struct is not None else self.__SEAMLESS_STRUCT__
-        if isinstance(struct, list):
-            struct = Construct.merge(*struct)
-        self.__seamless_struct__ = Construct(struct,
-                                              self.__seamless_coerce__,
-                                              self.__seamless_default_coerce__)
+        if struct is None and coerce is None and default_coerce is None:
+            # the class's own struct is the same for every instance, so we only need to prepare it once
+            self.__seamless_struct__ = self._class_construct()
+        else:
+            struct = struct if struct is not None else self.__SEAMLESS_STRUCT__
+            if isinstance(struct, list):
+                struct = Construct.merge(*struct)
+            self.__seamless_struct__ = Construct(struct,
+                                                  self.__seamless_coerce__,
+                                                  self.__seamless_default_coerce__)
 
         self.__seamless__ = SeamlessData(raw, struct=self.__seamless_struct__)
 
         if (self.__seamless_struct__ is not None and
                 raw is not None and
-                self.__seamless_apply_struct_on_init__):
+                self.__seamless_apply_struct_on_init__ and
+                not getattr(_lazy, "active", False)):
             self.__seamless__ = self.__seamless_struct__.construct(self.__seamless__.data,
                                     check_required=self.__seamless_check_required_on_init__,
                                     silent_prune=self.__seamless_silent_prune__,
@@ -230,6 +269,18 @@ class SeamlessMixin(object):
 
         super(SeamlessMixin, self).__init__(*args, **kwargs)
 
+    @classmethod
+    def _class_construct(cls):
+        struct = cls.__SEAMLESS_STRUCT__
+        cached = _class_constructs.get(cls)
+        if cached is not None and cached[0] is struct:
+            return cached[1]
+
+        merged = Construct.merge(*struct) if isinstance(struct, list) else struct
+        construct = Construct(merged, cls.__SEAMLESS_COERCE__, cls.__SEAMLESS_DEFAULT_COERCE__)
+        _class_constructs[cls] = (struct, construct)
+        return construct
+
     def __getattr__(self, name):
 
         # workaround to prevent debugger from disconnecting at the deepcopy method
@@ -303,7 +354,10 @@ class SeamlessMixin(object):
                 allow_other_fields=allow_other_fields)
 
     def extend_struct(self, struct):
-        self.__seamless_struct__ = Construct.merge(self.__seamless_struct__, struct)
+        # the current struct may be shared with other instances of the class, so extend a copy of it
+        current = self.__seamless_struct__
+        own = Construct(deepcopy(current.raw), current._coerce, current._default_coerce)
+        self.__seamless_struct__ = Construct.merge(own, struct)
 
 
 class SeamlessData(object):
@@ -678,6 +732,8 @@ class Construct(object):
         self._definition = definition
         self._coerce = coerce
         self._default_coerce = default_coerce
+        self._compiled = None
+        self._substructs = {}
 
     @classmethod
     def merge(cls, target, *args):
@@ -753,6 +809,7 @@ class Construct(object):
         return self._definition.get("required", [])
 
     def add_required(self, field):
+        self._changed()
         if "required" not in self._definition:
             self._definition["required"] = []
         if field not in self._definition["required"]:
@@ -769,6 +826,7 @@ class Construct(object):
         return self._definition.get("objects", [])
 
     def add_object(self, object_name):
+        self._changed()
         if "objects" not in self._definition:
             self._definition["objects"] = []
         if object_name not in self._definition["objects"]:
@@ -782,9 +840,29 @@ class Construct(object):
         s = self.substructs.get(field)
         if s is None:
             return None
-        return Construct(s, self._coerce, self._default_coerce)
+        cached = self._substructs.get(field)
+        if cached is None or cached.raw is not s:
+            cached = Construct(s, self._coerce, self._default_coerce)
+            self._substructs[field] = cached
+        return cached
+
+    def _changed(self):
+        self._compiled = None
+        self._substructs = {}
+
+    @property
+    def compiled(self):
+        """
+        The struct's definition resolved into the tables which construct works from: the required and allowed
+        fields, and each field, object and list with its coerce function, set arguments and substruct.  This is
+        worked out on first use, and again after the struct changes.
+        """
+        if self._compiled is None:
+            self._compiled = CompiledConstruct(self)
+        return self._compiled
 
     def add_substruct(self, field, struct, mode="merge"):
+        self._changed()
         if "structs" not in self._definition:
             self._definition["structs"] = {}
         if mode == "overwrite" or field not in self._definition["structs"]:
@@ -801,6 +879,7 @@ class Construct(object):
         return self._definition.get("fields", {}).get(field)
 
     def add_field(self, field_name, instructions, overwrite=False):
+        self._changed()
         if "fields" not in self._definition:
             self._definition["fields"] = {}
         if overwrite or field_name not in self._definition["fields"]:
@@ -818,6 +897,7 @@ class Construct(object):
         return self._definition.get("lists", {}).get(field)
 
     def add_list(self, list_name, instructions, overwrite=False):
+        self._changed()
         if "lists" not in self._definition:
             self._definition["lists"] = {}
         if overwrite or list_name not in self._definition["lists"]:
@@ -871,12 +951,13 @@ class Construct(object):
             if not isinstance(obj, dict):
                 raise SeamlessException("Expected a dict at '{c}' but found something else instead".format(c=context))
 
+            compiled = struct.compiled
             keyset = obj.keys()
 
             # if we are checking required fields, then check them
             # FIXME: might be sensible to move this out to a separate phase, independent of constructing
             if check_required:
-                for r in struct.required:
+                for r in compiled.required:
                     if r not in keyset:
                         raise SeamlessException("Field '{r}' is required but not present at '{c}'".format(r=r, c=context))
 
@@ -884,7 +965,7 @@ class Construct(object):
             # Note that since the construct mechanism copies fields explicitly, silent_prune just turns off this
             # check
             if not allow_other_fields and not silent_prune:
-                allowed = struct.allowed
+                allowed = compiled.allowed
                 for k in keyset:
                     if k not in allowed:
                         c = context if context != "" else "root"
@@ -894,29 +975,24 @@ class Construct(object):
             constructed = SeamlessData(struct=struct)
 
             # now check all the fields
-            for field_name, instructions in struct.fields:
+            for field_name, instructions, coerce_name, coerce_fn, kwargs in compiled.fields:
                 val = obj.get(field_name)
                 if val is None:
                     continue
-                typ, substruct, instructions = struct.lookup(field_name)
                 if instructions is None:
                     raise SeamlessException("No instruction set defined for field at '{x}'".format(x=context + field_name))
-                coerce_name, coerce_fn = struct.get_coerce(instructions)
                 if coerce_fn is None:
                     raise SeamlessException("No coerce function defined for type '{x}' at '{c}'".format(x=coerce_name, c=context + field_name))
-                kwargs = struct.kwargs(typ, "set", instructions)
                 constructed.set_single(field_name, val, coerce=coerce_fn, context=context, **kwargs)
 
             # next check all the objects (which will involve a recursive call to this function)
-            for field_name in struct.objects:
+            for field_name, substruct in compiled.objects:
                 val = obj.get(field_name)
                 if val is None:
                     continue
                 if type(val) != dict:
                     raise SeamlessException("Expected dict at '{x}' but found '{y}'".format(x=context + field_name, y=type(val)))
 
-                typ, substruct, instructions = struct.lookup(field_name)
-
                 if substruct is None:
                     # this is the lowest point at which we have instructions, so just accept the data structure as-is
                     # (taking a deep copy to destroy any references)
@@ -929,20 +1005,17 @@ class Construct(object):
                     constructed.set_single(field_name, beneath)
 
             # now check all the lists
-            for field_name, instructions in struct.lists:
+            for field_name, instructions, contains, coerce_name, coerce_fn, kwargs, substruct in compiled.lists:
                 vals = obj.get(field_name)
                 if vals is None:
                     continue
                 if not isinstance(vals, list):
-                    raise SeamlessException("Expecting list at '{x}' but found something else '{y}'".format(x=context + field_name, y=type(val)))
-
-                typ, substruct, instructions = struct.lookup(field_name)
-                kwargs = struct.kwargs(typ, "set", instructions)
+                    raise SeamlessException("Expecting list at '{x}' but found something else '{y}'".format(x=context + field_name, y=type(vals)))
+                if instructions is None:
+                    raise SeamlessException("No instruction set defined for list at '{x}'".format(x=context + field_name))
 
-                contains = instructions.get("contains")
                 if contains == "field":
                     # coerce all the values in the list
-                    coerce_name, coerce_fn = struct.get_coerce(instructions)
                     if coerce_fn is None:
                         raise SeamlessException("No coerce function defined for type '{x}' at '{c}'".format(x=coerce_name, c=context + field_name))
 
@@ -959,7 +1032,6 @@ class Construct(object):
                             print("Expected dict at '{x}[{p}]' but got '{y}'".format(x=context + field_name, y=type(val), p=i))
                             raise SeamlessException("Expected dict at '{x}[{p}]' but got '{y}'".format(x=context + field_name, y=type(val), p=i))
 
-                        substruct = struct.substruct(field_name)
                         if substruct is None:
                             constructed.add_to_list(field_name, deepcopy(val))
                         else:
@@ -974,7 +1046,7 @@ class Construct(object):
 
             # finally, if we allow other fields, make sure that they come across too
             if allow_other_fields:
-                known = struct.allowed
+                known = compiled.allowed
                 for k, v in obj.items():
                     if k not in known:
                         constructed.set_single(k, v)
@@ -1046,6 +1118,42 @@ class Construct(object):
         recurse(self, "[root]")
 
 
+class CompiledConstruct(object):
+    """
+    The lookups which Construct.construct needs for a struct, worked out once.  Errors in the struct are recorded
+    rather than raised, so that construct only raises them when it meets data for the field in question.
+    """
+    def __init__(self, struct):
+        self.required = list(struct.required)
+        self.allowed = frozenset(struct.allowed)
+
+        self.fields = []
+        for field_name, _ in struct.fields:
+            typ, _, instructions = struct.lookup(field_name)
+            coerce_name, coerce_fn, kwargs = None, None, None
+            if instructions is not None:
+                coerce_name, coerce_fn = struct.get_coerce(instructions)
+                kwargs = struct.kwargs(typ, "set", instructions)
+            self.fields.append((field_name, instructions, coerce_name, coerce_fn, kwargs))
+
+        self.objects = []
+        for field_name in struct.objects:
+            _, substruct, _ = struct.lookup(field_name)
+            self.objects.append((field_name, substruct))
+
+        self.lists = []
+        for field_name, _ in struct.lists:
+            typ, _, instructions = struct.lookup(field_name)
+            kwargs = struct.kwargs(typ, "set", instructions)
+            contains, coerce_name, coerce_fn = None, None, None
+            if instructions is not None:
+                contains = instructions.get("contains")
+                if contains == "field":
+                    coerce_name, coerce_fn = struct.get_coerce(instructions)
+            self.lists.append((field_name, instructions, contains, coerce_name, coerce_fn, kwargs,
+                               struct.substruct(field_name)))
+
+
 def create_allowed_values_by_constant(constant_class: Type[ConstantList]):
     return {
         'allowed_values': list(constant_class.all_constants())
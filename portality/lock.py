@@ -90,39 +90,76 @@ def batch_lock(type, ids, username, timeout=None):
     Batch lock succeeds and fails as a unit.  If locks can't be obtained on everything
     then all locks are released.
 
-    Works by attempting to lock everything, and then backing out, unlocking already locked
-    resources, when it first encounters a locked record
+    Works by retrieving the existing locks on all the resources in one query, and failing straight away if any
+    of them is held by someone else.  Otherwise the new and renewed locks are written in one bulk request, which
+    only replaces an existing lock if it has not changed since it was read.  If any of those writes fail, the
+    locks which were written are removed again in one bulk request.
 
     :param type:
     :param ids:
     :param username:
-    :return:
+    :return: the locks, in the order of the ids
     """
-    locked = []
+    if timeout is None:
+        timeout = app.config.get("EDIT_LOCK_TIMEOUT", 1200)
+
+    ids = list(dict.fromkeys(ids))
+    current, stale = _retrieve_batch_with_versions(type, ids)
+
     locks = []
-    abort = False
-    failon = None
+    data = ""
+    written = []
     for id in ids:
-        try:
-            lock(type, id, username, timeout)
-            locked.append(id)
-            locks.append(lock)
-        except Locked as e:
-            abort = True
-            failon = id
-            break
-
-    if abort:
-        for id in locked:
-            unlock(type, id, username)
-        raise Locked("Batch lock failed on id {x}".format(x=failon), None)
+        l, seq_no, primary_term = current.get(id, (None, None, None))
+
+        if l is None:
+            # create a new lock, with an id which will conflict with any other attempt to create it at the same time
+            l = models.Lock()
+            l.set_id(_batch_lock_id(type, id))
+            l.set_about(id)
+            l.set_type(type)
+            l.set_username(username)
+            l.expires_in(timeout)
+            l.prep_for_save()
+            data += models.Lock.to_bulk_single_rec(l.data, action="create")
+            written.append(l)
+
+        elif l.username != username and not l.is_expired():
+            # someone else holds the lock, so we fail without having changed anything
+            raise Locked("Batch lock failed on id {x}".format(x=id), l)
+
+        elif l.username != username or l.would_expire_within(timeout):
+            # take over the expired lock, or extend our own, as long as nobody else has done so first
+            l.set_username(username)
+            l.expires_in(timeout)
+            l.prep_for_save()
+            data += models.Lock.to_bulk_single_rec(l.data, action="index", if_seq_no=seq_no, if_primary_term=primary_term)
+            written.append(l)
+
+        locks.append(l)
+
+    for l in stale:
+        data += models.Lock.to_bulk_single_rec(l.data, action="delete")
+
+    if data == "":
+        return locks
+
+    resp = models.Lock.send_bulk(data)
+    failures = models.Lock.bulk_failures(resp)
+    failed = [l for l in written if l.id in failures]
+    if len(failed) > 0:
+        # roll back the locks we did manage to write
+        rollback = [{"id": l.id} for l in written if l.id not in failures]
+        if len(rollback) > 0:
+            models.Lock.bulk(rollback, action="delete")
+        raise Locked("Batch lock failed on id {x}".format(x=failed[0].about), None)
 
     return locks
 
 
 def batch_unlock(type, ids, username):
     """
-    Calls unlock on all resources.  Unlock may fail on one or more resources
+    Unlocks all resources, removing all the locks in one bulk request.  Unlock may fail on one or more resources
     without affecting the others.
 
     :param type:
@@ -130,18 +167,60 @@ def batch_unlock(type, ids, username):
     :param username:
     :return:
     """
+    current, stale = _retrieve_batch_with_versions(type, ids)
+
     success = []
     fail = []
+    remove = [{"id": l.id} for l in stale]
     for id in ids:
-        unlocked = unlock(type, id, username)
-        if unlocked:
+        l = current.get(id, (None,))[0]
+        if l is None:
+            success.append(id)
+        elif l.username == username:
+            remove.append({"id": l.id})
             success.append(id)
         else:
             fail.append(id)
 
+    if len(remove) > 0:
+        models.Lock.bulk(remove, action="delete")
+
     return {"success": success, "fail" : fail}
 
 
+def _batch_lock_id(type, id):
+    return "{t}_{i}".format(t=type, i=id)
+
+
+def _retrieve_batch_with_versions(type, ids):
+    """
+    ~~->Lock:Query~~
+    Get the latest lock on each of the ids, in as few queries as possible, with the sequence number and primary
+    term needed to safely replace it.
+
+    :return: tuple of (dict of id -> (lock, seq_no, primary_term), list of the older locks which should be removed)
+    """
+    current = {}
+    stale = []
+    chunk_size = app.config.get("ES_TERMS_LIMIT", 1024)
+    for i in range(0, len(ids), chunk_size):
+        q = BatchLockQuery(type, ids[i:i + chunk_size])
+        try:
+            res = models.Lock.query(q=q.query())
+        except ESMappingMissingError:
+            return current, stale
+
+        # the query is sorted, so the first lock on each id is the most recent
+        for hit in res.get("hits", {}).get("hits", []):
+            l = models.Lock(**hit.get("_source"))
+            if l.about in current:
+                stale.append(l)
+            else:
+                current[l.about] = (l, hit.get("_seq_no"), hit.get("_primary_term"))
+
+    return current, stale
+
+
 def _retrieve_latest_with_cleanup(type, id):
     """
     ~~->Lock:Query~~
@@ -191,4 +270,29 @@ class LockQuery(object):
                 }
             },
             "sort" : [{"last_updated" : {"order" : "desc"}}]
-        }
\ No newline at end of file
+        }
+
+
+class BatchLockQuery(object):
+    """
+    ~~BatchLock:Query->Elasticsearch:Technology~~
+    """
+    def __init__(self, type, abouts):
+        self.abouts = abouts
+        self.type = type
+
+    def query(self):
+        return {
+            "track_total_hits" : True,
+            "seq_no_primary_term" : True,
+            "size" : 10000,
+            "query" : {
+                "bool" : {
+                    "must" : [
+                        {"terms" : {"about.exact" : self.abouts}},
+                        {"term" : {"type.exact" : self.type}}
+                    ]
+                }
+            },
+            "sort" : [{"last_updated" : {"order" : "desc"}}]
+        }
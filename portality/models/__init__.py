@@ -2,7 +2,7 @@ from typing import Any
 # import the versioned objects, so that the current version is the default one
 from portality.models.v2 import shared_structs
 from portality.models.v2.bibjson import JournalLikeBibJSON
-from portality.models.v2.journal import Journal, JournalQuery, IssnQuery, PublisherQuery, TitleQuery, ContinuationException
+from portality.models.v2.journal import Journal, JournalRegister, JournalQuery, IssnQuery, PublisherQuery, TitleQuery, ContinuationException
 from portality.models.v2.application import Application, SuggestionQuery, OwnerStatusQuery, DraftApplication, AllPublisherApplications
 
 from portality.models.v2.application import Application as Suggestion
@@ -15,7 +15,7 @@ from portality.models.uploads import FileUpload, ExistsFileQuery, OwnerFileQuery
 from portality.models.lock import Lock
 from portality.models.history import ArticleHistory, JournalHistory
 from portality.models.article import Article, ArticleBibJSON, ArticleQuery, ArticleVolumesQuery, DuplicateArticleQuery, NoJournalException
-from portality.models.oaipmh import OAIPMHRecord, OAIPMHJournal, OAIPMHArticle
+from portality.models.oaipmh import OAIPMHRecord, OAIPMHJournal, OAIPMHArticle, OAIPMHRenderedRecord
 from portality.models.atom import AtomRecord
 from portality.models.search import JournalArticle, JournalStatsQuery, ArticleStatsQuery
 from portality.models.cache import Cache
@@ -1,3 +1,6 @@
+import copy
+import threading
+import time
 import uuid
 from flask_login import UserMixin
 from datetime import timedelta
@@ -13,6 +16,13 @@ from portality.lib.dates import FMT_DATETIME_STD
 class Account(DomainObject, UserMixin):
     __type__ = 'account'
 
+    # process-local copies of the accounts used to authenticate requests, as id -> (source, expires), and the api
+    # keys which have been resolved to them, as api key -> (id, expires).  See pull_cached
+    _cached_accounts = {}
+    _cached_api_keys = {}
+    _cache_lock = threading.Lock()
+    CACHE_MAX_SIZE = 10000
+
     def __init__(self, **kwargs):
         from portality.forms.validate import ReservedUsernames
         ReservedUsernames().validate(kwargs.get('id', ''))
@@ -182,6 +192,7 @@ class Account(DomainObject, UserMixin):
         return Authorise.top_level_roles()
 
     def add_role(self, role):
+        self.uncache(self.id)
         if "role" not in self.data:
             self.data["role"] = []
         if role not in self.data["role"]:
@@ -191,6 +202,7 @@ class Account(DomainObject, UserMixin):
             self.generate_api_key()
 
     def remove_role(self, role):
+        self.uncache(self.id)
         if "role" not in self.data:
             return
         if role in self.data["role"]:
@@ -201,6 +213,7 @@ class Account(DomainObject, UserMixin):
         return self.data.get("role", [])
 
     def set_role(self, role):
+        self.uncache(self.id)
         if not isinstance(role, list):
             role = [role]
         self.data["role"] = role
@@ -208,6 +221,15 @@ class Account(DomainObject, UserMixin):
     def prep(self):
         self.data['last_updated'] = dates.now_str()
 
+    def save(self, *args, **kwargs):
+        r = super(Account, self).save(*args, **kwargs)
+        self.uncache(self.id)
+        return r
+
+    def delete(self):
+        super(Account, self).delete()
+        self.uncache(self.id)
+
     @property
     def api_key(self):
         if self.has_role('api'):
@@ -216,19 +238,76 @@ class Account(DomainObject, UserMixin):
             return None
 
     def generate_api_key(self):
+        self.uncache(self.id)
         k = uuid.uuid4().hex
         self.data['api_key'] = k
         return k
 
     @classmethod
-    def pull_by_api_key(cls, key):
-        """Find a user by their API key - only succeed if they currently have API access."""
-        res = cls.query(q='api_key.exact:"' + key + '"')
-        if res.get('hits', {}).get('total', {}).get('value', 0) == 1:
+    def pull_by_api_key(cls, key, api_role=True):
+        """Find a user by their API key - only succeed if they currently have API access, unless api_role is False.
+        Keys which have been resolved recently are looked up in the account cache, see pull_cached."""
+        usr = None
+        cached = cls._cached_api_keys.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            usr = cls.pull_cached(cached[0])
+            if usr is not None and usr.data.get('api_key') != key:
+                usr = None
+
+        if usr is None:
+            res = cls.query(q='api_key.exact:"' + key + '"')
+            if res.get('hits', {}).get('total', {}).get('value', 0) != 1:
+                return None
             usr = cls(**res['hits']['hits'][0]['_source'])
-            if usr.has_role('api'):
-                return usr
-        return None
+            cls._cache(usr, api_key=key)
+
+        if api_role and not usr.has_role('api'):
+            return None
+        return usr
+
+    @classmethod
+    def pull_cached(cls, id):
+        """
+        Pull an account, using a copy held in this process for up to ACCOUNT_CACHE_TIMEOUT seconds.  Changes saved
+        in this process are seen straight away, and changes saved by other processes once their copy expires.  Use
+        this for authenticating requests, and pull for anything which is going to modify the account.
+        """
+        if id is None:
+            return None
+        cached = cls._cached_accounts.get(id)
+        if cached is not None and cached[1] > time.monotonic():
+            return cls(**copy.deepcopy(cached[0]))
+
+        acc = cls.pull(id)
+        if acc is not None:
+            cls._cache(acc)
+        return acc
+
+    @classmethod
+    def _cache(cls, acc, api_key=None):
+        timeout = app.config.get("ACCOUNT_CACHE_TIMEOUT", 30)
+        if not timeout or acc.id is None:
+            return
+        expires = time.monotonic() + timeout
+        with cls._cache_lock:
+            if len(cls._cached_accounts) >= cls.CACHE_MAX_SIZE or len(cls._cached_api_keys) >= cls.CACHE_MAX_SIZE:
+                cls._cached_accounts.clear()
+                cls._cached_api_keys.clear()
+            cls._cached_accounts[acc.id] = (copy.deepcopy(acc.data), expires)
+            if api_key is not None:
+                cls._cached_api_keys[api_key] = (acc.id, expires)
+
+    @classmethod
+    def uncache(cls, id=None):
+        """ Drop the cached copy of the account with the given id, and its api keys, or of all accounts if no id """
+        with cls._cache_lock:
+            if id is None:
+                cls._cached_accounts.clear()
+                cls._cached_api_keys.clear()
+                return
+            cls._cached_accounts.pop(id, None)
+            for key in [k for k, v in cls._cached_api_keys.items() if v[0] == id]:
+                del cls._cached_api_keys[key]
 
     @classmethod
     def new_short_uuid(cls):
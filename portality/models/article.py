@@ -1,3 +1,4 @@
+import math
 import string
 
 from unidecode import unidecode
@@ -6,6 +7,7 @@ from copy import deepcopy
 from datetime import datetime
 
 from portality import datasets, constants
+from portality.core import app
 from portality.dao import DomainObject
 from portality.lib.dates import FMT_DATETIME_STD
 from portality.models import Journal
@@ -60,6 +62,118 @@ class Article(DomainObject):
         # return [cls(**hit.get("_source")) for hit in res.get("hits", {}).get("hits", [])]
         return cls.q2obj(q=q.query())
 
+    @classmethod
+    def duplicates_batch(cls, dois=None, fulltexts=None, size=10):
+        """
+        Find the articles which hold any of the supplied (already normalised) DOIs or fulltext urls, using a small
+        number of terms queries rather than one query per identifier.
+
+        :param dois: list of normalised DOIs
+        :param fulltexts: list of normalised fulltext urls
+        :param size: maximum number of articles to return for each identifier
+        :return: tuple of dicts (doi -> [articles], fulltext -> [articles]), most recently updated first
+        """
+        doi_matches = cls._duplicates_by_index_field("doi", dois, size)
+        fulltext_matches = cls._duplicates_by_index_field("fulltext", fulltexts, size)
+        return doi_matches, fulltext_matches
+
+    @classmethod
+    def _duplicates_by_index_field(cls, field, values, size):
+        values = list(set([v for v in values if v])) if values is not None else []
+        matches = {}
+        if len(values) == 0:
+            return matches
+
+        # each identifier gets its own bucket of up to size articles, so one with many matches can't crowd out the rest
+        chunk_size = app.config.get("ES_TERMS_LIMIT", 1024)
+        for i in range(0, len(values), chunk_size):
+            chunk = values[i:i + chunk_size]
+            q = DuplicateArticlesTopHitsQuery(field, chunk, size=size)
+            res = cls.query(q=q.query())
+            for bucket in res.get("aggregations", {}).get("values", {}).get("buckets", []):
+                hits = bucket.get("latest", {}).get("hits", {}).get("hits", [])
+                matches[bucket.get("key")] = [cls(**h.get("_source")) for h in hits]
+        return matches
+
+    @classmethod
+    def duplicated_identifiers(cls, field, partition_size=None):
+        """
+        Iterate over the (normalised) DOIs or fulltext urls which are held by more than one article.
+
+        The values are found with terms aggregations over index.<field>, split into as many partitions as are needed
+        to keep each aggregation within partition_size terms, rather than by looking up each article in turn.
+
+        :param field: "doi" or "fulltext"
+        :param partition_size: approximate number of distinct values to aggregate in each request
+        """
+        if partition_size is None:
+            partition_size = app.config.get("ARTICLE_DUPLICATES_PARTITION_SIZE", 10000)
+
+        res = cls.query(q=DuplicatedIdentifiersQuery(field).cardinality())
+        cardinality = res.get("aggregations", {}).get("values", {}).get("value", 0)
+        num_partitions = max(1, int(math.ceil(cardinality / partition_size)))
+
+        for partition in range(num_partitions):
+            for value in cls._duplicated_identifiers_partition(field, partition, num_partitions, partition_size):
+                yield value
+
+    @classmethod
+    def _duplicated_identifiers_partition(cls, field, partition, num_partitions, size):
+        # ask for one more than the size, so we can tell whether there are more than the size
+        q = DuplicatedIdentifiersQuery(field, partition, num_partitions, size + 1)
+        buckets = cls.query(q=q.query()).get("aggregations", {}).get("values", {}).get("buckets", [])
+        if len(buckets) <= size:
+            for b in buckets:
+                yield b.get("key")
+            return
+
+        # there may be more duplicated values in this partition than we received, so split it in two and try again
+        for p in [partition, partition + num_partitions]:
+            for value in cls._duplicated_identifiers_partition(field, p, num_partitions * 2, size):
+                yield value
+
+    @classmethod
+    def iterate_by_identifiers(cls, field, values, fields=None, page_size=1000):
+        """
+        Iterate over all the articles which hold any of the supplied (already normalised) DOIs or fulltext urls, most
+        recently updated first for each chunk of ES_TERMS_LIMIT values.
+
+        :param field: "doi" or "fulltext"
+        :param values: list of normalised DOIs or fulltext urls
+        :param fields: the fields of each article to retrieve, or None for the whole record
+        """
+        values = list(values)
+        chunk_size = app.config.get("ES_TERMS_LIMIT", 1024)
+        for i in range(0, len(values), chunk_size):
+            q = DuplicateArticlesBatchQuery(field, values[i:i + chunk_size], fields=fields)
+            for article in cls.iterate(q=q.query(), page_size=page_size, wrap=True, keepalive='5m'):
+                yield article
+
+    @classmethod
+    def iterate_without_identifiers(cls, fields=None, page_size=1000):
+        """ Iterate over the articles which have neither a DOI nor a fulltext url, most recently updated first """
+        q = NoIdentifiersQuery(fields=fields)
+        return cls.iterate(q=q.query(), page_size=page_size, wrap=True, keepalive='5m')
+
+    @classmethod
+    def sitemap_entries(cls, month=None, page_size=5000):
+        """
+        Iterate over the id, last_updated and created_date of the articles in DOAJ, in order of creation
+
+        :param month: optionally limit to the articles created in this month, in the form YYYY-MM
+        """
+        q = ArticleSitemapQuery(month=month)
+        return cls.iterate(q.query(), page_size=page_size, wrap=False, keepalive='5m')
+
+    @classmethod
+    def created_months_changed_since(cls, since):
+        """
+        List the months (YYYY-MM) in which the articles updated since the given timestamp were created
+        """
+        q = ArticleSitemapQuery(changed_since=since)
+        result = cls.query(q=q.changed_months())
+        return [b.get("key_as_string") for b in result.get("aggregations", {}).get("months", {}).get("buckets", [])]
+
     @classmethod
     def list_volumes(cls, issns):
         q = ArticleVolumesQuery(issns)
@@ -94,6 +208,31 @@ class Article(DomainObject):
         q = ArticleQuery(issns=issns)
         cls.delete_selected(query=q.query(), snapshot=snapshot)
 
+    @classmethod
+    def set_in_doaj_by_issns(cls, issns, in_doaj, progress_callback=None):
+        """
+        Set the in_doaj status of all the articles with the given ISSNs in the index, updating their last_updated
+        but without loading and saving each one.  Articles which are modified while this is running are tried
+        again, up to ARTICLE_IN_DOAJ_UPDATE_ATTEMPTS times.
+
+        :return: the number of articles updated
+        """
+        if issns is None or len(issns) == 0:
+            return 0
+
+        q = ArticleInDOAJUpdateQuery(issns, in_doaj)
+        updated = 0
+        for attempt in range(app.config.get("ARTICLE_IN_DOAJ_UPDATE_ATTEMPTS", 3)):
+            status = cls.update_by_query(q.query(), ArticleInDOAJUpdateQuery.script,
+                                         params={"in_doaj": in_doaj, "last_updated": dates.now_str()},
+                                         progress_callback=progress_callback)
+            if status is None:
+                break
+            updated += status.get("updated", 0)
+            if status.get("version_conflicts", 0) == 0:
+                break
+        return updated
+
     @classmethod
     def delete_selected(cls, query=None, owner=None, snapshot=True):
         if owner is not None:
@@ -885,6 +1024,27 @@ class ArticleQuery(object):
 
         return q
     
+class ArticleInDOAJUpdateQuery(object):
+    script = "if (ctx._source.admin == null) { ctx._source.admin = [:]; } " \
+             "ctx._source.admin.in_doaj = params.in_doaj; " \
+             "ctx._source.last_updated = params.last_updated;"
+
+    def __init__(self, issns, in_doaj):
+        self.issns = issns
+        self.in_doaj = in_doaj
+
+    def query(self):
+        # only touch the articles which don't already have the right status
+        return {
+            "query": {
+                "bool": {
+                    "must": [{"terms": {"index.issn.exact": self.issns}}],
+                    "must_not": [{"term": {"admin.in_doaj": self.in_doaj}}]
+                }
+            }
+        }
+
+
 class ArticleVolumesQuery(object):
     base_query = {
         "track_total_hits": True,
@@ -1075,6 +1235,155 @@ class DuplicateArticleQuery(object):
         return q
 
 
+class DuplicateArticlesBatchQuery(object):
+    base_query = {
+        "track_total_hits": True,
+        "query": {
+            "bool": {
+                "filter": [
+                    {"terms": {"<index field>": ["<normalised identifiers>"]}}
+                ]
+            }
+        },
+        "sort": [{"last_updated": {"order": "desc"}}]
+    }
+
+    def __init__(self, field, values, size=10, fields=None):
+        self.field = field
+        self.values = values
+        self.size = size
+        self.fields = fields
+
+    def query(self):
+        q = deepcopy(self.base_query)
+        q["query"]["bool"]["filter"][0]["terms"] = {"index." + self.field + ".exact": self.values}
+        q["size"] = self.size
+        if self.fields is not None:
+            q["_source"] = {"includes": self.fields}
+        return q
+
+
+class DuplicateArticlesTopHitsQuery(object):
+    """
+    The most recently updated articles holding each of the supplied normalised DOIs or fulltext urls, as one terms
+    aggregation bucket per identifier
+    """
+    def __init__(self, field, values, size=10):
+        self.field = "index." + field + ".exact"
+        self.values = values
+        self.size = size
+
+    def query(self):
+        return {
+            "track_total_hits": False,
+            "size": 0,
+            "query": {"bool": {"filter": [{"terms": {self.field: self.values}}]}},
+            "aggs": {
+                "values": {
+                    "terms": {"field": self.field, "include": self.values, "size": len(self.values)},
+                    "aggs": {
+                        "latest": {
+                            "top_hits": {"size": self.size, "sort": [{"last_updated": {"order": "desc"}}]}
+                        }
+                    }
+                }
+            }
+        }
+
+
+class DuplicatedIdentifiersQuery(object):
+    """
+    Terms aggregation over one partition of the values of index.doi or index.fulltext, keeping only the values
+    held by more than one article
+    """
+    def __init__(self, field, partition=0, num_partitions=1, size=10000):
+        self.field = "index." + field + ".exact"
+        self.partition = partition
+        self.num_partitions = num_partitions
+        self.size = size
+
+    def cardinality(self):
+        return {
+            "track_total_hits": False,
+            "size": 0,
+            "aggs": {"values": {"cardinality": {"field": self.field}}}
+        }
+
+    def query(self):
+        return {
+            "track_total_hits": False,
+            "size": 0,
+            "aggs": {
+                "values": {
+                    "terms": {
+                        "field": self.field,
+                        "min_doc_count": 2,
+                        "size": self.size,
+                        "shard_size": self.size,
+                        "include": {"partition": self.partition, "num_partitions": self.num_partitions}
+                    }
+                }
+            }
+        }
+
+
+class NoIdentifiersQuery(object):
+    """ The articles which have neither a DOI nor a fulltext url, so cannot be checked for duplicates """
+    def __init__(self, fields=None):
+        self.fields = fields
+
+    def query(self):
+        q = {
+            "query": {
+                "bool": {
+                    "must_not": [
+                        {"exists": {"field": "index.doi"}},
+                        {"exists": {"field": "index.fulltext"}}
+                    ]
+                }
+            },
+            "sort": [{"last_updated": {"order": "desc"}}]
+        }
+        if self.fields is not None:
+            q["_source"] = {"includes": self.fields}
+        return q
+
+
+class ArticleSitemapQuery(object):
+    def __init__(self, month=None, changed_since=None):
+        self.month = month
+        self.changed_since = changed_since
+
+    def query(self):
+        filters = [{"term": {"admin.in_doaj": True}}]
+        if self.month is not None:
+            start = self.month + "-01T00:00:00Z"
+            filters.append({"range": {"created_date": {"gte": start, "lt": start + "||+1M"}}})
+        return {
+            "query": {"bool": {"filter": filters}},
+            "_source": ["id", "last_updated", "created_date"],
+            "sort": [{"created_date": {"order": "asc"}}]
+        }
+
+    def changed_months(self):
+        # withdrawn articles are included, as their months need to be regenerated too
+        return {
+            "track_total_hits": True,
+            "query": {"bool": {"filter": [{"range": {"last_updated": {"gte": self.changed_since}}}]}},
+            "size": 0,
+            "aggs": {
+                "months": {
+                    "date_histogram": {
+                        "field": "created_date",
+                        "calendar_interval": "month",
+                        "format": "yyyy-MM",
+                        "min_doc_count": 1
+                    }
+                }
+            }
+        }
+
+
 def _human_sort(things, reverse=True):
     numeric = []
     non_numeric = []
@@ -55,13 +55,22 @@ class Cache(DomainObject):
         return cls.pull("csv")
 
     @classmethod
-    def cache_sitemap(cls, url):
+    def cache_sitemap(cls, url, parts=None, generated=None, last_full=None):
         cobj = cls(**{
             "filename" : url
         })
+        if parts is not None:
+            # the individual sitemap files referenced by the sitemap index, so the next run can reuse them
+            cobj.data["parts"] = parts
+            cobj.data["generated"] = generated
+            cobj.data["last_full"] = last_full
         cobj.set_id("sitemap")
         cobj.save()
 
+    @classmethod
+    def get_sitemap_record(cls):
+        return cls.pull("sitemap")
+
     @classmethod
     def get_latest_sitemap(cls):
         rec = cls.pull("sitemap")
@@ -71,7 +80,13 @@ class Cache(DomainObject):
 
     @classmethod
     def cache_public_data_dump(cls, article_container, article_filename, article_url, article_size,
-                                    journal_container, journal_filename, journal_url, journal_size):
+                                    journal_container, journal_filename, journal_url, journal_size,
+                                    article_incremental=None, journal_incremental=None):
+        """
+        Record the current public data dump files.  For incremental dumps, the *_incremental arguments carry the
+        high_water_mark, snapshot_date and manifest of the current snapshot, and the current delta (if any) as
+        a dict of filename, url, size, since and until.
+        """
         cobj = cls(**{
             "article": {
                 "container": article_container,
@@ -86,6 +101,10 @@ class Cache(DomainObject):
                 "size" : journal_size
             }
         })
+        if article_incremental is not None:
+            cobj.data["article"].update(article_incremental)
+        if journal_incremental is not None:
+            cobj.data["journal"].update(journal_incremental)
         cobj.set_id("public_data_dump")
         cobj.save()
 
@@ -4,32 +4,64 @@ from portality.dao import DomainObject
 class LCC(DomainObject):
     __type__ = "lcc"
 
-    def term_path(self, term):
-        def dive(node, path):
-            if node.get("name") == term:
-                path.append(term)
-                return True
-
-            if "children" not in node:
-                return False
+    def __init__(self, **kwargs):
+        super(LCC, self).__init__(**kwargs)
+        self._term_paths = None
+        self._code_paths = None
+        self._code_names = None
 
-            path.append(node.get("name"))
+    def build_index(self):
+        """
+        Walk the tree once, recording the path to every term and every code, so that lookups do not need to
+        search the tree.  Where a term or code appears more than once the first one found in a depth-first
+        walk of the tree wins, as it would if we searched the tree directly.
+        """
+        term_paths = {}
+        code_paths = {}
+        code_names = {}
+
+        def dive(node, names, codes):
+            name = node.get("name")
+            code = node.get("code")
+            names = names + [name]
+            codes = codes + [code]
+
+            if name not in term_paths:
+                term_paths[name] = names
+            if code not in code_paths:
+                code_paths[code] = codes
+            if code is not None and code not in code_names:
+                code_names[code] = name
 
             for n in node.get("children", []):
-                found = dive(n, path)
-                if found:
-                    return True
+                dive(n, names, codes)
+
+        for r in self.data.get("children", []):
+            dive(r, [], [])
 
-            path.pop()
-            return False
+        self._term_paths = term_paths
+        self._code_paths = code_paths
+        self._code_names = code_names
 
-        roots = self.data.get("children", [])
-        for r in roots:
-            path = []
-            found = dive(r, path)
-            if found:
-                return path
+    def clear_index(self):
+        self._term_paths = None
+        self._code_paths = None
+        self._code_names = None
 
+    def _ensure_index(self):
+        if self._term_paths is None:
+            self.build_index()
+
+    def term_path(self, term):
+        """
+        Get the list of terms from the root of the tree via the parents to the given term
+        :param term:
+        :return: list of terms, or None if the term is not in the tree
+        """
+        self._ensure_index()
+        path = self._term_paths.get(term)
+        if path is not None:
+            return list(path)
         return None
 
     def pathify(self, term, path_separator=": "):
@@ -45,32 +77,17 @@ class LCC(DomainObject):
         return None
 
     def expand_codes(self, code):
-        def dive(node, path):
-            if node.get("code") == code:
-                path.append(code)
-                return True
-
-            if "children" not in node:
-                return False
-
-            path.append(node.get("code"))
-
-            for n in node.get("children", []):
-                found = dive(n, path)
-                if found:
-                    return True
-
-            path.pop()
-            return False
-
-        roots = self.data.get("children", [])
-        for r in roots:
-            path = []
-            found = dive(r, path)
-            if found:
-                return path
+        """
+        Get the list of codes from the root of the tree via the parents to the given code
+        :param code:
+        :return: list of codes (which may include None for parents without a code), or an empty list if the code is not in the tree
+        """
+        self._ensure_index()
+        return list(self._code_paths.get(code, []))
 
-        return []
+    def name_for_code(self, code):
+        self._ensure_index()
+        return self._code_names.get(code)
 
     def longest(self, paths):
         """
@@ -95,4 +112,5 @@ class LCC(DomainObject):
 
     def save(self, **kwargs):
         self.set_id("lcc")
+        self.clear_index()
         return super(LCC, self).save(**kwargs)
@@ -1,4 +1,8 @@
+import hashlib
+import json
 from copy import deepcopy
+from portality.core import app
+from portality.dao import DomainObject
 from portality.models import Journal, Article
 from portality import constants
 
@@ -67,7 +71,17 @@ class OAIPMHRecord(object):
         sets = [t.get("key") for t in result.get("aggregations", {}).get("sets", {}).get("buckets", [])]
         return sets
 
-    def list_records(self, from_date=None, until_date=None, oai_set=None, list_size=None, start_after=None):
+    def list_records(self, from_date=None, until_date=None, oai_set=None, list_size=None, start_after=None, search_after=None):
+        """
+        List a page of records, newest first.
+
+        Pages after the first are selected with search_after, from the sort key of the last record on the
+        previous page, so every page costs the same however deep into the list it is.  start_after is the
+        (date, offset) position used by earlier versions of the resumption token, and is still accepted.
+
+        :return: the number of matching records, the page of records, and the sort key to search after for the next
+            page, which is None if this is the last page
+        """
         q = deepcopy(self.records)
         if start_after is not None or from_date is not None or until_date is not None or oai_set is not None:
 
@@ -95,13 +109,20 @@ class OAIPMHRecord(object):
                 q["query"]["bool"]["must"].append(d)
 
         if list_size is not None:
-            q["size"] = list_size
+            # ask for one more than we need, so we know whether there is another page
+            q["size"] = list_size + 1
 
         if start_after is not None:
             q["from"] = start_after[1]
         else:
             q["from"] = 0
 
+        if search_after is not None:
+            # search_after pages are never offset, and they don't need to be counted again
+            q["from"] = 0
+            q["search_after"] = search_after
+            q["track_total_hits"] = False
+
         q["sort"] = deepcopy(self.created_sort)
 
         # do the query
@@ -110,14 +131,19 @@ class OAIPMHRecord(object):
         results = self.query(q=q)
 
         total = results.get("hits", {}).get("total", {}).get('value', 0)
-        return total, [hit.get("_source") for hit in results.get("hits", {}).get("hits", [])]
+        hits = results.get("hits", {}).get("hits", [])
+        next_search_after = None
+        if list_size is not None and len(hits) > list_size:
+            hits = hits[:list_size]
+            next_search_after = hits[-1].get("sort") if len(hits) > 0 else None
+        return total, [hit.get("_source") for hit in hits], next_search_after
 
 
 class OAIPMHArticle(OAIPMHRecord, Article):
-    def list_records(self, from_date=None, until_date=None, oai_set=None, list_size=None, start_after=None):
-        total, results = super(OAIPMHArticle, self).list_records(from_date=from_date,
-            until_date=until_date, oai_set=oai_set, list_size=list_size, start_after=start_after)
-        return total, [Article(**r) for r in results]
+    def list_records(self, from_date=None, until_date=None, oai_set=None, list_size=None, start_after=None, search_after=None):
+        total, results, next_search_after = super(OAIPMHArticle, self).list_records(from_date=from_date,
+            until_date=until_date, oai_set=oai_set, list_size=list_size, start_after=start_after, search_after=search_after)
+        return total, [Article(**r) for r in results], next_search_after
 
     def pull(self, identifier):
         # override the default pull, as we care about whether the item is in_doaj
@@ -127,10 +153,10 @@ class OAIPMHArticle(OAIPMHRecord, Article):
         return None
 
 class OAIPMHJournal(OAIPMHRecord, Journal):
-    def list_records(self, from_date=None, until_date=None, oai_set=None, list_size=None, start_after=None):
-        total, results = super(OAIPMHJournal, self).list_records(from_date=from_date,
-            until_date=until_date, oai_set=oai_set, list_size=list_size, start_after=start_after)
-        return total, [Journal(**r) for r in results]
+    def list_records(self, from_date=None, until_date=None, oai_set=None, list_size=None, start_after=None, search_after=None):
+        total, results, next_search_after = super(OAIPMHJournal, self).list_records(from_date=from_date,
+            until_date=until_date, oai_set=oai_set, list_size=list_size, start_after=start_after, search_after=search_after)
+        return total, [Journal(**r) for r in results], next_search_after
 
     def pull(self, identifier):
         # override the default pull, as we care about whether the item is in_doaj
@@ -138,3 +164,119 @@ class OAIPMHJournal(OAIPMHRecord, Journal):
         if record is not None and record.is_in_doaj():
             return record
         return None
+
+
+class OAIPMHRenderedRecord(DomainObject):
+    """
+    ~~OAIPMHRenderedRecord:Model->OAIPMH:Feature~~
+
+    The serialised OAI-PMH <record> of a journal or article in one metadata format, along with a hash of the record
+    it was rendered from.  These are only ever retrieved by id, so the fragment itself is not indexed.
+    """
+    __type__ = "oai_record"
+
+    # the model of each record type, for pruning the renderings of records which have gone
+    RECORD_TYPES = {
+        "journal": Journal,
+        "article": Article
+    }
+
+    @classmethod
+    def cache_id(cls, record_type, metadata_prefix, record_id):
+        return "{t}_{m}_{i}".format(t=record_type, m=metadata_prefix, i=record_id)
+
+    @classmethod
+    def record_hash(cls, record):
+        """ A hash of the record's data, which changes with every write.  last_updated alone is only to the second """
+        return hashlib.sha1(json.dumps(record.data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def prune(cls, page_size=1000):
+        """
+        Remove the renderings of records which have been deleted or withdrawn from DOAJ
+
+        :return: the number of renderings removed
+        """
+        q = {"query": {"match_all": {}}, "_source": ["id", "record_id", "record_type"]}
+        removed = 0
+        batch = []
+
+        def _prune_batch():
+            gone = []
+            for record_type, klazz in cls.RECORD_TYPES.items():
+                entries = [e for e in batch if e.get("record_type") == record_type]
+                if len(entries) == 0:
+                    continue
+                in_doaj = set([r.get("id") for r in
+                               klazz.pull_many([e.get("record_id") for e in entries], wrap=False,
+                                               fields=["id", "admin.in_doaj"])
+                               if r.get("admin", {}).get("in_doaj", False)])
+                gone += [e.get("id") for e in entries if e.get("record_id") not in in_doaj]
+            if len(gone) > 0:
+                cls.bulk_delete(gone)
+            return len(gone)
+
+        for entry in cls.iterate(q=q, page_size=page_size, wrap=False, keepalive="5m"):
+            batch.append(entry)
+            if len(batch) >= page_size:
+                removed += _prune_batch()
+                batch = []
+        if len(batch) > 0:
+            removed += _prune_batch()
+        return removed
+
+    @classmethod
+    def render(cls, xwalk, record_type, metadata_prefix, records, refresh=False):
+        """
+        Get the serialised <record> for each of the records, in order, in the given metadata format.
+
+        Current renderings are retrieved in one request, and the rest are crosswalked and stored for next time.
+        The cache is only an optimisation, so if it can't be read or written the records are crosswalked as normal.
+
+        :param xwalk: the OAI crosswalk for the record type and metadata format
+        :param record_type: journal or article
+        :param metadata_prefix: the OAI-PMH metadata format
+        :param records: the model objects to render
+        :param refresh: crosswalk all the records, regardless of whether they are already cached
+        :return: list of the serialised records, as utf-8 encoded bytes
+        """
+        version = app.config.get("OAIPMH_RECORD_CACHE_VERSION", 1)
+
+        cached = {}
+        if not refresh:
+            ids = [cls.cache_id(record_type, metadata_prefix, r.id) for r in records]
+            try:
+                for c in cls.pull_many(ids, wrap=False):
+                    cached[c.get("record_id")] = c
+            except Exception as e:
+                app.logger.warning("Unable to read the OAI-PMH record cache: {x}".format(x=e))
+
+        rendered = []
+        stale = []
+        for r in records:
+            c = cached.get(r.id)
+            record_hash = cls.record_hash(r)
+            if c is not None and c.get("record_hash") == record_hash and c.get("version") == version:
+                rendered.append(c.get("record").encode("utf-8"))
+                continue
+
+            xml = xwalk.serialise_record(r)
+            rendered.append(xml)
+            stale.append({
+                "id": cls.cache_id(record_type, metadata_prefix, r.id),
+                "record_id": r.id,
+                "record_type": record_type,
+                "metadata_prefix": metadata_prefix,
+                "record_last_updated": r.last_updated,
+                "record_hash": record_hash,
+                "version": version,
+                "record": xml.decode("utf-8")
+            })
+
+        if len(stale) > 0:
+            try:
+                cls.bulk(stale)
+            except Exception as e:
+                app.logger.warning("Unable to update the OAI-PMH record cache: {x}".format(x=e))
+
+        return rendered
@@ -1,3 +1,7 @@
+import threading
+import time
+
+from portality.core import app
 from portality.dao import DomainObject
 from portality.models.cache import Cache
 from portality.models import Journal, Article
@@ -7,9 +11,52 @@ class JournalArticle(DomainObject):
     __type__ = 'journal,article'
     __readonly__ = True  # TODO actually heed this attribute in all DomainObject methods which modify data
 
+    # process-local copy of the site statistics, as a tuple of (stats, time fetched)
+    _local_statistics = None
+    _statistics_lock = threading.Lock()
+
     @classmethod
     def site_statistics(cls):
+        """
+        Get the site statistics, from a copy held in this process for SITE_STATISTICS_LOCAL_TIMEOUT seconds.
+
+        When the local copy expires it is still returned, while a single thread refreshes it in the background, so
+        only one request per process ever goes to the index (or regenerates the stats) at a time.
+        """
+        timeout = app.config.get("SITE_STATISTICS_LOCAL_TIMEOUT", 60)
+        if not timeout:
+            return cls._load_site_statistics()
+
+        local = cls._local_statistics
+        if local is not None:
+            stats, fetched = local
+            if time.monotonic() - fetched >= timeout and cls._statistics_lock.acquire(blocking=False):
+                threading.Thread(target=cls._refresh_site_statistics, name="site-statistics", daemon=True).start()
+            return stats
 
+        # nothing cached in this process yet, so the first request loads the stats and the rest wait for it
+        with cls._statistics_lock:
+            if cls._local_statistics is None:
+                cls._local_statistics = (cls._load_site_statistics(), time.monotonic())
+            return cls._local_statistics[0]
+
+    @classmethod
+    def _refresh_site_statistics(cls):
+        """ Reload the local copy of the site statistics.  The caller must hold the statistics lock """
+        try:
+            cls._local_statistics = (cls._load_site_statistics(), time.monotonic())
+        except Exception:
+            app.logger.exception("Unable to refresh the site statistics")
+        finally:
+            cls._statistics_lock.release()
+
+    @classmethod
+    def clear_site_statistics(cls):
+        """ Drop the local copy of the site statistics, so that the next request loads them again """
+        cls._local_statistics = None
+
+    @classmethod
+    def _load_site_statistics(cls):
         stats = Cache.get_site_statistics()
         if stats is not None:
             return stats
@@ -1,10 +1,11 @@
-from portality.dao import DomainObject
+from portality.dao import DomainObject, ESError
 from portality.core import app
 from portality.lib.dates import DEFAULT_TIMESTAMP_VAL
 from portality.models.v2.bibjson import JournalLikeBibJSON
 from portality.models.v2 import shared_structs
 from portality.models.account import Account
 from portality.lib import es_data_mapping, dates, coerce
+from portality.lib import seamless
 from portality.lib.seamless import SeamlessMixin
 from portality.lib.coerce import COERCE_MAP
 
@@ -527,9 +528,14 @@ class Journal(JournalLikeObject):
     ## Journal-specific data access methods
 
     @classmethod
-    def all_in_doaj(cls, page_size=5000):
+    def all_in_doaj(cls, page_size=5000, lazy=False):
+        """ iterate over all journals in DOAJ.  If lazy, the journals are not passed through the struct, so they
+        should only be read, see seamless.lazy_construct """
         q = JournalQuery()
-        return cls.iterate(q.all_in_doaj(), page_size=page_size, wrap=True, keepalive='5m')
+        if not lazy:
+            return cls.iterate(q.all_in_doaj(), page_size=page_size, wrap=True, keepalive='5m')
+        records = cls.iterate(q.all_in_doaj(), page_size=page_size, wrap=False, keepalive='5m')
+        return (seamless.construct_lazily(cls, **r) for r in records)
 
     @classmethod
     def find_by_publisher(cls, publisher, exact=True):
@@ -582,6 +588,45 @@ class Journal(JournalLikeObject):
             "latest": latest
         }
 
+    @classmethod
+    def article_stats_for_journals(cls, journals):
+        """
+        Get the article stats for many journals with a single query, rather than one query per journal
+
+        :param journals: list of journals
+        :return: dict of journal id -> {"total": x, "latest": y}, in the same form as article_stats
+        """
+        from portality.models import Article
+        issns_by_id = {j.id: j.known_issns() for j in journals if len(j.known_issns()) > 0}
+        stats = {j.id: {"total": 0, "latest": None} for j in journals}
+        if len(issns_by_id) == 0:
+            return stats
+
+        q = ArticleStatsBatchQuery(issns_by_id)
+        data = Article.query(q=q.query())
+        buckets = data.get("aggregations", {}).get("journals", {}).get("buckets", {})
+        for jid, bucket in buckets.items():
+            total = bucket.get("doc_count", 0)
+            latest = None
+            if total > 0:
+                latest = bucket.get("latest", {}).get("hits", {}).get("hits", [])[0].get("_source").get("created_date")
+            stats[jid] = {
+                "total": total,
+                "latest": latest
+            }
+        return stats
+
+    @classmethod
+    def issns_in_doaj(cls, page_size=5000):
+        """
+        Iterate over the id, pissn and eissn of every journal in DOAJ, without retrieving the full records
+        :return: generator of (id, pissn, eissn) tuples
+        """
+        q = JournalQuery()
+        for j in cls.iterate(q.all_in_doaj_issns(), page_size=page_size, wrap=False, keepalive='5m'):
+            bj = j.get("bibjson", {})
+            yield j.get("id"), bj.get("pissn"), bj.get("eissn")
+
     def mappings(self):
         return es_data_mapping.create_mapping(self.__seamless_struct__.raw, MAPPING_OPTS)
 
@@ -825,10 +870,28 @@ class Journal(JournalLikeObject):
 
         self.set_ticked(False)
 
-    def propagate_in_doaj_status_to_articles(self):
-        for article in self.all_articles():
-            article.set_in_doaj(self.is_in_doaj())
-            article.save()
+    def propagate_in_doaj_status_to_articles(self, progress_callback=None):
+        """
+        Set the in_doaj status of all this journal's articles to match the journal.  By default this is done in the
+        index with an update by query; set ARTICLE_IN_DOAJ_PROPAGATION to "save" to load and save each article.
+
+        :param progress_callback: for update by query, called with the status of the update as it progresses
+        :return: the number of articles updated
+        """
+        from portality.models import Article
+        if app.config.get("ARTICLE_IN_DOAJ_PROPAGATION", "update_by_query") == "update_by_query":
+            return Article.set_in_doaj_by_issns(self.known_issns(), self.is_in_doaj(), progress_callback=progress_callback)
+
+        # buffer the article saves, and send them to the index in bulk
+        with self.bulk_writer() as writer:
+            for article in self.all_articles():
+                article.set_in_doaj(self.is_in_doaj())
+                article.save()
+
+        if len(writer.failures) > 0:
+            raise ESError("Unable to set in_doaj on {n} articles of journal {j}: {x}".format(
+                n=len(writer.failures), j=self.id, x=", ".join(writer.failures.keys())))
+        return writer.saved
 
 
     def prep(self, is_update=True):
@@ -889,6 +952,104 @@ class Journal(JournalLikeObject):
         self.__seamless__.set_with_struct("index.has_apc", has_apc)
 
 
+class JournalRegister(object):
+    """
+    In-memory index from ISSN to the journal which owns it, for processes which need to find the journal of
+    every article in turn.
+
+    The index is built with a single scroll of the journals, keeping only the data which is copied from a journal
+    into its articles (see Article.add_journal_metadata) and which is needed to choose between journals sharing an
+    ISSN.  It holds only plain data, so it can be handed to worker processes.
+    """
+
+    _fields = ["id", "last_updated", "last_manual_update", "admin.in_doaj", "admin.seal", "admin.owner",
+               "bibjson.title", "bibjson.subject", "bibjson.language", "bibjson.publisher",
+               "bibjson.pissn", "bibjson.eissn"]
+
+    def __init__(self, sources=None):
+        self._sources = {}
+        self._by_issn = {}
+        self._journals = {}
+        self._best = {}
+        for source in sources or []:
+            self.add(source)
+
+    @classmethod
+    def build(cls, page_size=5000):
+        """ build the register from all the journals in the index """
+        q = {"query": {"match_all": {}}, "_source": cls._fields}
+        return cls(Journal.iterate(q, page_size=page_size, wrap=False, keepalive='5m'))
+
+    def add(self, source):
+        self._sources[source["id"]] = source
+        bj = source.get("bibjson", {})
+        for issn in [bj.get("pissn"), bj.get("eissn")]:
+            if issn:
+                self._by_issn.setdefault(issn, []).append(source["id"])
+
+    def __len__(self):
+        return len(self._sources)
+
+    def __getstate__(self):
+        # only the data needs to be sent to another process, the models are rebuilt there on demand
+        return {"_sources": self._sources, "_by_issn": self._by_issn}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._sources = state["_sources"]
+        self._by_issn = state["_by_issn"]
+
+    def journal(self, journal_id):
+        """ get the (partial) journal model for the journal id, or None if it is not in the register """
+        j = self._journals.get(journal_id)
+        if j is None and journal_id in self._sources:
+            j = seamless.construct_lazily(Journal, **self._sources[journal_id])
+            self._journals[journal_id] = j
+        return j
+
+    def find_by_issn(self, issns):
+        """ get the (partial) journal models for all the journals with any of the given ISSNs """
+        ids = []
+        for issn in issns:
+            for jid in self._by_issn.get(issn, []):
+                if jid not in ids:
+                    ids.append(jid)
+        return [self.journal(jid) for jid in ids]
+
+    def best_by_issn(self, issns):
+        """ get the journal which best matches the given ISSNs (see best_journal), or None if none of them match """
+        key = tuple(sorted(set(issns)))
+        if key not in self._best:
+            journals = self.find_by_issn(key)
+            self._best[key] = self.best_journal(journals) if len(journals) > 0 else None
+        return self._best[key]
+
+    @classmethod
+    def best_journal(cls, journals):
+        """
+        Choose between several journals which share ISSNs: in DOAJ is preferred, then the most recently manually
+        updated, then the most recently updated
+        """
+        if len(journals) == 1:
+            return list(journals)[0]
+
+        result = {"in_doaj": {}, "not_in_doaj": {}}
+        for j in journals:
+            lmu = j.last_manual_update_timestamp
+            lu = j.last_updated_timestamp
+
+            context = result["in_doaj"] if j.is_in_doaj() else result["not_in_doaj"]
+            if lmu is None:
+                lmu = datetime.utcfromtimestamp(0)
+            if lmu not in context:
+                context[lmu] = {}
+            context[lmu][lu] = j
+
+        context = result["in_doaj"] if len(result["in_doaj"]) > 0 else result["not_in_doaj"]
+        context = context[max(context.keys())]
+        return context[max(context.keys())]
+
+
 MAPPING_OPTS = {
     "dynamic": None,
     "coerces": app.config["DATAOBJ_TO_MAPPING_DEFAULTS"],
@@ -934,6 +1095,7 @@ class JournalQuery(object):
     }
 
     _minified_fields = ["id", "bibjson.title", "last_updated"]
+    _issn_fields = ["id", "bibjson.pissn", "bibjson.eissn"]
 
     def __init__(self, minified=False, sort_by_title=False):
         self.query = None
@@ -955,6 +1117,11 @@ class JournalQuery(object):
             q["sort"] = [{"bibjson.title.exact": {"order": "asc"}}]
         return q
 
+    def all_in_doaj_issns(self):
+        q = deepcopy(self.all_doaj)
+        q["_source"] = self._issn_fields
+        return q
+
 
 class JournalURLQuery(object):
     def __init__(self, url, in_doaj=None, max=10):
@@ -1119,6 +1286,43 @@ class ArticleStatsQuery(object):
         }
 
 
+class ArticleStatsBatchQuery(object):
+    """ The equivalent of ArticleStatsQuery for many journals at once, with one filter bucket per journal """
+    def __init__(self, issns_by_id):
+        self.issns_by_id = issns_by_id
+
+    def query(self):
+        all_issns = list(set([issn for issns in self.issns_by_id.values() for issn in issns]))
+        return {
+            "track_total_hits": True,
+            "query": {
+                "bool": {
+                    "must": [
+                        {"terms": {"index.issn.exact": all_issns}},
+                        {"term": {"admin.in_doaj": True}}
+                    ]
+                }
+            },
+            "size": 0,
+            "aggs": {
+                "journals": {
+                    "filters": {
+                        "filters": {jid: {"terms": {"index.issn.exact": issns}} for jid, issns in self.issns_by_id.items()}
+                    },
+                    "aggs": {
+                        "latest": {
+                            "top_hits": {
+                                "size": 1,
+                                "_source": {"include": ["created_date"]},
+                                "sort": [{"created_date": {"order": "desc"}}]
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+
 class RecentJournalsQuery(object):
     def __init__(self, max):
         self.max = max
@@ -17,11 +17,6 @@ if __name__ == "__main__":
     parser.add_argument("-o", "--out",
                         help="Output directory in which article duplicate reports should be saved (will be created if it doesn't exist)",
                         default="article_duplicates_" + dates.today())
-    parser.add_argument("-t", "--tmp",
-                        help="Directory in which temporary files will be stored during the run, including the CSV export of articles to be deduplicated",
-                        default="tmp_article_duplicates_" + dates.today())
-    parser.add_argument("-c", "--csv",
-                        help="CSV file to use as source for the run.  If this argument is provided, a new CSV will not be generated")
     parser.add_argument("-e", "--email",
                         help="Send zip archived reports to email addresses configured via REPORTS_EMAIL_TO in settings",
                         action='store_true')
@@ -49,7 +44,7 @@ if __name__ == "__main__":
     user = app.config.get("SYSTEM_USERNAME")
 
     app.logger.debug("Starting " + dates.now_str_with_microseconds())
-    job = article_duplicate_report.ArticleDuplicateReportBackgroundTask.prepare(user, outdir=args.out, email=args.email, tmpdir=args.tmp, article_csv=args.csv)
+    job = article_duplicate_report.ArticleDuplicateReportBackgroundTask.prepare(user, outdir=args.out, email=args.email)
     task = article_duplicate_report.ArticleDuplicateReportBackgroundTask(job)
     BackgroundApi.execute(task)
     for msg in job.audit:
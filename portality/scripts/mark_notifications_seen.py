@@ -6,7 +6,7 @@ from portality.bll import DOAJ
 def mark_notifications_seen(until):
     # ~~-> Notifications:Service ~~
     notifications_svc = DOAJ.notificationsService()
-    notifications_svc.mark_all_as_seen(until=until)
+    return notifications_svc.mark_all_as_seen(until=until)
 
 
 if __name__ == "__main__":
@@ -18,4 +18,5 @@ if __name__ == "__main__":
 
     until = dates.parse(args.until)
 
-    mark_notifications_seen(until)
\ No newline at end of file
+    n = mark_notifications_seen(until)
+    print("{n} notifications marked as seen".format(n=n))
\ No newline at end of file
@@ -24,10 +24,12 @@ if __name__ == '__main__':
     parser.add_argument("type", choices=['article','journal', 'all'], help="type of data to export. ")
     parser.add_argument("-c", "--clean", action="store_true", help="Clean any pre-existing output before continuing")
     parser.add_argument("-p", "--prune", action="store_true", help="Delete previous backups if any after running current backup")
+    parser.add_argument("-i", "--incremental", action="store_true", help="Only export a delta of the changes since the last full snapshot, if it is recent enough")
     args = parser.parse_args()
 
     user = app.config.get("SYSTEM_USERNAME")
-    job = public_data_dump.PublicDataDumpBackgroundTask.prepare(user, clean=args.clean, prune=args.prune, types=args.type)
+    job = public_data_dump.PublicDataDumpBackgroundTask.prepare(user, clean=args.clean, prune=args.prune, types=args.type,
+                                                                incremental=args.incremental)
     task = public_data_dump.PublicDataDumpBackgroundTask(job)
     BackgroundApi.execute(task)
 
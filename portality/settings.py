@@ -73,6 +73,24 @@ ELASTIC_SEARCH_SNAPSHOT_TTL = 366
 
 ES_TERMS_LIMIT = 1024
 
+# the approximate number of distinct DOIs or fulltext urls to aggregate over in each request when looking for
+# duplicated articles.  Don't set this higher than the index's search.max_buckets
+ARTICLE_DUPLICATES_PARTITION_SIZE = 10000
+
+# how blocking saves and DomainObject.block* wait for writes to be visible to searches:
+#  "wait_for" - blocking saves index with refresh=wait_for, and block* refresh the index once if the record is not yet visible
+#  "refresh" - blocking saves refresh the index after writing, and block* behave as for "wait_for"
+#  "poll" - repeatedly search for the record until the new version appears
+ES_VISIBILITY_POLICY = "wait_for"
+
+# seconds between checks on the progress of an update by query task
+ES_UPDATE_BY_QUERY_POLL_INTERVAL = 2
+
+# thresholds at which DomainObject.bulk_writer sends its buffered saves to the index, and the request timeout
+ES_BULK_WRITER_MAX_DOCS = 500
+ES_BULK_WRITER_MAX_BYTES = 5 * 1024 * 1024
+ES_BULK_WRITER_TIMEOUT = 60
+
 #####################################################
 # Elastic APM config  (MUST be configured in env file)
 # ~~->APM:Feature~~
@@ -98,6 +116,27 @@ ELASTIC_APM = {
 EVENT_SEND_FUNCTION = "portality.events.kafka_producer.send_event"
 # use this one to bypass kafka and process events immediately/synchronously
 # EVENT_SEND_FUNCTION = "portality.events.shortcircuit.send_event"
+# use this one to record events in a local outbox and return immediately, leaving a background thread to deliver
+# them to the EVENT_OUTBOX_TARGETS.  Run portality/events/outbox.py to deliver anything left over after a restart
+# EVENT_SEND_FUNCTION = "portality.events.outbox.send_event"
+
+# ~~->EventOutbox:Feature~~
+EVENT_OUTBOX_PATH = paths.rel2abs(__file__, "..", "local_store", "event_outbox.sqlite3")
+EVENT_OUTBOX_TARGETS = [
+    "portality.events.kafka_producer.send_events",
+    "portality.events.shortcircuit.send_events"
+]
+EVENT_OUTBOX_BATCH_SIZE = 100
+EVENT_OUTBOX_MAX_ATTEMPTS = 10
+# seconds to wait before the first retry, doubling with each attempt
+EVENT_OUTBOX_BACK_OFF = 1
+# seconds after which a batch claimed by a worker which did not finish it may be claimed again
+EVENT_OUTBOX_LEASE = 300
+# seconds between checks for events to retry, when no new events arrive
+EVENT_OUTBOX_POLL_INTERVAL = 10
+
+# the number of threads on which the consumers of an event are run in parallel.  1 runs them one after another
+EVENT_CONSUMER_THREADS = 1
 
 KAFKA_BROKER = "kafka://localhost:9092"
 KAFKA_EVENTS_TOPIC = "events"
@@ -439,7 +478,8 @@ HUEY_SCHEDULE = {
     "anon_export": {"month": "*", "day": "10", "day_of_week": "*", "hour": "6", "minute": "30"},
     "old_data_cleanup": {"month": "*", "day": "12", "day_of_week": "*", "hour": "6", "minute": "30"},
     "monitor_bgjobs": {"month": "*", "day": "*/6", "day_of_week": "*", "hour": "10", "minute": "0"},
-    "find_discontinued_soon": {"month": "*", "day": "*", "day_of_week": "*", "hour": "0", "minute": "3"}
+    "find_discontinued_soon": {"month": "*", "day": "*", "day_of_week": "*", "hour": "0", "minute": "3"},
+    "oaipmh_record_cache": {"month": "*", "day": "*", "day_of_week": "*", "hour": "*", "minute": "40"}
 }
 
 HUEY_TASKS = {
@@ -686,10 +726,41 @@ MAPPINGS['provenance'] = MAPPINGS["account"]    #~~->Provenance:Model~~
 MAPPINGS['preserve'] = MAPPINGS["account"]    #~~->Preservation:Model~~
 MAPPINGS['notification'] = MAPPINGS["account"]    #~~->Notification:Model~~
 
+# the rendered OAI-PMH records are only retrieved by id, so nothing in them is indexed
+MAPPINGS['oai_record'] = {    #~~->OAIPMHRenderedRecord:Model~~
+    'mappings': {
+        'dynamic': False,
+        'properties': {
+            'record_id': {'type': 'keyword'},
+            'record_last_updated': {'type': 'date'}
+        }
+    },
+    'settings': DEFAULT_INDEX_SETTINGS
+}
+
 #########################################
 # Query Routes
 # ~~->Query:WebRoute~~
 
+# The fields of journals, applications and articles which the public searches return.  These are pushed into the
+# ES request as _source filtering, and replace the equivalent result filters, which only run if a query brings its
+# own _source.  Anything not listed here, including any new admin field, is not returned.
+PUBLIC_SOURCE_FILTER = {
+    "includes" : ["id", "es_type", "created_date", "last_updated", "last_manual_update", "bibjson", "index",
+                  "admin.ticked", "admin.seal"],
+    "replaces" : ["public_result_filter"]
+}
+
+PUBLISHER_SOURCE_FILTER = {
+    "includes" : PUBLIC_SOURCE_FILTER["includes"] + ["admin.in_doaj", "admin.related_applications",
+                                                     "admin.current_application", "admin.current_journal",
+                                                     "admin.application_status"],
+    "replaces" : ["publisher_result_filter"]
+}
+
+# Report the time spent in each stage of a query route's pipeline in a Server-Timing header on the response
+QUERY_SERVER_TIMING = False
+
 QUERY_ROUTE = {
     "query" : {
         # ~~->PublicJournalQuery:Endpoint~~
@@ -699,6 +770,7 @@ QUERY_ROUTE = {
             "query_validator" : "public_query_validator",
             "query_filters" : ["only_in_doaj", "last_update_fallback"],
             "result_filters" : ["public_result_filter"],
+            "source_filter" : PUBLIC_SOURCE_FILTER,
             "dao" : "portality.models.Journal", # ~~->Journal:Model~~
             "required_parameters" : {"ref" : ["ssw", "public_journal", "subject_page"]}
         },
@@ -709,6 +781,7 @@ QUERY_ROUTE = {
             "query_validator" : "public_query_validator",
             "query_filters" : ["only_in_doaj"],
             "result_filters" : ["public_result_filter"],
+            "source_filter" : PUBLIC_SOURCE_FILTER,
             "dao" : "portality.models.Article", # ~~->Article:Model~~
             "required_parameters" : {"ref" : ["public_article", "toc", "subject_page"]}
         },
@@ -720,6 +793,7 @@ QUERY_ROUTE = {
             "query_validator" : "public_query_validator",
             "query_filters" : ["only_in_doaj", "strip_facets", "es_type_fix"],
             "result_filters" : ["public_result_filter", "add_fqw_facets", "fqw_back_compat"],
+            "source_filter" : PUBLIC_SOURCE_FILTER,
             "dao" : "portality.models.JournalArticle",  # ~~->JournalArticle:Model~~
             "required_parameters" : {"ref" : ["fqw"]}
         }
@@ -731,6 +805,7 @@ QUERY_ROUTE = {
             "role" : "publisher",
             "query_filters" : ["owner", "only_in_doaj"],
             "result_filters" : ["publisher_result_filter"],
+            "source_filter" : PUBLISHER_SOURCE_FILTER,
             "dao" : "portality.models.Journal"  # ~~->Journal:Model~~
         },
         # ~~->PublisherApplicationQuery:Endpoint~~
@@ -739,6 +814,7 @@ QUERY_ROUTE = {
             "role" : "publisher",
             "query_filters" : ["owner", "not_update_request"],
             "result_filters" : ["publisher_result_filter"],
+            "source_filter" : PUBLISHER_SOURCE_FILTER,
             "dao" : "portality.models.AllPublisherApplications" # ~~->AllPublisherApplications:Model~~
         },
         # ~~->PublisherUpdateRequestsQuery:Endpoint~~
@@ -747,6 +823,7 @@ QUERY_ROUTE = {
             "role" : "publisher",
             "query_filters" : ["owner", "update_request"],
             "result_filters" : ["publisher_result_filter"],
+            "source_filter" : PUBLISHER_SOURCE_FILTER,
             "dao" : "portality.models.Application"  # ~~->Application:Model~~
         }
     },
@@ -976,6 +1053,16 @@ OAIPMH_LIST_IDENTIFIERS_PAGE_SIZE = 300
 
 OAIPMH_RESUMPTION_TOKEN_EXPIRY = 86400
 
+# Serve ListRecords from a cache of each record's rendered XML, which is kept for as long as the record is unchanged
+# ~~->OAIPMHRenderedRecord:Model~~
+OAIPMH_RECORD_CACHE = True
+
+# Increase this when the crosswalks change, so that the records rendered by the old ones are no longer used
+OAIPMH_RECORD_CACHE_VERSION = 1
+
+# The scheduled oaipmh_record_cache task renders the records updated within this many hours
+OAIPMH_RECORD_CACHE_WARM_HOURS = 2
+
 
 ##########################################
 # Article XML configuration
@@ -1008,6 +1095,20 @@ ARTICLE_CROSSWALKS = {
 # maximum size of files that can be provided by-reference (the default value is 250Mb)
 MAX_REMOTE_SIZE = 262144000
 
+# write each validated batch of ingested articles to the index with bulk requests, rather than one save per article
+# ~~->ArticleBatchCreate:Feature~~
+ARTICLE_BATCH_CREATE_BULK = True
+
+# maximum number of articles to send to the index in a single bulk request, and the timeout for each request
+ARTICLE_BATCH_CREATE_BULK_SIZE = 500
+ARTICLE_BATCH_CREATE_BULK_TIMEOUT = 60
+
+# how a journal's in_doaj status is copied to its articles: "update_by_query" updates them in the index with a
+# script; "save" loads and saves each article.  Articles changed during an update by query are tried again this
+# many times in total
+ARTICLE_IN_DOAJ_PROPAGATION = "update_by_query"
+ARTICLE_IN_DOAJ_UPDATE_ATTEMPTS = 3
+
 #################################################
 # Cache settings
 # ~~->Cache:Feature~~
@@ -1016,6 +1117,14 @@ MAX_REMOTE_SIZE = 262144000
 # 1800s = 30mins
 SITE_STATISTICS_TIMEOUT = 1800
 
+# number of seconds each process holds its own copy of the site statistics before checking the cache again.  An
+# expired copy is still served while one thread per process refreshes it.  Set to 0 to check the cache every time
+SITE_STATISTICS_LOCAL_TIMEOUT = 60
+
+# number of seconds each process holds its own copy of an account which is used to authenticate requests, by session
+# or api key.  Changes to an account in other processes are seen once this expires.  Set to 0 to disable
+ACCOUNT_CACHE_TIMEOUT = 30
+
 # directory into which to put files which are cached (e.g. the csv)
 CACHE_DIR = os.path.join(ROOT_DIR, "cache")
 
@@ -1033,6 +1142,17 @@ JOURNAL_HISTORY_DIR = os.path.join(ROOT_DIR, "history", "journal")
 # approximate rate of change of the Table of Contents for journals
 TOC_CHANGEFREQ = "monthly"
 
+# approximate rate of change of article pages, if they are included in the sitemap
+ARTICLE_CHANGEFREQ = "yearly"
+
+# the maximum number of urls in each sitemap file; if there are more the sitemap becomes a sitemap index
+SITEMAP_MAX_URLS = 50000
+SITEMAP_INCLUDE_ARTICLES = False
+
+# only regenerate the article sitemaps for months with changed articles, with a full rebuild this often
+SITEMAP_INCREMENTAL = False
+SITEMAP_FULL_REBUILD_DAYS = 7
+
 
 
 ##################################################
@@ -1129,6 +1249,15 @@ DISCOVERY_APPLICATION_SORT_SUBS = {
 DISCOVERY_BULK_PAGE_SIZE = 1000
 DISCOVERY_RECORDS_PER_FILE = 100000
 
+# number of slices to export in parallel worker processes in the public data dump.  1 exports serially, in the
+# same process as the task; set this to no more than the number of shards in the index for best performance.
+PUBLIC_DATA_DUMP_SLICES = 1
+
+# produce delta archives of the records changed and deleted since the last full snapshot, rather than exporting
+# everything on each run.  A new full snapshot is taken once the current one is this many days old.
+PUBLIC_DATA_DUMP_INCREMENTAL = False
+PUBLIC_DATA_DUMP_FULL_SNAPSHOT_DAYS = 7
+
 
 ######################################################
 # Hotjar configuration
@@ -1290,6 +1419,15 @@ TASKS_ANON_EXPORT_LIMIT = None
 TASKS_ANON_EXPORT_BATCH_SIZE = 100000
 TASKS_ANON_EXPORT_SCROLL_TIMEOUT = '5m'
 
+#########################################################
+# Background tasks --- article_cleanup_sync
+# number of slices of the articles to sync in parallel worker processes.  1 syncs serially, in the same process as
+# the task; set this to no more than the number of shards in the index for best performance.
+TASKS_ARTICLE_CLEANUP_SYNC_SLICES = 1
+TASKS_ARTICLE_CLEANUP_SYNC_PAGE_SIZE = 1000
+# the maximum size of each bulk request of article updates and deletes
+TASKS_ARTICLE_CLEANUP_SYNC_BULK_BYTES = 5 * 1024 * 1024
+
 #########################################################
 # Background tasks --- old_data_cleanup
 TASK_DATA_RETENTION_DAYS = {
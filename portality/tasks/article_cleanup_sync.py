@@ -5,7 +5,8 @@ For each article in the DOAJ index:
     * Applies the journal's information to the article metadata as needed
 """
 
-from datetime import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 from portality import models
 from portality.background import BackgroundTask, BackgroundApi, BackgroundException
@@ -27,96 +28,26 @@ class ArticleCleanupSyncBackgroundTask(BackgroundTask):
         params = job.params
         prep_all = self.get_param(params, "prepall", False)
         write_changes = self.get_param(params, "write", True)
+        slices = app.config.get("TASKS_ARTICLE_CLEANUP_SYNC_SLICES", 1)
+
+        # Load the register of every journal's ISSNs up front, rather than looking up the journals as we go
+        register = models.JournalRegister.build()
+        job.add_audit_message("Loaded the ISSNs of {x} journals".format(x=len(register)))
+
+        if slices > 1:
+            # use fresh worker processes, so that each one has its own connection to the index
+            job.add_audit_message("Syncing articles in {n} parallel slices".format(n=slices))
+            job.save()
+            with ProcessPoolExecutor(max_workers=slices, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(sync_slice, register, write_changes, prep_all, i, slices) for i in range(slices)]
+                results = [f.result() for f in futures]
+        else:
+            results = [sync_slice(register, write_changes, prep_all)]
 
-        batch_size = 100
-        journal_cache = {}
-        failed_articles = []
-
-        write_batch = []
-        delete_batch = set()
-
-        updated_count = 0
-        same_count = 0
-        deleted_count = 0
-
-        # Scroll though all articles in the index
-        i = 0
-        for article_model in models.Article.iterate(q={"query": {"match_all": {}}, "sort": ["_doc"]}, page_size=100, wrap=True, keepalive='5m'):
-
-            # for debugging, just print out the progress
-            i += 1
-            print(i, article_model.id, len(list(journal_cache.keys())), len(write_batch), len(delete_batch))
-
-            # Try to find journal in our cache
-            bibjson = article_model.bibjson()
-            allissns = bibjson.issns()
-
-            cache_miss = False
-            possibles = {}
-            for issn in allissns:
-                if issn in journal_cache:
-                    inst = models.Journal(**journal_cache[issn])
-                    possibles[inst.id] = inst
-                else:
-                    cache_miss = True
-            assoc_journal = None
-            if len(list(possibles.keys())) > 0:
-                assoc_journal = self._get_best_journal(list(possibles.values()))
-
-            # Cache miss; ask the article model to try to find its journal
-            if assoc_journal is None or cache_miss:
-                journals = models.Journal.find_by_issn(allissns)
-                if len(journals) > 0:
-                    assoc_journal = self._get_best_journal(journals)
-
-            # By the time we get to here, we still might not have a Journal, but we tried.
-            if assoc_journal is not None:
-                # Update the article's metadata, including in_doaj status
-                reg = models.Journal()
-                reg.set_id(assoc_journal.id)
-                changed = article_model.add_journal_metadata(assoc_journal, reg)
-
-                # cache the minified journal register
-                for issn in reg.bibjson().issns():
-                    if issn not in journal_cache:
-                        journal_cache[issn] = reg.data
-
-                if not changed:
-                    same_count += 1
-                    if prep_all:                    # This gets done below, but can override to prep unchanged ones here
-                        article_model.prep()
-                        write_batch.append(article_model.data)
-                else:
-                    updated_count += 1
-                    if write_changes:
-                        article_model.prep()
-                        write_batch.append(article_model.data)
-
-            else:
-                # This article's Journal is no-more, or has evaded us; we delete the article.
-                deleted_count += 1
-                if write_changes:
-                    delete_batch.add(article_model.id)
-
-            # When we have reached the batch limit, do some writing or deleting
-            if len(write_batch) >= batch_size:
-                job.add_audit_message("Writing {x} articles".format(x=len(write_batch)))
-                models.Article.bulk(documents=write_batch)
-                write_batch = []
-
-            if len(delete_batch) >= batch_size:
-                job.add_audit_message("Deleting {x} articles".format(x=len(delete_batch)))
-                models.Article.bulk_delete(delete_batch)
-                delete_batch.clear()
-
-        # Finish the last part-batches of writes or deletes
-        if len(write_batch) > 0:
-            job.add_audit_message("Writing {x} articles".format(x=len(write_batch)))
-            models.Article.bulk(documents=write_batch)
-        if len(delete_batch) > 0:
-            job.add_audit_message("Deleting {x} articles".format(x=len(delete_batch)))
-            models.Article.bulk_delete(delete_batch)
-            delete_batch.clear()
+        updated_count = sum([r["updated"] for r in results])
+        same_count = sum([r["same"] for r in results])
+        deleted_count = sum([r["deleted"] for r in results])
+        failed_articles = [a for r in results for a in r["failed"]]
 
         if write_changes:
             job.add_audit_message("Done. {0} articles updated, {1} remain unchanged, and {2} deleted.".format(updated_count, same_count, deleted_count))
@@ -124,49 +55,12 @@ class ArticleCleanupSyncBackgroundTask(BackgroundTask):
             job.add_audit_message("Done. Changes not written to index. {0} articles to be updated, {1} to remain unchanged, and {2} to be deleted. Set 'write' to write changes.".format(updated_count, same_count, deleted_count))
 
         if len(failed_articles) > 0:
-            job.add_audit_message("Failed to create models for {x} articles in the index. Something is quite wrong.".format(x=len(failed_articles)))
+            job.add_audit_message("Failed to write {x} articles to the index. Something is quite wrong.".format(x=len(failed_articles)))
             job.add_audit_message("Failed article ids: {x}".format(x=", ".join(failed_articles)))
             job.fail()
 
     def _get_best_journal(self, journals):
-        if len(journals) == 1:
-            return list(journals)[0]
-
-        # in_doaj
-        # most recently updated (manual, then automatic)
-        # both issns match
-        result = { "in_doaj" : {}, "not_in_doaj" : {}}
-        for j in journals:
-            in_doaj = j.is_in_doaj()
-            lmu = j.last_manual_update_timestamp
-            lu = j.last_updated_timestamp
-
-            context = None
-            if in_doaj:
-                context = result["in_doaj"]
-            else:
-                context = result["not_in_doaj"]
-
-            if lmu is None:
-                lmu = datetime.utcfromtimestamp(0)
-            if lmu not in context:
-                context[lmu] = {}
-            context[lmu][lu] = j
-
-        context = None
-        if len(list(result["in_doaj"].keys())) > 0:
-            context = result["in_doaj"]
-        else:
-            context = result["not_in_doaj"]
-
-        lmus = list(context.keys())
-        lmus.sort()
-        context = context[lmus.pop()]
-
-        lus = list(context.keys())
-        lus.sort()
-        best = context[lus.pop()]
-        return best
+        return models.JournalRegister.best_journal(journals)
 
     def cleanup(self):
         """
@@ -231,3 +125,52 @@ def article_cleanup_sync(job_id):
     job = models.BackgroundJob.pull(job_id)
     task = ArticleCleanupSyncBackgroundTask(job)
     BackgroundApi.execute(task)
+
+
+def sync_slice(register, write_changes, prep_all, slice_id=None, slice_max=None):
+    """
+    Sync one slice of a sliced scroll over the articles with their journals in the register, or all of the articles
+    if no slice is given.  Changes are written, and orphaned articles deleted, in bulk requests of at most
+    TASKS_ARTICLE_CLEANUP_SYNC_BULK_BYTES.
+
+    This runs in a worker process started by ArticleCleanupSyncBackgroundTask.run when there is more than one slice,
+    so must be a module level function.
+
+    :return: dict of the number of articles updated, the same and deleted, and the ids of any which failed to write
+    """
+    page_size = app.config.get("TASKS_ARTICLE_CLEANUP_SYNC_PAGE_SIZE", 1000)
+    max_bytes = app.config.get("TASKS_ARTICLE_CLEANUP_SYNC_BULK_BYTES", 5 * 1024 * 1024)
+
+    q = {"query": {"match_all": {}}, "sort": ["_doc"]}
+    if slice_max is not None and slice_max > 1:
+        q["slice"] = {"id": slice_id, "max": slice_max}
+
+    counts = {"updated": 0, "same": 0, "deleted": 0, "failed": []}
+    with models.Article.bulk_writer(max_docs=page_size * 10, max_bytes=max_bytes) as writer:
+        for article_model in models.Article.iterate(q=q, page_size=page_size, wrap=True, keepalive='5m'):
+            assoc_journal = register.best_by_issn(article_model.bibjson().issns())
+
+            # By the time we get to here, we still might not have a Journal, but we tried.
+            if assoc_journal is not None:
+                # Update the article's metadata, including in_doaj status
+                changed = article_model.add_journal_metadata(assoc_journal)
+
+                if not changed:
+                    counts["same"] += 1
+                    if prep_all:                    # This gets done below, but can override to prep unchanged ones here
+                        article_model.prep()
+                        writer.add(article_model)
+                else:
+                    counts["updated"] += 1
+                    if write_changes:
+                        article_model.prep()
+                        writer.add(article_model)
+
+            else:
+                # This article's Journal is no-more, or has evaded us; we delete the article.
+                counts["deleted"] += 1
+                if write_changes:
+                    writer.delete(models.Article, article_model.id)
+
+    counts["failed"] = list(writer.failures.keys())
+    return counts
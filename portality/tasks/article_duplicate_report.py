@@ -1,16 +1,11 @@
 """Task to generate a report on duplicated articles in the index"""
 import csv
-import json
 import os
-import shutil
-from datetime import datetime
 
 from portality import models
 from portality.app_email import email_archive
 from portality.background import BackgroundTask, BackgroundApi
-from portality.bll import exceptions
-from portality.bll.doaj import DOAJ
-from portality.core import app, es_connection
+from portality.core import app
 from portality.lib import dates
 from portality.tasks.redis_huey import long_running
 
@@ -18,26 +13,22 @@ from portality.tasks.redis_huey import long_running
 class ArticleDuplicateReportBackgroundTask(BackgroundTask):
     __action__ = "article_duplicate_report"
 
-    # Keep a cache of ISSNs to owners
-    owner_cache = {}
+    # The fields of each article which the report needs
+    REPORT_FIELDS = ["id", "created_date", "last_updated", "bibjson.identifier", "bibjson.link", "bibjson.title",
+                     "admin.in_doaj", "index.doi", "index.fulltext"]
 
     def run(self):
         job = self.background_job
         params = job.params
 
-        # Set up the files we need to run this task - a dir to place the report, and a place to write the article csv
+        # Set up the files we need to run this task - a dir to place the report
         outdir = self.get_param(params, "outdir", "article_duplicates_" + dates.today())
         job.add_audit_message("Saving reports to " + outdir)
         if not os.path.exists(outdir):
             os.makedirs(outdir)
 
-        # Location for our interim CSV file of articles
-        tmpdir = self.get_param(params, "tmpdir", 'tmp_article_duplicate_report')
-        if not os.path.exists(tmpdir):
-            os.makedirs(tmpdir)
-
-        tmp_csvname = self.get_param(params, "article_csv", False)
-        tmp_csvpath, total = self._make_csv_dump(tmpdir, tmp_csvname)
+        # Owners are looked up from the journal register
+        self._register = models.JournalRegister.build()
 
         # Initialise our reports
         global_reportfile = 'duplicate_articles_global_' + dates.today() + '.csv'
@@ -54,61 +45,41 @@ class ArticleDuplicateReportBackgroundTask(BackgroundTask):
         header = ["article_id", "article_created", "article_owner", "article_issns", "article_in_doaj"]
         noids_report.writerow(header)
 
-        # Record the sets of duplicated articles
-        global_matches = []
-
-        a_count = 0
-
-        articleService = DOAJ.articleService()
-
-        # Read back in the article csv file we created earlier
-        with open(tmp_csvpath, 'r', encoding='utf-8') as t:
-            article_reader = csv.reader(t)
+        total = models.Article.count()
 
-            start = dates.now()
-            estimated_finish = ""
-            for a in article_reader:
-                if a_count > 1 and a_count % 100 == 0:
-                    n = dates.now()
-                    diff = (n - start).total_seconds()
-                    expected_total = ((diff / a_count) * total)
-                    estimated_finish = dates.format(dates.seconds_after(start, expected_total))
-                a_count += 1
+        # Find the groups of articles which share a DOI or a fulltext url
+        articles, groups = self._find_duplicate_groups()
 
-                article = models.Article(_source={'id': a[0], 'created_date': a[1], 'bibjson': {'identifier': json.loads(a[2]), 'link': json.loads(a[3]), 'title': a[4]}, 'admin': {'in_doaj': json.loads(a[5])}})
+        # Record the sets of duplicated articles, so each is only reported once
+        global_matches = set()
 
-                # Get the global duplicates
-                try:
-                    global_duplicates = articleService.discover_duplicates(article, results_per_match_type=10000, include_article = False)
-                except exceptions.DuplicateArticleException:
-                    # this means the article did not have any ids that could be used for deduplication
-                    owner = self._lookup_owner(article)
-                    noids_report.writerow([article.id, article.created_date, owner, ','.join(article.bibjson().issns()), article.is_in_doaj()])
-                    continue
+        # Going from the most recently updated article to the oldest, report each article's duplicates
+        for article in sorted(articles.values(), key=lambda x: (x.last_updated, x.created_date), reverse=True):
+            global_duplicates = {}
+            for match_type in ["doi", "fulltext"]:
+                key = article.data.get("index", {}).get(match_type)
+                dups = [articles[i] for i in groups[match_type].get(key, []) if i != article.id]
+                if len(dups) > 0:
+                    global_duplicates[match_type] = dups
 
-                dupcount = 0
-                if global_duplicates:
+            # Deduplicate the DOI and fulltext duplicate lists
+            s = frozenset([article.id] + [d.id for d in global_duplicates.get('doi', []) + global_duplicates.get('fulltext', [])])
+            if s not in global_matches:
+                owner = self._lookup_owner(article)
+                self._write_rows_from_duplicates(article, owner, global_duplicates, global_report)
+                global_matches.add(s)
 
-                    # Look up an article's owner
-                    owner = self._lookup_owner(article)
+            app.logger.debug('{0} {1} {2}'.format(article.id, len(s) - 1, len(global_matches)))
 
-                    # Deduplicate the DOI and fulltext duplicate lists
-                    s = set([article.id] + [d.id for d in global_duplicates.get('doi', []) + global_duplicates.get('fulltext', [])])
-                    # remove article's own id from global_duplicates
-                    dupcount = len(s)-1
-                    if s not in global_matches:
-                        self._write_rows_from_duplicates(article, owner, global_duplicates, global_report)
-                        global_matches.append(s)
+        # Report the articles which had no ids that could be used for deduplication
+        for article in models.Article.iterate_without_identifiers(fields=self.REPORT_FIELDS):
+            owner = self._lookup_owner(article)
+            noids_report.writerow([article.id, article.created_date, owner, ','.join(article.bibjson().issns()), article.is_in_doaj()])
 
-                app.logger.debug('{0}/{1} {2} {3} {4} {5}'.format(a_count, total, article.id, dupcount, len(global_matches), estimated_finish))
-
-        job.add_audit_message('{0} articles processed for duplicates. {1} global duplicate sets found.'.format(a_count, len(global_matches)))
+        job.add_audit_message('{0} articles processed for duplicates. {1} global duplicate sets found.'.format(total, len(global_matches)))
         f.close()
         g.close()
 
-        # Delete the transient temporary files.
-        shutil.rmtree(tmpdir)
-
         # Email the reports if that parameter has been set.
         send_email = self.get_param(params, "email", False)
         if send_email:
@@ -118,70 +89,27 @@ class ArticleDuplicateReportBackgroundTask(BackgroundTask):
         else:
             job.add_audit_message("no email alert sent")
 
-    @classmethod
-    def _make_csv_dump(self, tmpdir, filename):
-        # Connection to the ES index
-        conn = es_connection
-
-        if not filename:
-            filename = 'tmp_articles_' + dates.today() + '.csv'
-        filename = os.path.join(tmpdir, filename)
-
-        with open(filename, 'w', encoding='utf-8') as t:
-            count = self._create_article_csv(conn, t)
+    def _find_duplicate_groups(self):
+        """
+        Get every article which shares its DOI or fulltext url with another article.
 
-        return filename, count
+        :return: tuple of (dict of id -> article, dict of match type -> dict of identifier -> ids of the articles
+            which hold it, most recently updated first)
+        """
+        articles = {}
+        groups = {"doi": {}, "fulltext": {}}
+        for match_type in groups.keys():
+            values = models.Article.duplicated_identifiers(match_type)
+            for article in models.Article.iterate_by_identifiers(match_type, values, fields=self.REPORT_FIELDS):
+                articles.setdefault(article.id, article)
+                key = article.data.get("index", {}).get(match_type)
+                groups[match_type].setdefault(key, []).append(article.id)
+        return articles, groups
 
-    @classmethod
     def _lookup_owner(self, article):
         # Look up an article's owner
-        journal = article.get_journal()
-        owner = None
-        if journal:
-            owner = journal.owner
-            for issn in journal.bibjson().issns():
-                if issn not in self.owner_cache:
-                    self.owner_cache[issn] = owner
-        return owner
-
-    @staticmethod
-    def _create_article_csv(connection, file_object):
-        """ Create a CSV file with the minimum information we require to find and report duplicates. """
-
-        csv_writer = csv.writer(file_object, quoting=csv.QUOTE_ALL)
-
-        # Scroll through all articles, newest to oldest
-        scroll_query = {
-            "_source": [
-                "id",
-                "created_date",
-                "bibjson.identifier",
-                "bibjson.link",
-                "bibjson.title",
-                "admin.in_doaj"
-            ],
-            "query": {
-                "match_all": {}
-            },
-            "sort": [
-                {"last_updated": {"order": "desc"}}
-            ]
-        }
-
-        count = 0
-        for a in models.Article.iterate(q=scroll_query, page_size=1000, keepalive='1m'):
-            row = [
-                a['id'],
-                a['created_date'],
-                json.dumps(a['bibjson']['identifier']),
-                json.dumps(a['bibjson'].get('link', [])),
-                a['bibjson'].get('title', ''),
-                json.dumps(a.get('admin', {}).get('in_doaj', ''))
-            ]
-            csv_writer.writerow(row)
-            count += 1
-
-        return count
+        journal = self._register.best_by_issn(article.bibjson().issns())
+        return journal.owner if journal is not None else None
 
     def _summarise_article(self, article, owner=None):
         a_doi = article.bibjson().get_identifiers('doi')
@@ -189,10 +117,7 @@ class ArticleDuplicateReportBackgroundTask(BackgroundTask):
 
         o = owner
         if o is None:
-            for i in article.bibjson().issns():
-                o = self.owner_cache.get(i, None)
-                if o is not None:
-                    break
+            o = self._lookup_owner(article)
 
         return {
             'created': article.created_date,
@@ -267,8 +192,6 @@ class ArticleDuplicateReportBackgroundTask(BackgroundTask):
         params = {}
         cls.set_param(params, "outdir", kwargs.get("outdir", "article_duplicates_" + dates.today()))
         cls.set_param(params, "email", kwargs.get("email", False))
-        cls.set_param(params, "tmpdir", kwargs.get("tmpdir", "tmp_article_duplicates_" + dates.today()))
-        cls.set_param(params, "article_csv", kwargs.get("article_csv", False))
         job.params = params
         job.queue_id = huey_helper.queue_id
 
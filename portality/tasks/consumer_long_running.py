@@ -17,3 +17,4 @@ from portality.tasks.harvester import scheduled_harvest  # noqa
 from portality.tasks.anon_export import scheduled_anon_export, anon_export  # noqa
 from portality.tasks.old_data_cleanup import scheduled_old_data_cleanup, execute_old_data_cleanup  # noqa
 from portality.tasks.monitor_bgjobs import scheduled_monitor_bgjobs, execute_monitor_bgjobs # noqa
+from portality.tasks.oaipmh_record_cache import scheduled_oaipmh_record_cache, oaipmh_record_cache  # noqa
@@ -77,8 +77,22 @@ class SetInDOAJBackgroundTask(BackgroundTask):
             j.bibjson().active = in_doaj
             j.set_in_doaj(in_doaj)
             j.save()
-            j.propagate_in_doaj_status_to_articles()  # will save each article, could take a while
-            job.add_audit_message("Journal {x} set in_doaj to {y}, and all associated articles".format(x=journal_id, y=str(in_doaj)))
+            updated = j.propagate_in_doaj_status_to_articles(progress_callback=self._progress_reporter(journal_id))
+            job.add_audit_message("Journal {x} set in_doaj to {y}, and all associated articles ({n} updated)".format(x=journal_id, y=str(in_doaj), n=updated))
+
+    def _progress_reporter(self, journal_id):
+        job = self.background_job
+        last = {"updated": None}
+
+        def report(status):
+            # only record progress when something has changed, as this is called every few seconds
+            if status.get("updated") == last["updated"]:
+                return
+            last["updated"] = status.get("updated")
+            job.add_audit_message("{x} of {y} articles updated for journal {z}".format(x=status.get("updated", 0), y=status.get("total", 0), z=journal_id))
+            job.save()
+
+        return report
 
     def cleanup(self):
         """
@@ -0,0 +1,132 @@
+from portality import models
+from portality.background import BackgroundTask, BackgroundApi
+from portality.core import app
+from portality.crosswalks.oaipmh import CROSSWALKS
+from portality.lib import dates
+from portality.tasks.helpers import background_helper
+from portality.tasks.redis_huey import long_running
+
+
+class RecentlyUpdatedInDOAJQuery(object):
+    def __init__(self, since):
+        self.since = since
+
+    def query(self):
+        return {
+            "query": {
+                "bool": {
+                    "must": [
+                        {"term": {"admin.in_doaj": True}},
+                        {"range": {"last_updated": {"gte": self.since}}}
+                    ]
+                }
+            }
+        }
+
+
+# ~~OAIPMHRecordCacheBackgroundTask:Task~~
+class OAIPMHRecordCacheBackgroundTask(BackgroundTask):
+    """
+    Render the OAI-PMH records for journals and articles which have changed recently, so that harvesters picking up
+    the changes are served from the record cache, and remove the renderings of records which have gone.
+    """
+    __action__ = "oaipmh_record_cache"
+
+    # the record types to warm, and the OAIPMH_METADATA_FORMATS endpoint each is served from
+    ENDPOINTS = [
+        ("journal", models.Journal, None),
+        ("article", models.Article, "article")
+    ]
+
+    def run(self):
+        job = self.background_job
+        if not app.config.get("OAIPMH_RECORD_CACHE", False):
+            job.add_audit_message("The OAI-PMH record cache is disabled, so there is nothing to do")
+            return
+
+        hours = self.get_param(job.params, "hours")
+        since = dates.format(dates.before_now(hours * 3600))
+        batch_size = app.config.get("OAIPMH_LIST_RECORDS_PAGE_SIZE", 100)
+        q = RecentlyUpdatedInDOAJQuery(since).query()
+
+        for record_type, klazz, endpoint in self.ENDPOINTS:
+            formats = app.config.get("OAIPMH_METADATA_FORMATS", {}).get(endpoint, [])
+            for f in formats:
+                prefix = f.get("metadataPrefix")
+                xwalk = CROSSWALKS.get(prefix, {}).get(record_type)
+                if xwalk is None:
+                    continue
+                xwalk = xwalk()
+
+                # ~~->OAIPMHRenderedRecord:Model~~
+                count = 0
+                batch = []
+                for record in klazz.iterate(q=q, page_size=batch_size, wrap=True, keepalive='5m'):
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        models.OAIPMHRenderedRecord.render(xwalk, record_type, prefix, batch)
+                        count += len(batch)
+                        batch = []
+                if len(batch) > 0:
+                    models.OAIPMHRenderedRecord.render(xwalk, record_type, prefix, batch)
+                    count += len(batch)
+
+                job.add_audit_message("{n} {t} records updated since {s} rendered as {p}".format(
+                    n=count, t=record_type, s=since, p=prefix))
+
+        removed = models.OAIPMHRenderedRecord.prune(page_size=batch_size)
+        job.add_audit_message("{n} rendered records removed for records which are deleted or no longer in DOAJ"
+                              .format(n=removed))
+
+    def cleanup(self):
+        """
+        Cleanup after a successful OR failed run of the task
+        :return:
+        """
+        pass
+
+    @classmethod
+    def prepare(cls, username, **kwargs):
+        """
+        Take an arbitrary set of keyword arguments and return an instance of a BackgroundJob,
+        or fail with a suitable exception
+
+        :param username: User account for this task to complete as
+        :param kwargs: hours - how far back to look for changed records
+        :return: a BackgroundJob instance representing this task
+        """
+        params = {}
+        cls.set_param(params, "hours", kwargs.get("hours", app.config.get("OAIPMH_RECORD_CACHE_WARM_HOURS", 2)))
+
+        # first prepare a job record
+        return background_helper.create_job(username, cls.__action__,
+                                            queue_id=huey_helper.queue_id,
+                                            params=params)
+
+    @classmethod
+    def submit(cls, background_job):
+        """
+        Submit the specified BackgroundJob to the background queue
+
+        :param background_job: the BackgroundJob instance
+        :return:
+        """
+        background_job.save()
+        oaipmh_record_cache.schedule(args=(background_job.id,), delay=10)
+
+
+huey_helper = OAIPMHRecordCacheBackgroundTask.create_huey_helper(long_running)
+
+
+@huey_helper.register_schedule
+def scheduled_oaipmh_record_cache():
+    user = app.config.get("SYSTEM_USERNAME")
+    job = OAIPMHRecordCacheBackgroundTask.prepare(user)
+    OAIPMHRecordCacheBackgroundTask.submit(job)
+
+
+@huey_helper.register_execute(is_load_config=False)
+def oaipmh_record_cache(job_id):
+    job = models.BackgroundJob.pull(job_id)
+    task = OAIPMHRecordCacheBackgroundTask(job)
+    BackgroundApi.execute(task)
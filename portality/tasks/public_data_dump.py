@@ -1,10 +1,17 @@
+import gzip
+import heapq
+import io
 import json
+import multiprocessing
 import os
+import shutil
 import tarfile
+from concurrent.futures import ProcessPoolExecutor
 
 from portality import models, constants
 from portality.api.current import DiscoveryApi
 from portality.background import BackgroundTask, BackgroundApi, BackgroundException
+from portality.bll import DOAJ
 from portality.core import app
 from portality.lib import dates
 from portality.models import cache
@@ -30,6 +37,12 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
     If you run this with clean set True, there is a chance that in the event of an error the live
     data will be deleted, and not replaced with new data.  Better to prune after the
     new data has been generated instead.
+
+    With incremental set True, a full snapshot of each type is only produced if there is no previous
+    snapshot, or if it is older than PUBLIC_DATA_DUMP_FULL_SNAPSHOT_DAYS.  Otherwise a delta archive is
+    produced, containing every record changed since the snapshot started (its high-water mark) and a
+    list of the ids of records which have been removed from the public data since the snapshot.  Deltas
+    are cumulative, so consumers only ever need the current snapshot and the current delta.
     """
 
     __action__ = "public_data_dump"
@@ -45,6 +58,8 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
         clean = self.get_param(params, 'clean')
         prune = self.get_param(params, 'prune')
         types = self.get_param(params, 'types')
+        slices = self.get_param(params, 'slices', 1)
+        incremental = self.get_param(params, 'incremental', False)
 
         tmpStore = StoreFactory.tmp()
         mainStore = StoreFactory.get(constants.STORE__SCOPE__PUBLIC_DATA_DUMP)
@@ -71,53 +86,73 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
         containers = {"article": None, "journal": None}
         filenames = {"article": None, "journal": None}
         sizes = {"article" : None, "journal" : None}
+        increments = {"article": None, "journal": None}
+
+        previous = None
+        if incremental and not clean:
+            previous = cache.Cache.get_public_data_dump()
+        container_files = mainStore.list(container) if previous is not None else []
 
         # Scroll for article and/or journal
         for typ in types:
-            job.add_audit_message(dates.now_str() + ": Starting export of " + typ)
-            job.save()
+            last_dump = previous.get(typ) if previous is not None else None
+            started = dates.now_str()
 
-            out_dir = tmpStore.path(container, "doaj_" + typ + "_data_" + day_at_start, create_container=True, must_exist=False)
-            out_name = os.path.basename(out_dir)
-            zipped_name = out_name + ".tar.gz"
-            zip_dir = os.path.dirname(out_dir)
-            zipped_path = os.path.join(zip_dir, zipped_name)
-            tarball = tarfile.open(zipped_path, "w:gz")
+            if incremental and not self._needs_snapshot(last_dump, container_files):
+                job.add_audit_message(dates.now_str() + ": Starting delta export of " + typ)
+                job.save()
 
-            file_num = 1
-            out_file, path, filename = self._start_new_file(tmpStore, container, typ, day_at_start, file_num)
+                # the snapshot remains the current full dump, and the delta is added alongside it
+                containers[typ] = last_dump.get("container")
+                filenames[typ] = last_dump.get("filename")
+                urls[typ] = last_dump.get("url")
+                sizes[typ] = last_dump.get("size")
+
+                since = last_dump.get("high_water_mark")
+                tarball, zipped_path = self._open_tarball(tmpStore, container, "doaj_" + typ + "_delta_" + day_at_start)
+                self._export(tmpStore, container, typ, day_at_start, page_size, records_per_file, tarball, kind="delta", since=since)
+                self._export_deleted(mainStore, tmpStore, container, typ, day_at_start, last_dump.get("manifest"), page_size, tarball)
+                tarball.close()
+
+                filesize = self._store_file(mainStore, tmpStore, container, zipped_path, typ)
+                zipped_name = os.path.basename(zipped_path)
+                increments[typ] = {
+                    "high_water_mark": since,
+                    "snapshot_date": last_dump.get("snapshot_date"),
+                    "manifest": last_dump.get("manifest"),
+                    "delta": {
+                        "filename": zipped_name,
+                        "url": mainStore.url(container, zipped_name),
+                        "size": filesize,
+                        "since": since,
+                        "until": started
+                    }
+                }
+                continue
 
-            first_in_file = True
-            count = 0
-            for result in DiscoveryApi.scroll(typ, None, None, page_size, scan=True):
-                if not first_in_file:
-                    out_file.write(",\n")
-                else:
-                    first_in_file = False
-                out_file.write(json.dumps(result))
-                count += 1
+            job.add_audit_message(dates.now_str() + ": Starting export of " + typ)
+            job.save()
 
-                if count >= records_per_file:
-                    file_num += 1
-                    self._finish_file(tmpStore, container, filename, path, out_file, tarball)
-                    job.save()
-                    out_file, path, filename = self._start_new_file(tmpStore, container, typ, day_at_start, file_num)
-                    first_in_file = True
-                    count = 0
+            tarball, zipped_path = self._open_tarball(tmpStore, container, "doaj_" + typ + "_data_" + day_at_start)
 
-            if count > 0:
-                self._finish_file(tmpStore, container, filename, path, out_file, tarball)
-                job.save()
+            # for an incremental snapshot, collect the ids of the records as they are exported, so that the
+            # manifest lists exactly the records in the snapshot
+            ids_dir = None
+            if incremental:
+                ids_dir = tmpStore.path(container, "doaj_" + typ + "_ids_" + day_at_start, create_container=True, must_exist=False)
+                if not os.path.exists(ids_dir):
+                    os.makedirs(ids_dir)
+
+            if slices > 1:
+                id_paths = self._export_sliced(tmpStore, container, typ, day_at_start, page_size, records_per_file, slices, tarball, ids_dir=ids_dir)
+            else:
+                id_paths = self._export(tmpStore, container, typ, day_at_start, page_size, records_per_file, tarball, ids_dir=ids_dir)
 
             tarball.close()
 
             # Copy the source directory to main store
-            try:
-                filesize = self._copy_on_complete(mainStore, tmpStore, container, zipped_path)
-                job.save()
-            except Exception as e:
-                tmpStore.delete_container(container)
-                raise BackgroundException("Error copying {0} data on complete {1}\n".format(typ, str(e)))
+            filesize = self._store_file(mainStore, tmpStore, container, zipped_path, typ)
+            zipped_name = os.path.basename(zipped_path)
 
             store_url = mainStore.url(container, zipped_name)
             urls[typ] = store_url
@@ -125,14 +160,29 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
             containers[typ] = container
             filenames[typ] = zipped_name
 
+            if incremental:
+                # record the ids in the snapshot, so that later deltas can tell which records have gone
+                manifest_path = self._write_manifest(tmpStore, container, typ, day_at_start, id_paths)
+                shutil.rmtree(ids_dir)
+                self._store_file(mainStore, tmpStore, container, manifest_path, typ)
+                increments[typ] = {
+                    "high_water_mark": started,
+                    "snapshot_date": day_at_start,
+                    "manifest": os.path.basename(manifest_path),
+                    "delta": None
+                }
+
         if prune:
-            self._prune_container(mainStore, container, day_at_start, types)
+            self._prune_container(mainStore, container, self._files_to_keep(types, filenames, increments))
             job.save()
 
         self.background_job.add_audit_message("Removing temp store container {x}".format(x=container))
         tmpStore.delete_container(container)
 
         # finally update the cache
+        increment_args = {}
+        if incremental:
+            increment_args = {"article_incremental": increments["article"], "journal_incremental": increments["journal"]}
         cache.Cache.cache_public_data_dump(containers["article"],
                                            filenames["article"],
                                            urls["article"],
@@ -140,10 +190,169 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
                                            containers["journal"],
                                            filenames["journal"],
                                            urls["journal"],
-                                           sizes["journal"])
+                                           sizes["journal"],
+                                           **increment_args)
 
         job.add_audit_message(dates.now_str() + ": done")
 
+    def _needs_snapshot(self, last_dump, container_files):
+        if last_dump is None or last_dump.get("high_water_mark") is None or last_dump.get("snapshot_date") is None:
+            return True
+
+        # if the files the delta depends on have gone, we have to start again
+        if last_dump.get("filename") not in container_files or last_dump.get("manifest") not in container_files:
+            return True
+
+        max_age = app.config.get("PUBLIC_DATA_DUMP_FULL_SNAPSHOT_DAYS", 7)
+        snapshot_date = dates.parse(last_dump.get("snapshot_date"), format=dates.FMT_DATE_STD)
+        return dates.now() >= dates.days_after(snapshot_date, max_age)
+
+    def _open_tarball(self, storage, container, out_name):
+        out_dir = storage.path(container, out_name, create_container=True, must_exist=False)
+        zipped_path = os.path.join(os.path.dirname(out_dir), out_name + ".tar.gz")
+        return tarfile.open(zipped_path, "w:gz"), zipped_path
+
+    def _store_file(self, mainStore, tmpStore, container, path, typ):
+        try:
+            filesize = self._copy_on_complete(mainStore, tmpStore, container, path)
+            self.background_job.save()
+        except Exception as e:
+            tmpStore.delete_container(container)
+            raise BackgroundException("Error copying {0} data on complete {1}\n".format(typ, str(e)))
+        return filesize
+
+    def _export(self, storage, container, typ, day_at_start, page_size, records_per_file, tarball, kind="data", since=None, ids_dir=None):
+        """
+        Export the records to json batch files in the tarball.  If ids_dir is given, the ids of the records in each
+        batch file are also written, sorted, to a file in that directory.
+
+        :return: the paths of the id files, in order
+        """
+        job = self.background_job
+        file_num = 1
+        out_file, path, filename = self._start_new_file(storage, container, typ, day_at_start, file_num, kind)
+
+        first_in_file = True
+        count = 0
+        ids = []
+        id_paths = []
+        for result in self._public_records(typ, page_size, since):
+            if not first_in_file:
+                out_file.write(",\n")
+            else:
+                first_in_file = False
+            out_file.write(json.dumps(result))
+            count += 1
+            if ids_dir is not None:
+                ids.append(result["id"])
+
+            if count >= records_per_file:
+                if ids_dir is not None:
+                    id_paths.append(write_ids(ids, os.path.join(ids_dir, "ids_{n}.txt".format(n=file_num))))
+                    ids = []
+                file_num += 1
+                self._finish_file(storage, container, filename, path, out_file, tarball)
+                job.save()
+                out_file, path, filename = self._start_new_file(storage, container, typ, day_at_start, file_num, kind)
+                first_in_file = True
+                count = 0
+
+        if count > 0:
+            if ids_dir is not None:
+                id_paths.append(write_ids(ids, os.path.join(ids_dir, "ids_{n}.txt".format(n=file_num))))
+            self._finish_file(storage, container, filename, path, out_file, tarball)
+            job.save()
+
+        return id_paths
+
+    def _public_records(self, typ, page_size, since=None):
+        if since is None:
+            return DiscoveryApi.scroll(typ, None, None, page_size, scan=True)
+
+        # the public filters of the api query route are applied on top of the range, just as for a full export
+        # ~~->Query:Service~~
+        changed = {"query": {"range": {"last_updated": {"gte": since}}}}
+        return DOAJ.queryService().scroll('api_query', typ, changed, None, page_size, scan=True)
+
+    def _write_manifest(self, storage, container, typ, day_at_start, id_paths):
+        """
+        Write the ids of the records in the snapshot, collected in the id files as it was exported, to a gzipped
+        text file in sorted order, one per line
+        """
+        filename = "doaj_" + typ + "_ids_" + day_at_start + ".txt.gz"
+        path = storage.path(container, filename, create_container=True, must_exist=False)
+        self.background_job.add_audit_message("Saving id manifest to file {filename}".format(filename=filename))
+
+        with gzip.open(path, "wt", encoding="utf-8") as out_file:
+            for id in merge_ids(id_paths):
+                out_file.write(id + "\n")
+        return path
+
+    def _export_deleted(self, mainStore, tmpStore, container, typ, day_at_start, manifest, page_size, tarball):
+        """
+        Add a list of the ids which are in the snapshot manifest, but which are no longer public, to the tarball
+        """
+        filename = os.path.join("doaj_" + typ + "_delta_" + day_at_start, "deleted.json")
+        path = tmpStore.path(container, filename, create_container=True, must_exist=False)
+        dn = os.path.dirname(path)
+        if not os.path.exists(dn):
+            os.makedirs(dn)
+
+        stream = mainStore.get(container, manifest)
+        if stream is None:
+            raise BackgroundException("Unable to read {typ} id manifest {x}".format(typ=typ, x=manifest))
+
+        count = 0
+        with io.TextIOWrapper(gzip.GzipFile(fileobj=stream), encoding="utf-8") as snapshot_ids, \
+                open(path, "w", encoding="utf-8") as out_file:
+            out_file.write("[")
+            for id in deleted_ids((line.rstrip("\n") for line in snapshot_ids), public_ids(typ, page_size)):
+                if count > 0:
+                    out_file.write(",\n")
+                out_file.write(json.dumps(id))
+                count += 1
+            out_file.write("]")
+
+        self.background_job.add_audit_message("{n} {typ} records deleted since the snapshot".format(n=count, typ=typ))
+        tarball.add(path, arcname=filename)
+        tmpStore.delete_file(container, filename)
+
+    def _export_sliced(self, storage, container, typ, day_at_start, page_size, records_per_file, slices, tarball, ids_dir=None):
+        """
+        Export the records using a sliced scroll, with each slice exported to its own batch files by a separate
+        worker process.  Once all the slices are complete the batch files are added to the tarball in order,
+        numbered in the same way as the files from a serial export.
+
+        :return: the paths of the sorted id files written by the slices, if ids_dir is given
+        """
+        job = self.background_job
+        slice_dir = storage.path(container, "doaj_" + typ + "_slices_" + day_at_start, create_container=True, must_exist=False)
+        if not os.path.exists(slice_dir):
+            os.makedirs(slice_dir)
+
+        job.add_audit_message("Exporting {typ} in {n} parallel slices".format(typ=typ, n=slices))
+        job.save()
+
+        # use fresh worker processes, so that each one has its own connection to the index
+        with ProcessPoolExecutor(max_workers=slices, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(export_slice, typ, i, slices, slice_dir, page_size, records_per_file, ids_dir) for i in range(slices)]
+            slice_paths = [f.result() for f in futures]
+
+        file_num = 1
+        id_paths = []
+        for paths, slice_id_paths in slice_paths:
+            id_paths += slice_id_paths
+            for path in paths:
+                filename = self._filename(typ, day_at_start, file_num)
+                self.background_job.add_audit_message("Adding file {filename} to compressed tar".format(filename=filename))
+                tarball.add(path, arcname=filename)
+                os.remove(path)
+                file_num += 1
+            job.save()
+
+        shutil.rmtree(slice_dir)
+        return id_paths
+
     def _finish_file(self, storage, container, filename, path, out_file, tarball):
         out_file.write("]")
         out_file.close()
@@ -152,8 +361,8 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
         tarball.add(path, arcname=filename)
         storage.delete_file(container, filename)
 
-    def _start_new_file(self, storage, container, typ, day_at_start, file_num):
-        filename = self._filename(typ, day_at_start, file_num)
+    def _start_new_file(self, storage, container, typ, day_at_start, file_num, kind="data"):
+        filename = self._filename(typ, day_at_start, file_num, kind)
         output_file = storage.path(container, filename, create_container=True, must_exist=False)
         dn = os.path.dirname(output_file)
         if not os.path.exists(dn):
@@ -164,11 +373,8 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
         out_file.write("[")
         return out_file, output_file, filename
 
-    def _filename(self, typ, day_at_start, file_num):
-        return os.path.join("doaj_" + typ + "_data_" + day_at_start, "{typ}_batch_{file_num}.json".format(typ=typ, file_num=file_num))
-
-    def _tarball_name(self, typ, day_at_start):
-        return "doaj_" + typ + "_data_" + day_at_start + ".tar.gz"
+    def _filename(self, typ, day_at_start, file_num, kind="data"):
+        return os.path.join("doaj_" + typ + "_" + kind + "_" + day_at_start, "{typ}_batch_{file_num}.json".format(typ=typ, file_num=file_num))
 
     def _copy_on_complete(self, mainStore, tmpStore, container, zipped_path):
         zipped_size = os.path.getsize(zipped_path)
@@ -178,29 +384,36 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
         tmpStore.delete_file(container, zipped_name)
         return zipped_size
 
-    def _prune_container(self, mainStore, container, day_at_start, types):
-        # Delete all files and dirs in the container that does not contain today's date
-        files_for_today = []
+    def _files_to_keep(self, types, filenames, increments):
+        keep = []
         for typ in types:
-            files_for_today.append(self._tarball_name(typ, day_at_start))
+            keep.append(filenames[typ])
+            if increments[typ] is not None:
+                keep.append(increments[typ]["manifest"])
+                if increments[typ]["delta"] is not None:
+                    keep.append(increments[typ]["delta"]["filename"])
+        return keep
+
+    def _prune_container(self, mainStore, container, files_to_keep):
+        # Delete all files and dirs in the container that are not part of the current dump
 
         # get the files in storage
         container_files = mainStore.list(container)
 
-        # only delete if today's files exist
+        # only delete if the current files exist
         found = 0
-        for fn in files_for_today:
+        for fn in files_to_keep:
             if fn in container_files:
                 found += 1
 
-        # only proceed if the files for today are present
-        if found != len(files_for_today):
-            self.background_job.add_audit_message("Files not pruned. One of {0} is missing".format(",".join(files_for_today)))
+        # only proceed if the current files are present
+        if found != len(files_to_keep):
+            self.background_job.add_audit_message("Files not pruned. One of {0} is missing".format(",".join(files_to_keep)))
             return
 
-        # go through the container files and remove any that are not today's files
+        # go through the container files and remove any that are not current files
         for container_file in container_files:
-            if container_file not in files_for_today:
+            if container_file not in files_to_keep:
                 self.background_job.add_audit_message("Pruning old file {x} from storage container {y}".format(x=container_file, y=container))
                 mainStore.delete_file(container, container_file)
 
@@ -224,6 +437,8 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
         cls.set_param(params, 'clean', False if "clean" not in kwargs else kwargs["clean"] if kwargs["clean"] is not None else False)
         cls.set_param(params, "prune", False if "prune" not in kwargs else kwargs["prune"] if kwargs["prune"] is not None else False)
         cls.set_param(params, "types", "all" if "types" not in kwargs else kwargs["types"] if kwargs["types"] in ["all", "journal", "article"] else "all")
+        cls.set_param(params, "slices", kwargs.get("slices") or app.config.get("PUBLIC_DATA_DUMP_SLICES", 1))
+        cls.set_param(params, "incremental", kwargs.get("incremental", False) is True)
 
         container = app.config.get("STORE_PUBLIC_DATA_DUMP_CONTAINER")
         if container is None:
@@ -247,13 +462,115 @@ class PublicDataDumpBackgroundTask(BackgroundTask):
         public_data_dump.schedule(args=(background_job.id,), delay=10)
 
 
+def export_slice(typ, slice_id, slice_max, out_dir, page_size, records_per_file, ids_dir=None):
+    """
+    Export one slice of a sliced scroll over the public records of the given type to json batch files.  If
+    ids_dir is given, the ids of the records in each batch file are also written, sorted, to a file there.
+
+    This runs in a worker process started by PublicDataDumpBackgroundTask._export_sliced, so must be a module
+    level function.
+
+    :return: tuple of the paths of the batch files written, in order, and the paths of the id files
+    """
+    paths = []
+    id_paths = []
+    ids = []
+    out_file = None
+    count = 0
+    for result in DiscoveryApi.scroll(typ, None, None, page_size, scan=True, slice_id=slice_id, slice_max=slice_max):
+        if ids_dir is not None:
+            ids.append(result["id"])
+        if out_file is None:
+            path = os.path.join(out_dir, "{typ}_slice_{s}_{n}.json".format(typ=typ, s=slice_id, n=len(paths) + 1))
+            paths.append(path)
+            out_file = open(path, "w", encoding="utf-8")
+            out_file.write("[")
+        else:
+            out_file.write(",\n")
+        out_file.write(json.dumps(result))
+        count += 1
+
+        if count >= records_per_file:
+            out_file.write("]")
+            out_file.close()
+            out_file = None
+            count = 0
+            if ids_dir is not None:
+                id_paths.append(write_ids(ids, os.path.join(ids_dir, "ids_slice_{s}_{n}.txt".format(s=slice_id, n=len(paths)))))
+                ids = []
+
+    if out_file is not None:
+        out_file.write("]")
+        out_file.close()
+        if ids_dir is not None:
+            id_paths.append(write_ids(ids, os.path.join(ids_dir, "ids_slice_{s}_{n}.txt".format(s=slice_id, n=len(paths)))))
+
+    return paths, id_paths
+
+
+def write_ids(ids, path):
+    """
+    Write the ids to a text file in sorted order, one per line
+
+    :return: the path of the file
+    """
+    with open(path, "w", encoding="utf-8") as out_file:
+        for id in sorted(ids):
+            out_file.write(id + "\n")
+    return path
+
+
+def merge_ids(paths):
+    """
+    Iterate over the ids in the files written by write_ids, in sorted order.  Only one line of each file is held
+    in memory at a time.
+    """
+    files = [open(path, "r", encoding="utf-8") for path in paths]
+    try:
+        for line in heapq.merge(*files):
+            yield line.rstrip("\n")
+    finally:
+        for f in files:
+            f.close()
+
+
+def public_ids(typ, page_size=1000):
+    """
+    Iterate over the ids of all the public records of the given type, in id order
+    """
+    klazz = models.lookup_model(typ)
+    q = {
+        "query": {"bool": {"filter": [{"term": {"admin.in_doaj": True}}]}},
+        "_source": ["id"],
+        "sort": [{"id.exact": {"order": "asc"}}]
+    }
+    for record in klazz.iterate(q, page_size=page_size, wrap=False, keepalive="10m"):
+        yield record["id"]
+
+
+def deleted_ids(previous, current):
+    """
+    Compare two iterables of ids, both in the same sorted order, and yield the ids which are in the
+    previous one but not the current one.  Neither list is held in memory.
+    """
+    current = iter(current)
+    sentinel = object()
+    cur = next(current, sentinel)
+    for prev in previous:
+        while cur is not sentinel and cur < prev:
+            cur = next(current, sentinel)
+        if cur is sentinel or cur != prev:
+            yield prev
+
+
 huey_helper = PublicDataDumpBackgroundTask.create_huey_helper(long_running)
 
 
 @huey_helper.register_schedule
 def scheduled_public_data_dump():
     user = app.config.get("SYSTEM_USERNAME")
-    job = PublicDataDumpBackgroundTask.prepare(user, clean=False, prune=True, types="all")
+    job = PublicDataDumpBackgroundTask.prepare(user, clean=False, prune=True, types="all",
+                                               incremental=app.config.get("PUBLIC_DATA_DUMP_INCREMENTAL", False))
     PublicDataDumpBackgroundTask.submit(job)
 
 
@@ -18,10 +18,12 @@ class SitemapBackgroundTask(BackgroundTask):
         :return:
         """
         job = self.background_job
+        params = job.params or {}
 
         # ~~-> Sitemap:Feature~~
         siteService = DOAJ.siteService()
-        url, action_register = siteService.sitemap()
+        url, action_register = siteService.sitemap(include_articles=self.get_param(params, "include_articles"),
+                                                   incremental=self.get_param(params, "incremental", False))
         for ar in action_register:
             job.add_audit_message(ar)
         job.add_audit_message("Sitemap generated; will be served from {y}".format(y=url))
@@ -47,9 +49,14 @@ class SitemapBackgroundTask(BackgroundTask):
         if base_url is None:
             raise BackgroundException("BASE_URL must be set in configuration before we can generate a sitemap")
 
+        params = {}
+        cls.set_param(params, "include_articles", kwargs.get("include_articles", app.config.get("SITEMAP_INCLUDE_ARTICLES", False)))
+        cls.set_param(params, "incremental", kwargs.get("incremental", app.config.get("SITEMAP_INCREMENTAL", False)))
+
         # first prepare a job record
         job = background_helper.create_job(username, cls.__action__,
-                                           queue_id=huey_helper.queue_id, )
+                                           queue_id=huey_helper.queue_id,
+                                           params=params)
         return job
 
     @classmethod
@@ -60,6 +60,21 @@ def notification_seen(notification_id):
     return resp
 
 
+@blueprint.route("/notifications/seen", methods=["POST"])
+@login_required
+@ssl_required
+@jsonp
+def notifications_all_seen():
+    # ~~-> Notifications:Service
+    svc = DOAJ.notificationsService()
+    count = svc.mark_all_as_seen(current_user._get_current_object(), background=False)
+
+    data = json.dumps({"result" : True, "count" : count})
+    resp = make_response(data)
+    resp.mimetype = "application/json"
+    return resp
+
+
 @blueprint.route("/notifications")
 @login_required
 @ssl_required
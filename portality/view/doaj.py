@@ -190,6 +190,20 @@ def sitemap():
     return redirect(sitemap_url, code=307)
 
 
+@blueprint.route("/sitemap_part__<name>")
+def sitemap_part(name):
+    # the individual files listed in the sitemap index.  These are served from the site root, as a sitemap may
+    # only list urls which are under the path it is served from
+    filename = "sitemap_part__" + name
+    main_store = store.StoreFactory.get("cache")
+    part_url = main_store.url(app.config.get("STORE_CACHE_CONTAINER"), filename)
+    if part_url is None:
+        abort(404)
+    if part_url.startswith("/"):
+        part_url = "/store" + part_url
+    return redirect(part_url, code=307)
+
+
 @blueprint.route("/public-data-dump/<record_type>")
 @api_key_required
 @plausible.pa_event(app.config.get('GA_CATEGORY_PUBLICDATADUMP', 'PublicDataDump'),
@@ -202,9 +216,28 @@ def public_data_dump_redirect(record_type):
     if target_data is None:
         abort(404)
 
+    return _public_data_dump_store_redirect(target_data.get("container"), target_data.get("filename"))
+
+
+@blueprint.route("/public-data-dump/<record_type>/delta")
+@api_key_required
+@plausible.pa_event(app.config.get('GA_CATEGORY_PUBLICDATADUMP', 'PublicDataDump'),
+                    action=app.config.get('GA_ACTION_PUBLICDATADUMP', 'Download'))
+def public_data_dump_delta_redirect(record_type):
+    if not current_user.has_role(constants.ROLE_PUBLIC_DATA_DUMP):
+        abort(404)
+
+    target_data = models.Cache.get_public_data_dump().get(record_type, {})
+    if target_data is None or target_data.get("delta") is None:
+        abort(404)
+
+    return _public_data_dump_store_redirect(target_data.get("container"), target_data["delta"].get("filename"))
+
+
+def _public_data_dump_store_redirect(container, filename):
     main_store = store.StoreFactory.get(constants.STORE__SCOPE__PUBLIC_DATA_DUMP)
-    store_url = main_store.temporary_url(target_data.get("container"),
-                                         target_data.get("filename"),
+    store_url = main_store.temporary_url(container,
+                                         filename,
                                          timeout=app.config.get("PUBLIC_DATA_DUMP_URL_TIMEOUT", 3600))
 
     if store_url.startswith("/"):
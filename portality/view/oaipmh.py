@@ -1,10 +1,10 @@
-import json, base64
+import json, base64, itertools
 from lxml import etree
 from datetime import datetime, timedelta
 from flask import Blueprint, request, make_response
 from portality.core import app
 from portality.lib.dates import FMT_DATETIME_STD, DEFAULT_TIMESTAMP_VAL, FMT_DATE_STD
-from portality.models import OAIPMHJournal, OAIPMHArticle
+from portality.models import OAIPMHJournal, OAIPMHArticle, OAIPMHRenderedRecord
 from portality.lib import plausible, dates
 from portality.crosswalks.oaipmh import CROSSWALKS, make_set_spec, make_oai_identifier
 
@@ -142,21 +142,8 @@ def decode_set_spec(setspec):
     return decoded
 
 
-def get_start_after(docs, current_start_after, list_size):
-    last_date = docs[-1].get("last_updated")
-    count = 0
-    for doc in docs:
-        if doc.get("last_updated") == last_date:
-            count += 1
-    if count == list_size and current_start_after is not None and last_date == current_start_after[0]:
-        # If the current set of records have the same date as last record served previously,
-        #   the count has to be greater than the list of records
-        #   and include the previous count
-        count += current_start_after[1]
-    return (last_date, count)
-
-
-def make_resumption_token(metadata_prefix=None, from_date=None, until_date=None, oai_set=None, start_number=None, start_after=None):
+def make_resumption_token(metadata_prefix=None, from_date=None, until_date=None, oai_set=None, start_number=None, start_after=None,
+                          search_after=None, complete_list_size=None):
     d = {}
     if metadata_prefix is not None:
         d["m"] = metadata_prefix
@@ -170,6 +157,10 @@ def make_resumption_token(metadata_prefix=None, from_date=None, until_date=None,
         d["n"] = start_number
     if start_after is not None:
         d["a"] = start_after
+    if search_after is not None:
+        d["k"] = search_after
+    if complete_list_size is not None:
+        d["t"] = complete_list_size
     j = json.dumps(d)
     b = base64.urlsafe_b64encode(j.encode('utf-8'))
     return b
@@ -202,6 +193,8 @@ def decode_resumption_token(resumption_token):
     if "s" in d: params["oai_set"] = d.get("s")
     if "n" in d: params["start_number"] = d.get("n")
     if "a" in d: params["start_after"] = tuple(d.get("a"))
+    if "k" in d: params["search_after"] = d.get("k")
+    if "t" in d: params["complete_list_size"] = d.get("t")
     return params
 
 
@@ -327,7 +320,8 @@ def list_identifiers(dao, base_url, specified_oai_endpoint, metadata_prefix=None
         return _resume_list_identifiers(dao, base_url, specified_oai_endpoint, resumption_token=resumption_token)
 
 
-def _parameterised_list(identifiers_or_records, dao, base_url, specified_oai_endpoint, metadata_prefix=None, from_date=None, until_date=None, oai_set=None, start_number=0, start_after=None):
+def _parameterised_list(identifiers_or_records, dao, base_url, specified_oai_endpoint, metadata_prefix=None, from_date=None, until_date=None, oai_set=None, start_number=0, start_after=None,
+                        search_after=None, complete_list_size=None):
     # metadata prefix is required
     if metadata_prefix is None:
         return BadArgument(base_url)
@@ -360,20 +354,24 @@ def _parameterised_list(identifiers_or_records, dao, base_url, specified_oai_end
     for f in formats:
         if f.get("metadataPrefix") == metadata_prefix:
             # do the query and set up the response object
-            total, results = dao.list_records(from_date, until_date, decoded_set, list_size, start_after)
+            total, results, next_search_after = dao.list_records(from_date, until_date, decoded_set, list_size,
+                                                                 start_after, search_after=search_after)
 
             # if there are no results, PMH requires us to throw an error
             if len(results) == 0:
                 return NoRecordsMatch(base_url)
 
             # Get the full total
-            # Each search with a resumption token is a new search,
-            #   so the total is not the same as the first search
-            #   but is reduced by number of records already served.
-            # This full_total is the total as in the first search
-            full_total = total
-            if start_after is not None:
+            # Each search with a resumption token is a new search, which is not counted again, so the
+            #   token carries the total from the first search.
+            # Tokens from before this was the case carry the position after the last record served instead, and
+            #   the total is reduced by the number of records already served.
+            if complete_list_size is not None:
+                full_total = complete_list_size
+            elif start_after is not None:
                 full_total = total + start_number - start_after[1]
+            else:
+                full_total = total
 
             # Determine where our next starting index will be
             new_start = start_number + len(results)
@@ -382,15 +380,16 @@ def _parameterised_list(identifiers_or_records, dao, base_url, specified_oai_end
             # - None -> do not include the rt in the response if we have a full result set
             # - the empty string -> include in the response if this is the last set of results from an incomplete list
             # - some value -> include in the response if there are more values to retrieve
-            if len(results) == full_total:
+            # The next page is selected with search_after from the sort key of the last record we serve here,
+            #   so records added to the top of the list during a harvest don't shift the pages.
+            if next_search_after is None and start_number == 0:
                 resumption_token = None
-            elif new_start == full_total:
+            elif next_search_after is None:
                 resumption_token = ''
             else:
-                new_start_after = get_start_after(results, start_after, list_size)
                 resumption_token = make_resumption_token(metadata_prefix=metadata_prefix, from_date=from_date,
                                                          until_date=until_date, oai_set=oai_set, start_number=new_start,
-                                                         start_after=new_start_after)
+                                                         search_after=next_search_after, complete_list_size=full_total)
 
             # Get our list of results for this request
             if identifiers_or_records == 'identifiers':
@@ -404,9 +403,16 @@ def _parameterised_list(identifiers_or_records, dao, base_url, specified_oai_end
                 expiry = app.config.get("OAIPMH_RESUMPTION_TOKEN_EXPIRY", -1)
                 lst.set_resumption(resumption_token, complete_list_size=full_total, cursor=new_start, expiry=expiry)
 
+            xwalk = get_crosswalk(f.get("metadataPrefix"), dao.__type__)
+            if identifiers_or_records == 'records' and app.config.get("OAIPMH_RECORD_CACHE", False):
+                # use the cached renderings of the records where they are up to date
+                # ~~->OAIPMHRenderedRecord:Model~~
+                for xml in OAIPMHRenderedRecord.render(xwalk, dao.__type__, metadata_prefix, results):
+                    lst.add_serialised_record(xml)
+                return lst
+
             for r in results:
                 # do the crosswalk
-                xwalk = get_crosswalk(f.get("metadataPrefix"), dao.__type__)
                 header = xwalk.header(r)
 
                 if identifiers_or_records == 'identifiers':
@@ -422,8 +428,10 @@ def _parameterised_list(identifiers_or_records, dao, base_url, specified_oai_end
     return CannotDisseminateFormat(base_url)
 
 
-def _parameterised_list_identifiers(dao, base_url, specified_oai_endpoint, metadata_prefix=None, from_date=None, until_date=None, oai_set=None, start_number=0, start_after=None):
-    return _parameterised_list('identifiers', dao, base_url, specified_oai_endpoint, metadata_prefix, from_date, until_date, oai_set, start_number, start_after)
+def _parameterised_list_identifiers(dao, base_url, specified_oai_endpoint, metadata_prefix=None, from_date=None, until_date=None, oai_set=None, start_number=0, start_after=None,
+                            search_after=None, complete_list_size=None):
+    return _parameterised_list('identifiers', dao, base_url, specified_oai_endpoint, metadata_prefix, from_date, until_date, oai_set, start_number, start_after,
+                               search_after, complete_list_size)
 
 
 def _resume_list_identifiers(dao, base_url, specified_oai_endpoint, resumption_token=None):
@@ -469,8 +477,10 @@ def list_records(dao, base_url, specified_oai_endpoint, metadata_prefix=None, fr
         return _resume_list_records(dao, base_url, specified_oai_endpoint, resumption_token=resumption_token)
 
 
-def _parameterised_list_records(dao, base_url, specified_oai_endpoint, metadata_prefix=None, from_date=None, until_date=None, oai_set=None, start_number=0, start_after=None):
-    return _parameterised_list('records', dao, base_url, specified_oai_endpoint, metadata_prefix, from_date, until_date, oai_set, start_number, start_after)
+def _parameterised_list_records(dao, base_url, specified_oai_endpoint, metadata_prefix=None, from_date=None, until_date=None, oai_set=None, start_number=0, start_after=None,
+                            search_after=None, complete_list_size=None):
+    return _parameterised_list('records', dao, base_url, specified_oai_endpoint, metadata_prefix, from_date, until_date, oai_set, start_number, start_after,
+                               search_after, complete_list_size)
 
 
 def _resume_list_records(dao, base_url, specified_oai_endpoint, resumption_token=None):
@@ -700,6 +710,9 @@ class ListMetadataFormats(OAI_PMH):
 
 
 class ListRecords(OAI_PMH):
+    RECORD_PLACEHOLDER_TEXT = " oai-pmh-record "
+    RECORD_PLACEHOLDER = b"<!--" + RECORD_PLACEHOLDER_TEXT.encode("utf-8") + b"-->"
+
     def __init__(self, base_url, from_date=None, until_date=None, oai_set=None, metadata_prefix=None):
         super(ListRecords, self).__init__(base_url)
         self.verb = "ListRecords"
@@ -721,6 +734,10 @@ class ListRecords(OAI_PMH):
     def add_record(self, metadata, header):
         self.records.append((metadata, header))
 
+    def add_serialised_record(self, record):
+        """ add a <record> which is already serialised, and which is copied into the response as it is """
+        self.records.append(record)
+
     def add_request_attributes(self, element):
         if self.from_date is not None:
             element.set("from", self.from_date)
@@ -731,10 +748,23 @@ class ListRecords(OAI_PMH):
         if self.metadata_prefix is not None:
             element.set("metadataPrefix", self.metadata_prefix)
 
+    def serialise(self):
+        # the serialised records are spliced into the response in place of their placeholders
+        xml = super(ListRecords, self).serialise()
+        serialised = [r for r in self.records if isinstance(r, bytes)]
+        if len(serialised) == 0:
+            return xml
+        parts = xml.split(self.RECORD_PLACEHOLDER, len(serialised))
+        return b"".join(itertools.chain.from_iterable(zip(parts, serialised + [b""])))
+
     def get_element(self):
         lr = etree.Element(self.PMH + "ListRecords", nsmap=self.NSMAP)
 
-        for metadata, header in self.records:
+        for record in self.records:
+            if isinstance(record, bytes):
+                lr.append(etree.Comment(self.RECORD_PLACEHOLDER_TEXT))
+                continue
+            metadata, header = record
             r = etree.SubElement(lr, self.PMH + "record")
             r.append(header)
             r.append(metadata)
@@ -4,6 +4,7 @@ from flask import Blueprint, request, abort, make_response
 from flask_login import current_user
 
 from portality import util
+from portality.core import app
 from portality.bll.doaj import DOAJ
 from portality.bll import exceptions
 
@@ -49,4 +50,7 @@ def query(path=None):
 
     resp = make_response(json.dumps(res))
     resp.mimetype = "application/json"
+    if app.config.get("QUERY_SERVER_TIMING", False):
+        resp.headers["Server-Timing"] = ", ".join(["{s};dur={d:.1f}".format(s=stage, d=secs * 1000)
+                                                   for stage, secs in queryService.timings.items()])
     return resp